@@ -0,0 +1,185 @@
+# End-to-end benchmarks against the in-process server of benchmarks.simulator: time until all
+# prefixes are confirmed, packets per second through the Handler and the CPU and memory cost of
+# a renewal cycle. Results are written as JSON and can be compared against an earlier baseline.
+# Run with: python -m benchmarks.end_to_end --output baseline.json [--baseline previous.json]
+import argparse
+import gc
+import json
+import logging
+import platform
+import random
+import time
+import tracemalloc
+import dhcprefix6.dhcp as dhcp
+import benchmarks.simulator as simulator
+
+# Upper bound of simulated time for a scenario, so that a broken client can not loop forever
+TIME_LIMIT = 24 * 3600
+
+
+def build_simulation(args, count):
+	simulation = simulator.Simulation(count, retry_time=args.retry_time)
+	server = simulation.server
+	(server.t1, server.t2, server.latency, server.loss) = args.t1, args.t2, args.latency, args.loss
+	server.preferred_lifetime = max(args.t2, server.preferred_lifetime)
+	server.valid_lifetime = max(server.preferred_lifetime, server.valid_lifetime)
+	return simulation
+
+
+def all_confirmed(simulation):
+	return simulation.count(dhcp.PrefixState.CONFIRMED) == len(simulation.virtual_interfaces)
+
+
+def time_to_confirm(args, count):
+	simulation = build_simulation(args, count)
+	started_at = simulation.clock.monotonic()
+
+	cpu_started = time.process_time()
+	simulation.start()
+	completed = simulation.run_until(lambda: all_confirmed(simulation), TIME_LIMIT)
+	cpu_time = time.process_time() - cpu_started
+
+	# Confirmation times of the individual virtual interfaces relative to the start
+	confirmed = sorted([confirmed_at - started_at for confirmed_at in simulation.table.confirmed_at
+		if confirmed_at == confirmed_at])
+	return {
+		'completed': completed,
+		'confirmed': len(confirmed),
+		'simulated_seconds': simulation.clock.monotonic() - started_at,
+		'p50_seconds': percentile(confirmed, 0.5),
+		'p99_seconds': percentile(confirmed, 0.99),
+		'cpu_seconds': cpu_time,
+		'cpu_us_per_prefix': cpu_time * 1e6 / count,
+		'server': simulation.server.stats()
+	}
+
+
+def renewal(args, count):
+	# Confirm all prefixes, then move to T1 and measure the timer run which sends all RENEW
+	# messages and the Handler processing all REPLY messages separately. The measured round
+	# is answered without latency or losses, so that every RENEW gets its REPLY at once.
+	simulation = build_simulation(args, count)
+	simulation.start()
+	if not simulation.run_until(lambda: all_confirmed(simulation), TIME_LIMIT):
+		raise AssertionError("Only %d of %d prefixes were confirmed" % (simulation.count(dhcp.PrefixState.CONFIRMED), count))
+
+	renew_at = max([viface.renew_at for viface in simulation.virtual_interfaces])
+	simulation.clock.advance(renew_at - simulation.clock.monotonic())
+	(simulation.server.latency, simulation.server.loss) = 0, 0
+
+	now = simulation.clock.monotonic()
+	started = time.perf_counter()
+	simulation.manager.process_due(simulation.scheduler.pop_due(now))
+	timer_time = time.perf_counter() - started
+
+	replies = simulation.server.pop_due(now)
+	started = time.perf_counter()
+	for (interface, reply) in replies:
+		simulation.handler.process(interface, reply)
+	handler_time = time.perf_counter() - started
+
+	if not all_confirmed(simulation):
+		raise AssertionError("Only %d of %d prefixes were renewed" % (simulation.count(dhcp.PrefixState.CONFIRMED), count))
+
+	return {
+		'renewed': len(replies),
+		'timer_seconds': timer_time,
+		'timer_us_per_prefix': timer_time * 1e6 / count,
+		'handler_seconds': handler_time,
+		'handler_packets_per_second': len(replies) / handler_time if handler_time > 0 else None
+	}
+
+
+def memory(args, count):
+	# Memory held by a client with all prefixes confirmed, measured separately because
+	# tracemalloc slows down every allocation
+	gc.collect()
+	tracemalloc.start()
+	simulation = build_simulation(args, count)
+	simulation.start()
+	simulation.run_until(lambda: all_confirmed(simulation), TIME_LIMIT)
+	(size, peak) = tracemalloc.get_traced_memory()
+	tracemalloc.stop()
+	return {
+		'bytes': size,
+		'peak_bytes': peak,
+		'bytes_per_prefix': float(size) / count
+	}
+
+
+def percentile(values, fraction):
+	if len(values) == 0:
+		return None
+	return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def compare(results, baseline, path=''):
+	# Relative change of every numeric result against the baseline
+	changes = []
+	for (key, value) in sorted(results.items()):
+		previous = baseline.get(key) if isinstance(baseline, dict) else None
+		name = "%s.%s" % (path, key) if path else key
+		if isinstance(value, dict):
+			changes.extend(compare(value, previous, name))
+		elif isinstance(value, (int, float)) and not isinstance(value, bool) and \
+				isinstance(previous, (int, float)) and not isinstance(previous, bool) and previous != 0:
+			changes.append((name, previous, value, float(value) / previous - 1))
+	return changes
+
+
+def main():
+	parser = argparse.ArgumentParser(description='End-to-end benchmark against a simulated DHCPv6-PD server')
+	parser.add_argument('--counts', type=int, nargs='+', default=[10, 1000, 10000], help='amounts of prefixes')
+	parser.add_argument('--latency', type=float, default=0.001, help='server reply latency in seconds')
+	parser.add_argument('--loss', type=float, default=0.0, help='probability of a lost client message')
+	parser.add_argument('--t1', type=int, default=1800, help='T1 sent by the server')
+	parser.add_argument('--t2', type=int, default=2880, help='T2 sent by the server')
+	parser.add_argument('--retry-time', type=int, default=60, help='maximum retransmission timeout')
+	parser.add_argument('--seed', type=int, default=1, help='seed for transaction ids, jitter and losses')
+	parser.add_argument('--no-memory', action='store_true', help='skip the tracemalloc scenario')
+	parser.add_argument('--output', help='write results as JSON to this path')
+	parser.add_argument('--baseline', help='compare results against an earlier JSON output')
+	args = parser.parse_args()
+
+	# The client would otherwise log every single message
+	logging.basicConfig(level=logging.WARNING, format='%(message)s')
+
+	results = {}
+	for count in args.counts:
+		random.seed(args.seed)
+		scenario = {'time_to_confirm': time_to_confirm(args, count), 'renewal': renewal(args, count)}
+		if not args.no_memory:
+			scenario['memory'] = memory(args, count)
+		results[str(count)] = scenario
+
+		confirm = scenario['time_to_confirm']
+		renew = scenario['renewal']
+		print("%6d prefixes: confirmed %d in %.2fs simulated (p99 %.2fs), %.1f us CPU/prefix, "
+			"renewal %.1f us/prefix, handler %.0f packets/s" % (count, confirm['confirmed'], confirm['simulated_seconds'],
+			confirm['p99_seconds'] or 0, confirm['cpu_us_per_prefix'], renew['timer_us_per_prefix'],
+			renew['handler_packets_per_second'] or 0))
+
+	output = {
+		'environment': {
+			'python': platform.python_version(),
+			'implementation': platform.python_implementation(),
+			'machine': platform.machine()
+		},
+		'parameters': dict([(key, value) for (key, value) in vars(args).items() if key not in ['output', 'baseline']]),
+		'results': results
+	}
+
+	if args.output is not None:
+		with open(args.output, 'w') as output_file:
+			json.dump(output, output_file, indent=2, sort_keys=True)
+
+	if args.baseline is not None:
+		with open(args.baseline, 'r') as baseline_file:
+			baseline = json.load(baseline_file)
+		print("%-60s %14s %14s %8s" % ('result', 'baseline', 'current', 'change'))
+		for (name, previous, value, change) in compare(results, baseline.get('results', {})):
+			print("%-60s %14.4g %14.4g %+7.1f%%" % (name, previous, value, change * 100))
+
+
+if __name__ == '__main__':
+	main()
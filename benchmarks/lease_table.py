@@ -0,0 +1,114 @@
+# Compares the memory usage of virtual interfaces stored as one Python object each and as views
+# onto a LeaseTable. Run with: python -m benchmarks.lease_table
+import argparse
+import gc
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+import dhcprefix6.leasetable as leasetable
+import dhcprefix6.types as types
+
+# Same value as dhcp.PrefixState.CONFIRMED
+CONFIRMED = 4
+
+
+class ObjectLease(object):
+	# Attribute layout of a virtual interface before it became a view onto the lease table,
+	# with wall-clock datetimes and timedeltas relative to the last confirmation
+	def __init__(self, iaid, client_duid, prefixes, physical):
+		self._state = 0
+		self.last_action = None
+		self.last_confirm = None
+		self.transaction_id = None
+		self.exchange = None
+		self.tx_reserved = False
+		self._server_duid = None
+		self._templates = {}
+		self.t1 = None
+		self.t2 = None
+		self.expire = None
+		self._state_index = None
+		self._logger = None
+		self.iaid = types.InterfaceID(iaid)
+		self.client_duid = client_duid
+		self.prefixes = list(prefixes)
+		self.physical = physical
+
+
+class TableLease(object):
+	# Row view with the same slots as dhcp.VirtualInterface
+	__slots__ = ('_table', '_row')
+
+	def __init__(self, table, iaid, client_duid, prefixes, physical):
+		self._table = table
+		self._row = table.add(self, iaid, client_duid, prefixes, physical)
+
+
+def client_duid(index):
+	return b'\x00\x03\x00\x01' + index.to_bytes(6, 'big')
+
+
+def build_objects(count, now):
+	leases = []
+	server_duid = types.Duid('00:01:00:01:00:00:00:00:00:01')
+	for index in range(count):
+		lease = ObjectLease(25000 + index, types.Duid(client_duid(index)), [], 'eth0')
+		if index % 2 == 0:
+			lease._state = CONFIRMED
+			lease._server_duid = server_duid
+			lease.transaction_id = index & 0xffffff
+			lease.t1 = timedelta(seconds=1800 + index % 3600)
+			lease.t2 = timedelta(seconds=2880 + index % 3600)
+			lease.expire = timedelta(seconds=4320 + index % 3600)
+			lease.last_confirm = now - timedelta(seconds=3600)
+			lease.last_action = lease.last_confirm
+		leases.append(lease)
+	return leases
+
+
+def build_table(count, monotonic_now):
+	table = leasetable.LeaseTable()
+	server_duid = types.Duid('00:01:00:01:00:00:00:00:00:01')
+	leases = []
+	for index in range(count):
+		lease = TableLease(table, 25000 + index, types.Duid(client_duid(index)), [], 'eth0')
+		if index % 2 == 0:
+			row = lease._row
+			table.states[row] = CONFIRMED
+			table.set_server_duid(row, server_duid)
+			table.transaction_ids[row] = index & 0xffffff
+			(table.t1[row], table.t2[row], table.expire[row]) = 1800 + index % 3600, 2880 + index % 3600, 4320 + index % 3600
+			table.confirmed_at[row] = table.action_at[row] = monotonic_now - 3600
+			table.renew_at[row] = table.confirmed_at[row] + table.t1[row]
+			table.rebind_at[row] = table.confirmed_at[row] + table.t2[row]
+			table.expire_at[row] = table.confirmed_at[row] + table.expire[row]
+		leases.append(lease)
+	return leases, table
+
+
+def measure_memory(build, *args):
+	gc.collect()
+	tracemalloc.start()
+	result = build(*args)
+	(size, _) = tracemalloc.get_traced_memory()
+	tracemalloc.stop()
+	return size, result
+
+
+def main():
+	parser = argparse.ArgumentParser(description='Lease table memory benchmark')
+	parser.add_argument('--count', type=int, default=100000, help='amount of virtual interfaces')
+	args = parser.parse_args()
+
+	(now, monotonic_now) = datetime.now(), time.monotonic()
+	(object_size, _) = measure_memory(build_objects, args.count, now)
+	(table_size, _) = measure_memory(build_table, args.count, monotonic_now)
+
+	print("Virtual interfaces: %d" % args.count)
+	print("%-8s %14s %14s" % ('layout', 'memory [MiB]', 'bytes/lease'))
+	for (name, size) in [('objects', object_size), ('table', table_size)]:
+		print("%-8s %14.1f %14.1f" % (name, size / 2.0 ** 20, float(size) / args.count))
+
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,304 @@
+# Replays ADVERTISE and REPLY messages from pcap or pcapng captures through Handler.process
+# and Manager.handle_packet without live interfaces or root. Virtual interfaces are derived from the
+# captured messages and put into the state the message answers before every packet, so that every
+# packet runs through the whole receive pipeline. Messages sent in response go to a sink.
+# Run with: python -m benchmarks.replay capture.pcapng [--loop N] [--duids N] [--output results.json]
+import argparse
+import ipaddress
+import json
+import logging
+import struct
+import sys
+import time
+import tracemalloc
+import zlib
+import dhcprefix6.clock as clocks
+import dhcprefix6.dhcp as dhcp
+import dhcprefix6.leasetable as leasetable
+import dhcprefix6.metrics as metrics
+import dhcprefix6.network as network
+import dhcprefix6.profiling as profiling
+import dhcprefix6.retransmission as retransmission
+import dhcprefix6.store as store
+import dhcprefix6.types as types
+import dhcprefix6.wire as wire
+import benchmarks.simulator as simulator
+
+LINKTYPE_ETHERNET = 1
+
+# Magic numbers of pcap files, in microsecond and nanosecond resolution
+PCAP_MAGIC = [0xa1b2c3d4, 0xa1b23c4d]
+
+# Block types of pcapng files
+PCAPNG_SECTION_HEADER = 0x0a0d0d0a
+PCAPNG_INTERFACE_DESCRIPTION = 1
+PCAPNG_SIMPLE_PACKET = 3
+PCAPNG_ENHANCED_PACKET = 6
+PCAPNG_BYTE_ORDER_MAGIC = 0x1a2b3c4d
+
+# State a virtual interface is put into before a message of the given type is replayed.
+# Captured replies are assumed to answer RENEW messages, which dominate on a running system.
+PRIMED_STATES = {
+	wire.ADVERTISE: (dhcp.PrefixState.SOLICITED, wire.SOLICIT),
+	wire.REPLY: (dhcp.PrefixState.RENEWING, wire.RENEW)
+}
+
+
+def read_frames(path):
+	# Ethernet frames of a pcap or pcapng file, frames of other link types are skipped
+	with open(path, 'rb') as capture_file:
+		data = capture_file.read()
+
+	if len(data) < 4:
+		raise ValueError("File is too short to be a capture: %s" % path)
+	if struct.unpack_from('<I', data)[0] == PCAPNG_SECTION_HEADER:
+		return list(_read_pcapng(data))
+	for endian in '<>':
+		if struct.unpack_from(endian + 'I', data)[0] in PCAP_MAGIC:
+			return list(_read_pcap(data, endian))
+	raise ValueError("Unknown capture format: %s" % path)
+
+
+def _read_pcap(data, endian):
+	(linktype,) = struct.unpack_from(endian + 'I', data, 20)
+	if linktype != LINKTYPE_ETHERNET:
+		raise ValueError("Unsupported link type %d, captures have to contain Ethernet frames" % linktype)
+
+	offset = 24
+	while offset + 16 <= len(data):
+		(caplen,) = struct.unpack_from(endian + 'I', data, offset + 8)
+		yield data[offset + 16:offset + 16 + caplen]
+		offset += 16 + caplen
+
+
+def _read_pcapng(data):
+	(endian, linktypes, snaplens) = '<', [], []
+	offset = 0
+	while offset + 12 <= len(data):
+		(block_type,) = struct.unpack_from(endian + 'I', data, offset)
+		if block_type == PCAPNG_SECTION_HEADER:
+			# Every section defines its own byte order and interfaces
+			endian = '<' if struct.unpack_from('<I', data, offset + 8)[0] == PCAPNG_BYTE_ORDER_MAGIC else '>'
+			(linktypes, snaplens) = [], []
+
+		(block_length,) = struct.unpack_from(endian + 'I', data, offset + 4)
+		if block_length < 12:
+			raise ValueError("Invalid pcapng block length %d at offset %d" % (block_length, offset))
+
+		if block_type == PCAPNG_INTERFACE_DESCRIPTION:
+			(linktype, snaplen) = struct.unpack_from(endian + 'H2xI', data, offset + 8)
+			linktypes.append(linktype)
+			snaplens.append(snaplen)
+		elif block_type == PCAPNG_ENHANCED_PACKET:
+			(interface, caplen) = struct.unpack_from(endian + 'I8xI', data, offset + 8)
+			if linktypes[interface] == LINKTYPE_ETHERNET:
+				yield data[offset + 28:offset + 28 + caplen]
+		elif block_type == PCAPNG_SIMPLE_PACKET:
+			(length,) = struct.unpack_from(endian + 'I', data, offset + 8)
+			if linktypes[0] == LINKTYPE_ETHERNET:
+				yield data[offset + 12:offset + 12 + min(length, snaplens[0] or length, block_length - 16)]
+
+		offset += block_length
+
+
+class Sink(object):
+	# Counts the messages the manager sends in response to replayed packets
+	def __init__(self):
+		self.frames = 0
+
+	def receive(self, interface, frame):
+		self.frames += 1
+
+
+class Replay(object):
+	def __init__(self, frames, duids=None, retry_time=60, logger=None):
+		self.logger = logger if logger is not None else logging.getLogger('dhcprefix6.replay')
+		self.sink = Sink()
+		self.skipped = 0
+
+		# Only messages from servers to clients can be replayed against the client
+		captured = []
+		for frame in frames:
+			message = wire.parse(frame)
+			if message is None or message.msg_type not in PRIMED_STATES or message.client_duid is None or \
+					not message.has_ia_pd() or len(message.prefixes) == 0:
+				self.skipped += 1
+				continue
+			captured.append((bytes(frame), message))
+		if len(captured) == 0:
+			raise ValueError('Capture does not contain any ADVERTISE or REPLY message with prefixes')
+
+		# Every captured client DUID is replayed as [duids / captured DUIDs] synthetic copies
+		originals = dict([(client_duid, index) for (index, client_duid)
+			in enumerate(dict.fromkeys([message.client_duid for (_, message) in captured]))])
+		copies = 1 if duids is None else max(1, -(-duids // len(originals)))
+		limit = len(originals) * copies if duids is None else duids
+
+		self.interfaces = dict()
+		self.prefixes = store.PrefixStore()
+		self.table = leasetable.LeaseTable(self.logger)
+		self.virtual_interfaces = dict()
+		self.frames = []
+		for copy in range(copies):
+			for (frame, message) in captured:
+				index = copy * len(originals) + originals[message.client_duid]
+				if index >= limit:
+					continue
+
+				client_duid = synthetic_duid(message.client_duid, copy)
+				viface = self.virtual_interfaces.get(client_duid)
+				if viface is None:
+					viface = self._add_virtual_interface(frame, message, client_duid)
+				self.frames.append((viface.physical, rewrite_duid(frame, message.client_duid, client_duid), viface,
+					message.msg_type, message.transaction_id))
+
+		self.clock = clocks.Clock()
+		self.manager = dhcp.Manager(list(self.virtual_interfaces.values()), retry_time, 1.5, self.logger, clock=self.clock)
+		self.handler = network.Handler(list(self.interfaces.values()), self.prefixes, self.manager, self.logger)
+
+	def _add_virtual_interface(self, frame, message, client_duid):
+		dst_mac = bytes(frame[0:6])
+		physical = self.interfaces.get(dst_mac)
+		if physical is None:
+			physical = self.interfaces[dst_mac] = simulator.SimulatedInterface("replay%d" % len(self.interfaces),
+				dst_mac, simulator.CLIENT_IP, self.sink)
+
+		prefixes = [self.prefixes.add(dhcp.Prefix(str(physical.name), client_duid, ipaddress.IPv6Address(prefix.address),
+			prefix.length)) for prefix in message.prefixes]
+		viface = dhcp.VirtualInterface(message.iaid, client_duid, prefixes, physical, table=self.table)
+		if message.server_duid is not None:
+			viface.server_duid = types.Duid(message.server_duid)
+		self.virtual_interfaces[client_duid] = viface
+		return viface
+
+	def prime(self, viface, msg_type, transaction_id):
+		# Put the virtual interface into the state in which it waits for the replayed message
+		(state, request_type) = PRIMED_STATES[msg_type]
+		now = self.clock.monotonic()
+		if viface.state != state:
+			viface.state = state
+		viface.exchange = retransmission.Exchange(request_type, now)
+		viface.exchange.transmitted(now)
+		self.manager.open_transaction(viface, transaction_id)
+
+	def run(self, loops, observe=None):
+		# Replay all frames [loops] times and return the time spent within the Handler
+		elapsed = 0.0
+		process = self.handler.process
+		for _ in range(loops):
+			for (interface, frame, viface, msg_type, transaction_id) in self.frames:
+				self.prime(viface, msg_type, transaction_id)
+				if observe is not None:
+					observe(interface, frame)
+					continue
+
+				started = time.perf_counter()
+				process(interface, frame)
+				elapsed += time.perf_counter() - started
+		return elapsed
+
+	def measure_allocations(self, loops):
+		# Peak of memory allocated while processing a single packet and memory retained in total
+		peaks = []
+
+		def observe(interface, frame):
+			(before, _) = tracemalloc.get_traced_memory()
+			tracemalloc.reset_peak()
+			self.handler.process(interface, frame)
+			peaks.append(tracemalloc.get_traced_memory()[1] - before)
+
+		tracemalloc.start()
+		(started, _) = tracemalloc.get_traced_memory()
+		self.run(loops, observe)
+		(retained, _) = tracemalloc.get_traced_memory()
+		tracemalloc.stop()
+		return {
+			'mean_peak_bytes_per_packet': float(sum(peaks)) / len(peaks),
+			'max_peak_bytes_per_packet': max(peaks),
+			'retained_bytes': retained - started
+		}
+
+
+def synthetic_duid(duid, copy):
+	# The first copy keeps the captured DUID, the others replace its last four bytes
+	if copy == 0:
+		return duid
+	tail = min(4, len(duid))
+	return duid[:-tail] + struct.pack('!I', zlib.crc32(duid + struct.pack('!I', copy)))[4 - tail:]
+
+
+def rewrite_duid(frame, original, client_duid):
+	if client_duid == original:
+		return frame
+	option = struct.pack('!HH', wire.OPTION_CLIENTID, len(original))
+	offset = frame.find(option + original) + len(option)
+	return frame[:offset] + client_duid + frame[offset + len(client_duid):]
+
+
+def dropped_packets():
+	return dict([(values[0], count) for (values, count) in metrics.DROPPED_PACKETS.collect().items()])
+
+
+def main():
+	parser = argparse.ArgumentParser(description='Replay captured DHCPv6 messages through the receive pipeline')
+	parser.add_argument('captures', nargs='+', help='pcap or pcapng files')
+	parser.add_argument('--loop', type=int, default=1, help='amount of times all frames are replayed')
+	parser.add_argument('--duids', type=int, help='scale the captured client DUIDs to this amount of synthetic ones')
+	parser.add_argument('--no-stages', action='store_true', help='skip the per-stage latency pass')
+	parser.add_argument('--no-allocations', action='store_true', help='skip the tracemalloc pass')
+	parser.add_argument('--output', help='write results as JSON to this path')
+	args = parser.parse_args()
+
+	logging.basicConfig(level=logging.WARNING, format='%(message)s')
+
+	frames = []
+	for path in args.captures:
+		frames.extend(read_frames(path))
+	replay = Replay(frames, args.duids)
+	packets = len(replay.frames) * args.loop
+	print("Replaying %d message(s) of %d client DUID(s) %d time(s), skipped %d frame(s)" %
+		(len(replay.frames), len(replay.virtual_interfaces), args.loop, replay.skipped))
+
+	dropped = dropped_packets()
+	elapsed = replay.run(args.loop)
+	results = {
+		'packets': packets,
+		'duids': len(replay.virtual_interfaces),
+		'seconds': elapsed,
+		'packets_per_second': packets / elapsed if elapsed > 0 else None,
+		'us_per_packet': elapsed * 1e6 / packets,
+		'sent': replay.sink.frames,
+		'dropped': dict([(reason, count - dropped.get(reason, 0)) for (reason, count) in dropped_packets().items()
+			if count != dropped.get(reason, 0)])
+	}
+	print("%d packets in %.3fs: %.0f packets/s, %.2f us/packet" % (packets, elapsed, results['packets_per_second'] or 0,
+		results['us_per_packet']))
+	for (reason, count) in sorted(results['dropped'].items()):
+		print("> Dropped (%s): %d" % (reason, count))
+
+	# Every call is timed in a separate pass, because timing all stages slows down the pipeline
+	if not args.no_stages:
+		profiling.PROFILER.start(1.0)
+		replay.run(args.loop)
+		profiling.PROFILER.stop()
+		results['stages'] = profiling.PROFILER.report()['stages']
+		print("%-40s %10s %12s %12s %12s" % ('stage', 'count', 'mean [us]', 'self [us]', 'max [us]'))
+		for (stack, stage) in sorted(results['stages'].items()):
+			print("%-40s %10d %12.2f %12.2f %12d" % (stack, stage['count'], stage['mean_us'],
+				float(stage['self_us']) / stage['count'], stage['max_us']))
+
+	if not args.no_allocations:
+		results['allocations'] = replay.measure_allocations(args.loop)
+		print("Allocations: %.0f bytes peak per packet (max %d), %d bytes retained" % (
+			results['allocations']['mean_peak_bytes_per_packet'], results['allocations']['max_peak_bytes_per_packet'],
+			results['allocations']['retained_bytes']))
+
+	if args.output is not None:
+		with open(args.output, 'w') as output_file:
+			json.dump({'captures': args.captures, 'loop': args.loop, 'results': results}, output_file,
+				indent=2, sort_keys=True)
+	return 0
+
+
+if __name__ == '__main__':
+	sys.exit(main())
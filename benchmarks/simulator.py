@@ -0,0 +1,196 @@
+# In-process delegating DHCPv6 server and a simulated client setup, which runs the real Manager
+# and Handler against a ManualClock. Simulated time only moves to the next deadline of the
+# manager or the next reply of the server, so hours of lease time take a few milliseconds.
+import heapq
+import ipaddress
+import itertools
+import logging
+import random
+import struct
+import dhcprefix6.clock as clocks
+import dhcprefix6.dhcp as dhcp
+import dhcprefix6.leasetable as leasetable
+import dhcprefix6.network as network
+import dhcprefix6.scheduler as schedulers
+import dhcprefix6.store as store
+import dhcprefix6.wire as wire
+
+CLIENT_MAC = '02:00:00:00:00:01'
+CLIENT_IP = 'fe80::1'
+SERVER_MAC = b'\x02\x00\x00\x00\x00\x02'
+SERVER_IP = ipaddress.IPv6Address('fe80::2').packed
+SERVER_DUID = b'\x00\x01\x00\x01\x00\x00\x00\x00' + SERVER_MAC
+
+# Prefixes are carved from this network with one prefix of PREFIX_LENGTH per client DUID
+PREFIX_BASE = ipaddress.IPv6Network('2001:db8::/32')
+PREFIX_LENGTH = 56
+
+# Server replies to every client message type
+REPLY_TYPES = {
+	wire.SOLICIT: wire.ADVERTISE,
+	wire.REQUEST: wire.REPLY,
+	wire.RENEW: wire.REPLY,
+	wire.REBIND: wire.REPLY
+}
+
+
+class FakeServer(object):
+	# Answers SOLICIT, REQUEST, RENEW and REBIND messages with all requested prefixes. Messages
+	# get lost with the given probability, replies are delivered [latency] seconds later.
+	def __init__(self, clock, t1=1800, t2=2880, preferred_lifetime=3600, valid_lifetime=7200, latency=0.001,
+			loss=0.0, seed=None):
+		self._clock = clock
+		(self.t1, self.t2) = t1, t2
+		(self.preferred_lifetime, self.valid_lifetime) = preferred_lifetime, valid_lifetime
+		(self.latency, self.loss) = latency, loss
+		self._random = random.Random(seed)
+		self._pending = []
+		self._sequence = itertools.count()
+
+		self.received = dict([(msg_type, 0) for msg_type in REPLY_TYPES])
+		self.lost = 0
+		self.sent = 0
+
+	def receive(self, interface, frame):
+		message = wire.parse(frame)
+		if message is None or message.msg_type not in REPLY_TYPES:
+			return
+
+		self.received[message.msg_type] += 1
+		if self.loss > 0 and self._random.random() < self.loss:
+			self.lost += 1
+			return
+
+		reply = build_reply(REPLY_TYPES[message.msg_type], frame, message, SERVER_DUID, self.t1, self.t2,
+			self.preferred_lifetime, self.valid_lifetime)
+		heapq.heappush(self._pending, (self._clock.monotonic() + self.latency, next(self._sequence), interface, reply))
+
+	def next_delivery(self):
+		return self._pending[0][0] if len(self._pending) > 0 else None
+
+	def pop_due(self, now):
+		due = []
+		while len(self._pending) > 0 and self._pending[0][0] <= now:
+			(_, _, interface, reply) = heapq.heappop(self._pending)
+			due.append((interface, reply))
+		self.sent += len(due)
+		return due
+
+	def stats(self):
+		return {
+			'received': dict([(wire.MESSAGE_TYPES[msg_type].lower(), count) for (msg_type, count) in self.received.items()]),
+			'lost': self.lost,
+			'sent': self.sent
+		}
+
+
+class SimulatedInterface(dhcp.Interface):
+	# Physical interface which hands every sent frame to the fake server instead of a socket
+	def __init__(self, name, mac, ip, server):
+		dhcp.Interface.__init__(self, name, mac, ip)
+		self._server = server
+
+	@staticmethod
+	def validate_iface_name(name):
+		pass
+
+	def _send_frames(self, frames):
+		for frame in frames:
+			self._server.receive(self, frame)
+		return 1
+
+
+class Simulation(object):
+	# Client with [count] virtual interfaces on a single simulated physical interface
+	def __init__(self, count, server=None, clock=None, retry_time=60, expire_time_multi=1.5, logger=None):
+		self.clock = clock if clock is not None else clocks.ManualClock()
+		self.server = server if server is not None else FakeServer(self.clock)
+		self.logger = logger if logger is not None else logging.getLogger('dhcprefix6.simulation')
+
+		self.interface = SimulatedInterface('sim0', CLIENT_MAC, CLIENT_IP, self.server)
+		self.prefixes = store.PrefixStore()
+		self.table = leasetable.LeaseTable(self.logger)
+		self.virtual_interfaces = []
+		for index in range(count):
+			prefix = self.prefixes.add(dhcp.Prefix('sim0', client_duid(index), prefix_address(index), PREFIX_LENGTH))
+			self.virtual_interfaces.append(dhcp.VirtualInterface(index + 1, prefix.duid, [prefix], self.interface,
+				table=self.table))
+
+		self.scheduler = schedulers.Scheduler(self.clock)
+		self.manager = dhcp.Manager(self.virtual_interfaces, retry_time, expire_time_multi, self.logger,
+			scheduler=self.scheduler, clock=self.clock)
+		self.handler = network.Handler([self.interface], self.prefixes, self.manager, self.logger)
+
+	def start(self):
+		self.manager.start_scheduling()
+
+	def count(self, state):
+		return self.manager.stats()[state]
+
+	def next_event(self):
+		deadlines = [deadline for deadline in [self.scheduler.next_deadline(), self.server.next_delivery()]
+			if deadline is not None]
+		return min(deadlines) if len(deadlines) > 0 else None
+
+	def step(self):
+		# Move to the next event and process all timers and replies which are due by then.
+		# Returns False if nothing is scheduled anymore.
+		deadline = self.next_event()
+		if deadline is None:
+			return False
+		if deadline > self.clock.monotonic():
+			self.clock.advance(deadline - self.clock.monotonic())
+
+		now = self.clock.monotonic()
+		self.manager.process_due(self.scheduler.pop_due(now))
+		for (interface, reply) in self.server.pop_due(now):
+			self.handler.process(interface, reply)
+		return True
+
+	def run_until(self, predicate, limit):
+		# Step until the predicate holds or simulated time would pass [limit] seconds from now
+		stop_at = self.clock.monotonic() + limit
+		while not predicate():
+			deadline = self.next_event()
+			if deadline is None or deadline > stop_at:
+				return False
+			self.step()
+		return True
+
+	def run_for(self, seconds):
+		stop_at = self.clock.monotonic() + seconds
+		while True:
+			deadline = self.next_event()
+			if deadline is None or deadline > stop_at:
+				break
+			self.step()
+		self.clock.advance(max(0, stop_at - self.clock.monotonic()))
+
+
+def client_duid(index):
+	# DUID-LL with a locally administered mac address derived from the index
+	return b'\x00\x03\x00\x01\x02' + index.to_bytes(5, 'big')
+
+
+def prefix_address(index):
+	return ipaddress.IPv6Address(int(PREFIX_BASE.network_address) + (index << (128 - PREFIX_LENGTH)))
+
+
+def build_reply(msg_type, request, message, server_duid, t1, t2, preferred_lifetime, valid_lifetime):
+	# ADVERTISE or REPLY message to the sender of an untagged request frame, containing all
+	# requested prefixes. The UDP checksum is left at zero, the receive path does not verify it.
+	ia_prefixes = b''.join([_option(wire.OPTION_IAPREFIX, struct.pack('!IIB', preferred_lifetime, valid_lifetime,
+		prefix.length) + prefix.address) for prefix in message.prefixes])
+	options = _option(wire.OPTION_CLIENTID, message.client_duid) + _option(wire.OPTION_SERVERID, server_duid)
+	options += _option(wire.OPTION_IA_PD, struct.pack('!III', message.iaid, t1, t2) + ia_prefixes)
+	payload = struct.pack('!I', (msg_type << 24) | message.transaction_id) + options
+
+	udp_length = 8 + len(payload)
+	frame = bytes(request[6:12]) + SERVER_MAC + struct.pack('!H', wire.ETHERTYPE_IPV6)
+	frame += struct.pack('!IHBB', 6 << 28, udp_length, wire.IPPROTO_UDP, wire.HOP_LIMIT) + SERVER_IP + bytes(request[22:38])
+	frame += struct.pack('!HHHH', wire.SERVER_PORT, wire.CLIENT_PORT, udp_length, 0)
+	return frame + payload
+
+
+def _option(code, data):
+	return struct.pack('!HH', code, len(data)) + data
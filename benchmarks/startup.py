@@ -0,0 +1,92 @@
+# Compares the startup cost of importing scapy at module level and querying every interface with
+# scapy against lazy imports and one rtnetlink dump shared by all interfaces. Interface names are
+# cycled over the existing links, so no root is required to simulate 100+ configured interfaces;
+# create dummy links (ip link add dummy[X] type dummy) to benchmark with distinct ones.
+# Run with: python -m benchmarks.startup [--interfaces 128] [--output results.json]
+import argparse
+import json
+import subprocess
+import sys
+import time
+import dhcprefix6.dhcp as dhcp
+import dhcprefix6.netlink as netlink
+
+# Modules which were imported by dhcp.py and network.py before scapy was imported lazily
+SCAPY_MODULES = ['scapy.arch', 'scapy.packet', 'scapy.sendrecv']
+
+
+def import_time(modules):
+	# Import time in a fresh interpreter, so that nothing is cached in sys.modules
+	code = "import time\nstarted = time.perf_counter()\n%s\nprint(time.perf_counter() - started)" % \
+		'\n'.join(["import %s" % module for module in modules])
+	result = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True)
+	if result.returncode != 0:
+		return None
+	return float(result.stdout.strip().splitlines()[-1])
+
+
+def discover_scapy(names):
+	from scapy.arch import get_if_hwaddr, get_if_list, in6_getifaddr
+	for name in names:
+		if name not in get_if_list():
+			raise EnvironmentError("Could not find interface %s" % name)
+		get_if_hwaddr(name)
+		[addr for (addr, _, iface) in in6_getifaddr() if iface == name and addr.startswith('fe80::')]
+
+
+def discover_netlink(names):
+	netlink.invalidate()
+	for name in names:
+		dhcp.Interface.validate_iface_name(name)
+		dhcp.Interface.get_iface_mac(name)
+		dhcp.Interface.get_iface_lladdr(name)
+
+
+def measure(function, *args):
+	started = time.perf_counter()
+	try:
+		function(*args)
+	except ImportError:
+		return None
+	return time.perf_counter() - started
+
+
+def main():
+	parser = argparse.ArgumentParser(description='Startup time of module imports and interface discovery')
+	parser.add_argument('--interfaces', type=int, default=128, help='amount of configured interfaces')
+	parser.add_argument('--output', help='write results as JSON to this path')
+	args = parser.parse_args()
+
+	links = netlink.get_links()
+	if links is None:
+		raise SystemExit('rtnetlink is not available on this system')
+	names = sorted(links)
+	names = [names[index % len(names)] for index in range(args.interfaces)]
+
+	results = {
+		'interfaces': args.interfaces,
+		'import_seconds': {
+			'lazy': import_time(['dhcprefix6.core']),
+			'scapy': import_time(['dhcprefix6.core'] + SCAPY_MODULES)
+		},
+		'discovery_seconds': {
+			'netlink': measure(discover_netlink, names),
+			'scapy': measure(discover_scapy, names)
+		}
+	}
+
+	print("Configured interfaces: %d (cycled over %d link(s))" % (args.interfaces, len(links)))
+	print("%-32s %14s %14s" % ('', 'lazy/netlink', 'scapy'))
+	for (name, key, lazy, scapy) in [('Import [ms]', 'import_seconds', 'lazy', 'scapy'),
+			('Interface discovery [ms]', 'discovery_seconds', 'netlink', 'scapy')]:
+		values = [results[key][lazy], results[key][scapy]]
+		print("%-32s %14s %14s" % tuple([name] + ['%.1f' % (value * 1000) if value is not None else 'n/a'
+			for value in values]))
+
+	if args.output is not None:
+		with open(args.output, 'w') as output_file:
+			json.dump(results, output_file, indent=2, sort_keys=True)
+
+
+if __name__ == '__main__':
+	main()
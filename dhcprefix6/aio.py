@@ -0,0 +1,87 @@
+import asyncio
+import dhcprefix6.dhcp as dhcp
+import dhcprefix6.network as network
+import dhcprefix6.scheduler as scheduler
+
+
+class AsyncRuntime(object):
+	# Runs packet capture, packet handling and all state transitions on a single event loop.
+	# Receive rings are registered with loop.add_reader, deadlines become loop.call_at timers.
+	STARTUP_DELAY = 1
+
+	def __init__(self, interfaces, prefixes, virtual_interfaces, retry_time, expire_time_multi, logger, journal=None,
+			queue_size=1024, drop_policy=network.WorkQueue.DROP_OLDEST):
+		self._loop = asyncio.new_event_loop()
+		self._interfaces = interfaces
+		self._logger = logger
+		self._rings = []
+		self._listeners = []
+		self._kill_received = False
+
+		self._scheduler = scheduler.LoopScheduler(self._loop)
+		self.manager = dhcp.Manager(
+			virtual_interfaces=virtual_interfaces,
+			retry_time=retry_time,
+			expire_time_multi=expire_time_multi,
+			logger=logger,
+			scheduler=self._scheduler,
+			journal=journal
+		)
+		self._scheduler.callback = self.manager.process_due
+		self.handler = network.Handler(interfaces, prefixes, self.manager, logger, queue_size, drop_policy)
+
+	@property
+	def kill_received(self):
+		return self._kill_received
+
+	@kill_received.setter
+	def kill_received(self, value):
+		self._kill_received = value
+		if value:
+			self._loop.call_soon_threadsafe(self._loop.stop)
+
+	def start(self):
+		for interface in self._interfaces.raw():
+			try:
+				ring = network.RingSocket(interface)
+			except (AttributeError, OSError) as e:
+				# Capture with scapy in a separate thread and pass packets over to the loop
+				self._logger.warning("Could not setup receive ring on interface %s: %s" % (interface, e))
+				self._logger.warning('> Falling back to scapy capture backend')
+				listener = network.Listener(interface, self._handle_threadsafe, self._logger)
+				listener.start()
+				self._listeners.append(listener)
+				continue
+
+			self._loop.add_reader(ring.fileno(), self._read_ring, ring)
+			self._rings.append(ring)
+			self._logger.info("Registered receive ring of interface %s with event loop" % interface)
+
+		# Delay the first messages until the loop is up and running
+		self._loop.call_later(self.STARTUP_DELAY, self.manager.start_scheduling)
+
+	def run(self):
+		try:
+			self._loop.run_forever()
+		finally:
+			for ring in self._rings:
+				self._loop.remove_reader(ring.fileno())
+				ring.close()
+			for listener in self._listeners:
+				listener.kill_received = True
+			self._loop.close()
+			self.manager.close()
+
+	def call_soon_threadsafe(self, callback, *args):
+		self._loop.call_soon_threadsafe(callback, *args)
+
+	def _read_ring(self, ring):
+		try:
+			ring.read(self.handler.process)
+		except:
+			self._logger.exception('Unexpected error occurred while reading receive ring')
+
+	def _handle_threadsafe(self, interface, packet):
+		# Packets of scapy listeners are bounded by the packet handler queue and its drop policy
+		self.handler.handle(interface, packet)
+		self._loop.call_soon_threadsafe(self.handler.process_queued)
@@ -0,0 +1,43 @@
+import time
+from datetime import datetime
+
+
+class Clock(object):
+	# All deadlines are absolute time.monotonic() values, so that they are not affected when the
+	# system clock jumps. Wall-clock time is only derived for display and for persisted leases.
+	def monotonic(self):
+		return time.monotonic()
+
+	def time(self):
+		return time.time()
+
+	def to_wall(self, deadline):
+		return self.time() + (deadline - self.monotonic())
+
+	def from_wall(self, timestamp):
+		return self.monotonic() + (timestamp - self.time())
+
+	def format(self, deadline):
+		if deadline is None:
+			return 'never'
+		return datetime.fromtimestamp(self.to_wall(deadline)).strftime('%Y-%m-%d %H:%M:%S')
+
+
+class ManualClock(Clock):
+	# Clock for tests and simulations, which only moves forward when advanced explicitly
+	def __init__(self, monotonic=0.0, wall=None):
+		self._monotonic = float(monotonic)
+		self._offset = (time.time() if wall is None else float(wall)) - self._monotonic
+
+	def monotonic(self):
+		return self._monotonic
+
+	def time(self):
+		return self._monotonic + self._offset
+
+	def advance(self, seconds):
+		self._monotonic += seconds
+
+	def step(self, seconds):
+		# Jump the wall clock only, like an NTP step or a resumed virtual machine would
+		self._offset += seconds
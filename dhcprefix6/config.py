@@ -1,30 +1,179 @@
+import hashlib
+import ipaddress
+import os
 import yaml
 import logging
+import dhcprefix6.configcache as configcache
+import dhcprefix6.types as types
+
+# Use the libyaml based loader when available, which parses large prefix lists a lot faster
+YamlLoader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+
+
+class PrefixRange(object):
+	# Prefixes of the same length carved out of a larger network, which are only expanded while
+	# iterating. Every prefix gets a DUID-LL whose link-layer address is the base mac address plus
+	# the index of the prefix within the network, so changing offset or count keeps all other DUIDs.
+	__slots__ = ('interface', 'network', 'length', 'mac', 'offset', 'count')
+
+	DUID_LL_ETHERNET = b'\x00\x03\x00\x01'
+
+	def __init__(self, interface, network, length, mac, offset=0, count=None):
+		self.interface = interface
+		self.network = ipaddress.IPv6Network(network)
+		self.length = int(types.Ipv6PrefixLength(length))
+		self.mac = types.MacAddress(mac)
+		self.offset = offset
+
+		if self.length < self.network.prefixlen:
+			raise ValueError("Prefix length %d of range %s is shorter than the network" % (self.length, self.network))
+		available = 1 << (self.length - self.network.prefixlen)
+		self.count = available - offset if count is None else count
+		if not isinstance(offset, int) or not isinstance(self.count, int) or offset < 0 or self.count < 1 \
+				or offset + self.count > available:
+			raise ValueError("Invalid offset or count for prefix range %s: %s/%s" % (self.network, offset, count))
+		if self.mac.value + offset + self.count > 1 << 48:
+			raise ValueError("Base mac address of prefix range %s is too high: %s" % (self.network, self.mac))
+
+	def __str__(self):
+		return "%s as /%d [%d-%d]" % (self.network, self.length, self.offset, self.offset + self.count - 1)
+
+	def __len__(self):
+		return self.count
+
+	def __iter__(self):
+		# Yields interface, packed DUID, integer address and length of every prefix
+		step = 1 << (128 - self.length)
+		address = int(self.network.network_address) + self.offset * step
+		mac = self.mac.value + self.offset
+		for _ in range(self.count):
+			yield self.interface, self.DUID_LL_ETHERNET + mac.to_bytes(6, 'big'), address, self.length
+			address += step
+			mac += 1
+
+	def duid(self, index):
+		return types.Duid(self.DUID_LL_ETHERNET + (self.mac.value + self.offset + index).to_bytes(6, 'big'))
 
 
 class AppConfig(object):
+	# Options which are applied when reloading the configuration, all others require a restart
+	RELOADABLE = ['interfaces', 'prefixes', 'prefix_ranges', 'compiled_prefixes', 'aggregate_prefixes',
+		'config_cache']
+
 	_config = None
+	_cache = None
+	_source = None
 
 	def __init__(self):
-		pass
+		# True if the prefixes were loaded from a compiled snapshot and need no further validation
+		self.cached = False
 
 	def load(self, config_path):
 		if self._config is not None:
 			raise Exception('Application configuration can only be loaded once')
 
-		with open(config_path, 'r') as config_file:
-			raw_config = yaml.load(config_file.read())
-			self._validate(raw_config)
+		with open(config_path, 'rb') as config_file:
+			source = config_file.read()
+			self._source = (os.fstat(config_file.fileno()).st_mtime_ns, hashlib.sha256(source).digest())
+
+		# Options of a snapshot were normalized before, so validating them again is cheap. Only
+		# the compiled prefixes replace parsing and validating the prefixes and prefix ranges.
+		self._cache = configcache.ConfigCache(config_path)
+		snapshot = self._cache.load(*self._source)
+		if snapshot is not None:
+			(options, prefixes) = snapshot
+			self._validate(options)
+			self._config['compiled_prefixes'] = prefixes
+			self.cached = True
+			return
+
+		self._validate(yaml.load(source, Loader=YamlLoader))
+
+	def save_cache(self, prefixes):
+		# Write a snapshot of this configuration and its initialized prefixes, which must have
+		# passed validation. A disabled cache removes the previous snapshot instead.
+		if self.cached:
+			return
+		if not self._config['config_cache']:
+			self._cache.remove()
+			return
+
+		self._cache.save(self._source[0], self._source[1], self._config, prefixes)
+
+	@property
+	def cache_path(self):
+		return self._cache.path
+
+	def reload(self, config_path):
+		# Load the configuration file again into a new instance, this one stays untouched until
+		# the reloaded configuration got applied with apply()
+		reloaded = AppConfig()
+		reloaded.load(config_path)
+		return reloaded
+
+	def restart_required(self, reloaded):
+		# Options which differ from a reloaded configuration but can not be applied at runtime
+		return sorted([key for key in self._config if key not in self.RELOADABLE
+			and self._config[key] != reloaded.get(key)])
+
+	def apply(self, reloaded):
+		for key in self.RELOADABLE:
+			self._config[key] = reloaded.get(key)
 
 	def _validate(self, raw_config):
 		# Reset configuration
 		self._config = dict()
 		self._config['interfaces'] = list()
 		self._config['prefixes'] = list()
+		self._config['prefix_ranges'] = list()
+		self._config['compiled_prefixes'] = None
 
 		# Basic configuration values
 		self._config['retry_time'] = raw_config.get('retry_time', 60)
 		self._config['expire_time_multi'] = raw_config.get('expire_time_multi', 1.5)
+		self._config['runtime'] = raw_config.get('runtime', 'threaded')
+		self._config['workers'] = raw_config.get('workers', 1)
+		self._config['capture_backend'] = raw_config.get('capture_backend', 'ring')
+		self._config['listener_mode'] = raw_config.get('listener_mode', 'per_interface')
+		self._config['listener_threads'] = raw_config.get('listener_threads', 1)
+		self._config['queue_size'] = raw_config.get('queue_size', 1024)
+		self._config['queue_drop_policy'] = raw_config.get('queue_drop_policy', 'oldest')
+		self._config['journal'] = raw_config.get('journal', None)
+		self._config['tx_rate'] = raw_config.get('tx_rate', 0)
+		self._config['tx_burst'] = raw_config.get('tx_burst', 50)
+		self._config['aggregate_prefixes'] = bool(raw_config.get('aggregate_prefixes', False))
+		self._config['metrics_address'] = raw_config.get('metrics_address', '127.0.0.1')
+		self._config['metrics_port'] = raw_config.get('metrics_port', 0)
+		self._config['profiling_sample_rate'] = float(raw_config.get('profiling_sample_rate', 0.01))
+		self._config['profiling_output'] = raw_config.get('profiling_output', '/var/lib/dhcprefix6/profile')
+		self._config['profiling_thread'] = raw_config.get('profiling_thread', None)
+		self._config['profiling_thread_seconds'] = raw_config.get('profiling_thread_seconds', 30)
+		self._config['config_cache'] = bool(raw_config.get('config_cache', True))
+
+		# Validate runtime and capture options
+		if self._config['runtime'] not in ['threaded', 'asyncio']:
+			raise ValueError("Invalid runtime: %s" % self._config['runtime'])
+		if self._config['capture_backend'] not in ['ring', 'sniff']:
+			raise ValueError("Invalid capture backend: %s" % self._config['capture_backend'])
+		if self._config['listener_mode'] not in ['per_interface', 'multiplexed']:
+			raise ValueError("Invalid listener mode: %s" % self._config['listener_mode'])
+		if self._config['queue_drop_policy'] not in ['oldest', 'newest']:
+			raise ValueError("Invalid queue drop policy: %s" % self._config['queue_drop_policy'])
+		if self._config['journal'] is not None and not isinstance(self._config['journal'], str):
+			raise ValueError("Invalid journal path: %s" % self._config['journal'])
+		if self._config['tx_rate'] < 0 or self._config['tx_burst'] < 1:
+			raise ValueError("Invalid transmission rate limit: %s/%s" % (self._config['tx_rate'], self._config['tx_burst']))
+		if not isinstance(self._config['metrics_port'], int) or not 0 <= self._config['metrics_port'] <= 65535:
+			raise ValueError("Invalid metrics port: %s" % self._config['metrics_port'])
+		try:
+			ipaddress.ip_address(self._config['metrics_address'])
+		except ValueError:
+			raise ValueError("Invalid metrics address: %s" % self._config['metrics_address'])
+		if not 0 < self._config['profiling_sample_rate'] <= 1:
+			raise ValueError("Invalid profiling sample rate: %s" % self._config['profiling_sample_rate'])
+		thread_seconds = self._config['profiling_thread_seconds']
+		if isinstance(thread_seconds, bool) or not isinstance(thread_seconds, int) or thread_seconds <= 0:
+			raise ValueError("Invalid profiling thread duration: %s" % thread_seconds)
 
 		# Parse interfaces
 		for interface in raw_config.get('interfaces', []):
@@ -43,5 +192,16 @@ class AppConfig(object):
 				'length': prefix.get('length')
 			})
 
+		# Parse prefix ranges, which are expanded when the prefixes get initialized
+		for prefix_range in raw_config.get('prefix_ranges', []):
+			self._config['prefix_ranges'].append(PrefixRange(
+				interface=prefix_range.get('interface'),
+				network=prefix_range.get('network'),
+				length=prefix_range.get('length'),
+				mac=prefix_range.get('mac'),
+				offset=prefix_range.get('offset', 0),
+				count=prefix_range.get('count', None)
+			))
+
 	def get(self, key):
 		return self._config[key]
\ No newline at end of file
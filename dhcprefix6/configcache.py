@@ -0,0 +1,117 @@
+import json
+import os
+import struct
+import zlib
+import dhcprefix6
+
+
+class ConfigCache(object):
+	# Compiled snapshot of a validated configuration, which is stored next to the configuration file.
+	# It is only used while modification time and SHA-256 of the configuration file still match, so
+	# that large prefix lists neither have to be parsed nor validated again. Snapshots of another
+	# DHCprefix6 version or snapshot version are ignored. The snapshot consists of a header, the
+	# options as JSON, one record per prefix and a CRC32 over everything before it.
+	MAGIC = b'DP6C'
+	HEADER_FORMAT = '<4sH3BQ32sII'
+
+	# Version of the snapshot format and of what it contains, which has to be increased whenever the
+	# record layout, option defaults or the parsing, expansion or validation of prefixes change
+	VERSION = 3
+	PREFIX_FORMAT = '<H16sBB'
+	CRC_FORMAT = '<I'
+	SUFFIX = '.cache'
+
+	# Options which are replaced by the compiled prefixes
+	EXCLUDED_OPTIONS = ['prefixes', 'prefix_ranges', 'compiled_prefixes']
+
+	def __init__(self, config_path):
+		self._path = config_path + self.SUFFIX
+
+	@property
+	def path(self):
+		return self._path
+
+	def load(self, mtime, digest):
+		# Options and prefixes (interface, packed DUID, packed address, length) of the snapshot, or
+		# None if there is no usable snapshot for this version of the configuration file
+		try:
+			with open(self._path, 'rb') as cache_file:
+				data = cache_file.read()
+		except EnvironmentError:
+			return None
+
+		try:
+			return self._unpack(data, mtime, digest)
+		except (struct.error, ValueError, IndexError, KeyError):
+			return None
+
+	def save(self, mtime, digest, options, prefixes):
+		data = self._pack(mtime, digest, options, prefixes)
+
+		# Write into a temporary file first, which atomically replaces the previous snapshot
+		temp_path = self._path + '.tmp'
+		with open(temp_path, 'wb') as cache_file:
+			cache_file.write(data)
+		os.replace(temp_path, self._path)
+
+	def remove(self):
+		try:
+			os.unlink(self._path)
+		except FileNotFoundError:
+			pass
+
+	def _pack(self, mtime, digest, options, prefixes):
+		interfaces = []
+		interface_indexes = dict()
+		records = []
+		for prefix in prefixes:
+			interface = str(prefix.interface)
+			if interface not in interface_indexes:
+				interface_indexes[interface] = len(interfaces)
+				interfaces.append(interface)
+
+			duid = prefix.duid.packed
+			records.append(struct.pack(self.PREFIX_FORMAT, interface_indexes[interface],
+				prefix.network.network_address.packed, prefix.network.prefixlen, len(duid)))
+			records.append(duid)
+
+		body = json.dumps({
+			'options': dict([(key, value) for (key, value) in options.items() if key not in self.EXCLUDED_OPTIONS]),
+			'interfaces': interfaces
+		}, sort_keys=True).encode('utf-8')
+
+		data = struct.pack(self.HEADER_FORMAT, self.MAGIC, self.VERSION, *(dhcprefix6.VERSION + (mtime, digest,
+			len(body), len(prefixes))))
+		data += body + b''.join(records)
+		return data + struct.pack(self.CRC_FORMAT, zlib.crc32(data) & 0xffffffff)
+
+	def _unpack(self, data, mtime, digest):
+		(magic, version, major, minor, patch, cached_mtime, cached_digest, body_length, count) = \
+			struct.unpack_from(self.HEADER_FORMAT, data)
+		if magic != self.MAGIC or version != self.VERSION or (major, minor, patch) != dhcprefix6.VERSION:
+			return None
+		if cached_mtime != mtime or cached_digest != digest:
+			return None
+
+		end = len(data) - struct.calcsize(self.CRC_FORMAT)
+		(crc,) = struct.unpack_from(self.CRC_FORMAT, data, end)
+		if zlib.crc32(data[:end]) & 0xffffffff != crc:
+			return None
+
+		offset = struct.calcsize(self.HEADER_FORMAT)
+		body = json.loads(data[offset:offset + body_length].decode('utf-8'))
+		interfaces = body['interfaces']
+		offset += body_length
+
+		prefixes = []
+		record_size = struct.calcsize(self.PREFIX_FORMAT)
+		for _ in range(count):
+			(interface, address, length, duid_length) = struct.unpack_from(self.PREFIX_FORMAT, data, offset)
+			offset += record_size
+			prefixes.append((interfaces[interface], data[offset:offset + duid_length], address, length))
+			offset += duid_length
+
+		if offset != end:
+			return None
+		return body['options'], prefixes
+
@@ -1,21 +1,37 @@
+import collections
 import logging
 import signal
 import sys
 import time
+import dhcprefix6
+import dhcprefix6.aio as aio
 import dhcprefix6.config as config
 import dhcprefix6.util as util
 import dhcprefix6.store as store
 import dhcprefix6.dhcp as dhcp
+import dhcprefix6.journal as journal
+import dhcprefix6.leasetable as leasetable
+import dhcprefix6.metrics as metrics
+import dhcprefix6.netlink as netlink
 import dhcprefix6.network as network
+import dhcprefix6.profiling as profiling
+import dhcprefix6.shard as shard
 
 
 class App(object):
-	VERSION = (1, 0, 0)
+	VERSION = dhcprefix6.VERSION
 	_logger = None
 	_handler = None
 	_manager = None
 	_physical_interfaces = None
 	_virtual_interfaces = None
+	_lease_table = None
+	_runtime = None
+	_supervisor = None
+	_reload_requested = False
+
+	# IAID of the first virtual interface, all others are numbered consecutively
+	FIRST_IAID = 25000
 
 	def __init__(self, config_file):
 		# Setup logging
@@ -25,8 +41,15 @@ class App(object):
 		# Setup threading
 		self._thread_pool = []
 		signal.signal(signal.SIGINT, self._signal_handler)
+		if hasattr(signal, 'SIGUSR1'):
+			signal.signal(signal.SIGUSR1, self._dump_statistics)
+		if hasattr(signal, 'SIGUSR2'):
+			signal.signal(signal.SIGUSR2, self._toggle_profiling)
+		if hasattr(signal, 'SIGHUP'):
+			signal.signal(signal.SIGHUP, self._request_reload)
 
 		# Load application configuration
+		self._config_file = config_file
 		self._config = config.AppConfig()
 		self._config.load(config_file)
 		self._logger.info("Loaded configuration file: %s" % config_file)
@@ -43,41 +66,77 @@ class App(object):
 
 			# Initialize and validate options
 			self._initialize_interfaces()
-			self._initialize_prefixes()
-			self._validate_interfaces()
-			self._validate_prefixes()
+			self._initialize_prefixes(self._config, self._prefixes)
+			self._validate_interfaces(self._physical_interfaces)
+			if not self._config.cached:
+				self._validate_prefixes(self._config, self._physical_interfaces, self._prefixes)
+				self._save_config_cache(self._config, self._prefixes)
 
 			# Group prefixes
 			self._build_virtual_interfaces()
 			self._dump_virtual_interfaces()
 
-			# Start threads
-			self._start_manager()
-			self._start_handler()
-			self._start_listeners()
+			# Start worker processes, event loop or threads
+			if int(self._config.get('workers')) > 1:
+				self._start_supervisor()
+				self._start_listeners(self._supervisor.handle)
+				self._start_metrics_server()
+
+				# Keep application running and restart failed workers
+				while True:
+					time.sleep(1)
+					self._supervisor.monitor()
+					if self._reload_requested:
+						self._reload()
+			elif self._config.get('runtime') == 'asyncio':
+				self._start_async_runtime()
+				self._start_metrics_server()
+				self._runtime.run()
+			else:
+				self._start_manager()
+				self._start_handler()
+				self._start_listeners(self._handler.handle)
+				self._start_metrics_server()
 
-			# Keep application running
-			while True:
-				time.sleep(1)
+				# Keep application running, configuration reloads are applied from this thread
+				while True:
+					time.sleep(1)
+					if self._reload_requested:
+						self._reload()
 		except:
 			self._logger.exception('Unexpected error occurred in main application thread')
 			self._signal_handler()
 
 	def _initialize_interfaces(self):
 		for interface in self._config.get('interfaces'):
-			interface = self._physical_interfaces.add(dhcp.Interface(
-				name=interface['name'],
-				mac=interface['mac'],
-				ip=interface['ip']
-			))
+			self._physical_interfaces.add(self._create_interface(interface))
+
+	def _create_interface(self, interface):
+		interface = dhcp.Interface(
+			name=interface['name'],
+			mac=interface['mac'],
+			ip=interface['ip'],
+			tx_rate=float(self._config.get('tx_rate')),
+			tx_burst=int(self._config.get('tx_burst'))
+		)
 
-			self._logger.info("Initialized interface %s" % interface)
-			self._logger.info("> MAC address: %s" % interface.mac)
-			self._logger.info("> Link-local address: %s" % interface.ip)
+		self._logger.info("Initialized interface %s" % interface)
+		self._logger.info("> MAC address: %s" % interface.mac)
+		self._logger.info("> Link-local address: %s" % interface.ip)
+		return interface
 
-	def _initialize_prefixes(self):
-		for prefix in self._config.get('prefixes'):
-			prefix = self._prefixes.add(dhcp.Prefix(
+	def _initialize_prefixes(self, app_config, prefixes):
+		# Prefixes of a compiled snapshot replace the prefixes and ranges of the configuration file
+		if app_config.cached:
+			for (interface, duid, address, length) in app_config.get('compiled_prefixes'):
+				prefixes.add(dhcp.Prefix(interface=interface, duid=duid, address=address, length=length))
+
+			self._logger.info("Initialized %d prefix(es) from configuration cache %s" %
+				(len(app_config.get('compiled_prefixes')), app_config.cache_path))
+			return
+
+		for prefix in app_config.get('prefixes'):
+			prefix = prefixes.add(dhcp.Prefix(
 				interface=prefix.get('interface'),
 				duid=prefix.get('duid'),
 				address=prefix.get('address'),
@@ -88,46 +147,89 @@ class App(object):
 			self._logger.info("> Interface: %s" % prefix.interface)
 			self._logger.info("> Client DUID: %s" % prefix.duid)
 
-	def _validate_interfaces(self):
-		used_names = []
-		used_macs = []
-		used_ips = []
+		# Ranges are logged as a whole instead of every single prefix
+		for prefix_range in app_config.get('prefix_ranges'):
+			for (interface, duid, address, length) in prefix_range:
+				prefixes.add(dhcp.Prefix(interface=interface, duid=duid, address=address, length=length))
+
+			self._logger.info("Initialized %d prefix(es) of range %s" % (len(prefix_range), prefix_range))
+			self._logger.info("> Interface: %s" % prefix_range.interface)
+			self._logger.info("> Client DUIDs: %s - %s" % (prefix_range.duid(0), prefix_range.duid(len(prefix_range) - 1)))
+
+	def _validate_interfaces(self, interfaces):
+		used_names = set()
+		used_macs = set()
+		used_ips = set()
 
-		for interface in self._physical_interfaces.raw():
-			if interface.name in used_names:
+		for interface in interfaces.raw():
+			if str(interface.name) in used_names:
 				raise ValueError("Duplicate interface name detected: %s" % interface.name)
 			if interface.mac in used_macs:
 				raise ValueError("Duplicate interface mac address detected: %s" % interface.mac)
 			if interface.ip in used_ips:
 				raise ValueError("Duplicate interface ip address detected: %s" % interface.ip)
 
-			used_names.append(interface.name)
-			used_macs.append(interface.mac)
-			used_ips.append(interface.ip)
+			used_names.add(str(interface.name))
+			used_macs.add(interface.mac)
+			used_ips.add(interface.ip)
 
-	def _validate_prefixes(self):
-		used_duids = []
+	def _validate_prefixes(self, app_config, interfaces, prefixes):
+		used_duids = dict()
+		used_prefixes = set()
 
-		for prefix in self._prefixes.raw():
-			if self._physical_interfaces.get_by_name(prefix.interface) is None:
+		for prefix in prefixes.raw():
+			duid = prefix.duid.packed
+			if interfaces.get_by_name(prefix.interface) is None:
 				raise ValueError("Prefix %s requires inexistant physical interface %s" % (prefix, prefix.interface))
-			if prefix.duid in used_duids:
-				raise ValueError("You can only specify one prefix per interface and DUID: %s" % prefix)
+			if (duid, prefix.network) in used_prefixes:
+				raise ValueError("Duplicate prefix detected: %s" % prefix)
 
-			used_duids.append(prefix.duid)
+			# Aggregated prefixes of a DUID are requested together, so they have to share the interface
+			if duid in used_duids:
+				if not app_config.get('aggregate_prefixes'):
+					raise ValueError("You can only specify one prefix per interface and DUID: %s" % prefix)
+				if used_duids[duid] != str(prefix.interface):
+					raise ValueError("Prefixes of DUID %s must use the same interface: %s" % (prefix.duid, prefix))
+
+			used_duids[duid] = str(prefix.interface)
+			used_prefixes.add((duid, prefix.network))
+
+	def _save_config_cache(self, app_config, prefixes):
+		# The snapshot only speeds up the next start, so failing to write it is not fatal
+		try:
+			app_config.save_cache(prefixes.raw())
+		except (EnvironmentError, TypeError, ValueError) as e:
+			self._logger.warning("Could not write configuration cache %s: %s" % (app_config.cache_path, e))
+
+	def _group_prefixes(self, app_config, prefixes):
+		# Group prefixes by DUID when aggregating, so that they are requested within one IA_PD
+		groups = collections.OrderedDict()
+		for (index, prefix) in enumerate(prefixes.raw()):
+			key = prefix.duid.packed if app_config.get('aggregate_prefixes') else index
+			groups.setdefault(key, []).append(prefix)
+		return list(groups.values())
 
 	def _build_virtual_interfaces(self):
+		# All virtual interfaces are views onto the rows of one shared lease table
+		self._lease_table = leasetable.LeaseTable(self._logger)
 		self._virtual_interfaces = list()
-		iaid = 25000
-		for prefix in self._prefixes.raw():
-			self._virtual_interfaces.append(dhcp.VirtualInterface(
-				iaid=iaid,
-				client_duid=prefix.duid,
-				prefix=prefix,
-				physical=self._physical_interfaces.get_by_name(prefix.interface),
-				logger=self._logger
-			))
-			iaid += 1
+		for (index, prefixes) in enumerate(self._group_prefixes(self._config, self._prefixes)):
+			self._virtual_interfaces.append(self._create_virtual_interface(self.FIRST_IAID + index, prefixes,
+				self._physical_interfaces))
+
+	def _create_virtual_interface(self, iaid, prefixes, interfaces):
+		return dhcp.VirtualInterface(
+			iaid=iaid,
+			client_duid=prefixes[0].duid,
+			prefixes=prefixes,
+			physical=interfaces.get_by_name(prefixes[0].interface),
+			table=self._lease_table
+		)
+
+	@staticmethod
+	def _virtual_interface_key(client_duid, interface, prefixes):
+		# Virtual interfaces with the same key are left untouched when reloading the configuration
+		return client_duid.packed, str(interface), tuple([prefix.network for prefix in prefixes])
 
 	def _dump_virtual_interfaces(self):
 		for viface in self._virtual_interfaces:
@@ -136,28 +238,118 @@ class App(object):
 			self._logger.debug("> MAC address: %s" % viface.physical.mac)
 			self._logger.debug("> Link-local address: %s" % viface.physical.ip)
 			self._logger.debug("> Client DUID: %s" % viface.client_duid)
-			self._logger.debug("> Prefix: %s" % viface.prefix)
+			self._logger.debug("> Prefixes: %s" % viface.format_prefixes())
 		pass
 
 	def _start_handler(self):
-		self._handler = network.Handler(self._physical_interfaces, self._prefixes, self._manager, self._logger)
+		self._handler = network.Handler(
+			interfaces=self._physical_interfaces,
+			prefixes=self._prefixes,
+			manager=self._manager,
+			logger=self._logger,
+			queue_size=int(self._config.get('queue_size')),
+			drop_policy=self._config.get('queue_drop_policy')
+		)
 		self._handler.start()
 		self._thread_pool.append(self._handler)
 		self._logger.info('Started packet handler thread')
+		self._logger.info("> Queue size: %d packet(s)" % self._config.get('queue_size'))
+		self._logger.info("> Drop policy: %s" % self._config.get('queue_drop_policy'))
+
+	def _start_listeners(self, handle, interfaces=None):
+		interfaces = list(self._physical_interfaces.raw() if interfaces is None else interfaces)
+		if self._config.get('capture_backend') == 'ring' and self._config.get('listener_mode') == 'multiplexed':
+			interfaces = self._start_multiplexed_listeners(interfaces, handle)
+
+		for interface in interfaces:
+			listener = None
+			if self._config.get('capture_backend') == 'ring':
+				try:
+					listener = network.RingListener(interface, handle, self._logger)
+				except (AttributeError, OSError) as e:
+					self._logger.warning("Could not setup receive ring on interface %s: %s" % (interface, e))
+					self._logger.warning('> Falling back to scapy capture backend')
+
+			if listener is None:
+				listener = network.Listener(interface, handle, self._logger)
 
-	def _start_listeners(self):
-		for interface in self._physical_interfaces.raw():
-			listener = network.Listener(interface, self._handler.handle)
 			listener.start()
 			self._thread_pool.append(listener)
 			self._logger.info("Started listener on interface %s" % interface)
+			self._logger.debug("> Capture backend: %s" % listener.__class__.__name__)
+
+	def _start_multiplexed_listeners(self, interfaces, handle):
+		# Distribute all interfaces round-robin across a fixed pool of listener threads
+		pool_size = max(1, min(int(self._config.get('listener_threads')), len(interfaces)))
+		groups = [interfaces[index::pool_size] for index in range(pool_size)]
+
+		remaining = []
+		for group in groups:
+			try:
+				listener = network.MultiplexedListener(group, handle, self._logger)
+			except (AttributeError, OSError) as e:
+				self._logger.warning("Could not setup receive rings on interfaces %s: %s" %
+					(', '.join([str(interface) for interface in group]), e))
+				self._logger.warning('> Falling back to one listener per interface')
+				remaining.extend(group)
+				continue
+
+			listener.start()
+			self._thread_pool.append(listener)
+			self._logger.info("Started multiplexed listener on interfaces %s" %
+				', '.join([str(interface) for interface in group]))
+
+		return remaining
+
+	def _start_supervisor(self):
+		self._supervisor = shard.Supervisor(
+			interfaces=self._physical_interfaces,
+			prefixes=self._prefixes,
+			virtual_interfaces=self._virtual_interfaces,
+			worker_count=int(self._config.get('workers')),
+			options={
+				'retry_time': int(self._config.get('retry_time')),
+				'expire_time_multi': float(self._config.get('expire_time_multi')),
+				'queue_size': int(self._config.get('queue_size')),
+				'queue_drop_policy': self._config.get('queue_drop_policy'),
+				'journal': self._config.get('journal'),
+				'profiling_sample_rate': self._config.get('profiling_sample_rate'),
+				'profiling_output': self._config.get('profiling_output'),
+				'profiling_thread': self._config.get('profiling_thread'),
+				'profiling_thread_seconds': self._config.get('profiling_thread_seconds')
+			},
+			logger=self._logger
+		)
+		self._supervisor.start()
+		self._thread_pool.append(self._supervisor)
+		self._logger.info("Started supervisor with %d worker process(es)" % self._config.get('workers'))
+
+	def _start_async_runtime(self):
+		self._runtime = aio.AsyncRuntime(
+			interfaces=self._physical_interfaces,
+			prefixes=self._prefixes,
+			virtual_interfaces=self._virtual_interfaces,
+			retry_time=int(self._config.get('retry_time')),
+			expire_time_multi=float(self._config.get('expire_time_multi')),
+			logger=self._logger,
+			journal=self._open_journal(),
+			queue_size=int(self._config.get('queue_size')),
+			drop_policy=self._config.get('queue_drop_policy')
+		)
+		(self._manager, self._handler) = self._runtime.manager, self._runtime.handler
+		self._runtime.start()
+		self._thread_pool.append(self._runtime)
+		self._logger.info('Started asyncio runtime')
+		self._logger.info("> Retry time: %d second(s)" % self._config.get('retry_time'))
+		self._logger.info("> Expire time multi: T2 x %f" % self._config.get('expire_time_multi'))
 
 	def _start_manager(self):
 		self._manager = dhcp.Manager(
 			virtual_interfaces=self._virtual_interfaces,
 			retry_time=int(self._config.get('retry_time')),
 			expire_time_multi=float(self._config.get('expire_time_multi')),
-			logger=self._logger
+			logger=self._logger,
+			journal=self._open_journal()
 		)
 		self._manager.start()
 		self._thread_pool.append(self._manager)
@@ -165,6 +357,29 @@ class App(object):
 		self._logger.info("> Retry time: %d second(s)" % self._config.get('retry_time'))
 		self._logger.info("> Expire time multi: T2 x %f" % self._config.get('expire_time_multi'))
 
+	def _start_metrics_server(self):
+		if not self._config.get('metrics_port'):
+			return
+
+		server = metrics.MetricsServer(
+			address=self._config.get('metrics_address'),
+			port=self._config.get('metrics_port'),
+			collect=self._collect_status,
+			state_names=dhcp.PrefixState.STRINGS,
+			logger=self._logger
+		)
+		server.start()
+		self._thread_pool.append(server)
+		self._logger.info("Started metrics server on http://%s:%d/metrics" %
+			(self._config.get('metrics_address'), self._config.get('metrics_port')))
+
+	def _open_journal(self):
+		if self._config.get('journal') is None:
+			return None
+
+		self._logger.info("Using lease journal: %s" % self._config.get('journal'))
+		return journal.LeaseJournal(self._config.get('journal'), self._logger)
+
 	def _setup_logging(self):
 		# Global logging options
 		logging.basicConfig(format='[%(asctime)s]  %(levelname)s  %(message)s')
@@ -184,6 +399,155 @@ class App(object):
 		self._logger.info("| Version: %d.%d.%d                             |" % self.VERSION)
 		self._logger.info('=~=~=~=~=~=~=~=~=~=~=~=~=~=~~=~=~=~=~=~=~=~=~=')
 
+	def _collect_status(self):
+		if self._supervisor is not None:
+			return self._supervisor.stats()
+		if self._manager is None:
+			return None
+		return shard.collect_status(self._manager, self._handler, self._physical_interfaces.raw())
+
+	def _dump_statistics(self, signal=None, frame=None):
+		status = self._collect_status()
+		if status is None:
+			return
+
+		if 'dispatcher' in status:
+			stats = status['dispatcher']
+			self._logger.info('Supervisor statistics')
+			self._logger.info("> Workers: %d/%d alive, Restarts: %d" % (stats['alive'], stats['workers'], stats['restarts']))
+			self._logger.info("> Dispatched: %d, Unknown: %d, Congested: %d, Undeliverable: %d" %
+				(stats['dispatched'], stats['unknown'], stats['congested'], stats['undeliverable']))
+
+		if 'states' in status:
+			self._logger.info('Virtual interface states')
+			self._logger.info("> %s" % ', '.join(["%s: %d" % (dhcp.PrefixState.STRINGS[state], count)
+				for (state, count) in sorted(status['states'].items())]))
+
+		if 'transactions' in status:
+			stats = status['transactions']
+			self._logger.info('Transaction statistics')
+			self._logger.info("> Outstanding: %d, Matched replies: %d, Duplicate replies: %d, Stale replies: %d" %
+				(stats['outstanding'], stats['matched'], stats['duplicate'], stats['stale']))
+
+		if 'queue' in status:
+			stats = status['queue']
+			self._logger.info('Packet handler statistics')
+			self._logger.info("> Queue depth: %d/%d (max. %d)" %
+				(stats['depth'], stats['high_water_mark'], stats['max_depth']))
+			self._logger.info("> Enqueued: %d, Dequeued: %d, Dropped: %d" %
+				(stats['enqueued'], stats['dequeued'], stats['dropped']))
+
+		for (name, stats) in sorted(status.get('tx', {}).items()):
+			avg_batch_size = float(stats['packets']) / stats['batches'] if stats['batches'] else 0.0
+			self._logger.info("Transmit statistics of interface %s" % name)
+			self._logger.info("> Packets: %d, Bytes: %d, Errors: %d" % (stats['packets'], stats['bytes'], stats['errors']))
+			self._logger.info("> Batches: %d, Syscalls: %d, Batch size: avg. %.1f, max. %d" %
+				(stats['batches'], stats['syscalls'], avg_batch_size, stats['max_batch_size']))
+			self._logger.info("> Deferred by rate limiter: %d" % stats['deferred'])
+
+	def _toggle_profiling(self, signum=None, frame=None):
+		profiling.toggle(dict([(key, self._config.get(key)) for key in ['profiling_sample_rate', 'profiling_output',
+			'profiling_thread', 'profiling_thread_seconds']]), self._logger)
+
+		# Every worker process profiles itself and writes its own report
+		if self._supervisor is not None:
+			self._supervisor.signal_workers(signum)
+
+	def _request_reload(self, signum=None, frame=None):
+		# The event loop applies the reload itself, the threaded runtime within its main loop
+		if self._runtime is not None:
+			self._runtime.call_soon_threadsafe(self._reload)
+		else:
+			self._reload_requested = True
+
+	def _reload(self):
+		self._reload_requested = False
+		if self._supervisor is not None:
+			self._logger.warning('Configuration can not be reloaded with worker processes, restart required')
+			return
+
+		self._logger.info("Reloading configuration file: %s" % self._config_file)
+		try:
+			self._apply_config(self._config.reload(self._config_file))
+		except:
+			self._logger.exception('Could not reload configuration, keeping the running configuration')
+
+	def _apply_config(self, reloaded):
+		# Only virtual interfaces whose DUID, interface or prefixes changed are torn down or solicited,
+		# all others keep their lease. Everything is validated before the running state gets touched.
+		for key in self._config.restart_required(reloaded):
+			self._logger.warning("Changed option %s requires a restart and was not applied" % key)
+
+		# Running physical interfaces are kept, new ones get initialized and start listening
+		running = collections.OrderedDict([(str(interface.name), interface) for interface in self._physical_interfaces.raw()])
+		configured = dict([(interface['name'], interface) for interface in self._config.get('interfaces')])
+		reloaded_names = set([interface['name'] for interface in reloaded.get('interfaces')])
+		added_interfaces = []
+		netlink.invalidate()
+		for interface in reloaded.get('interfaces'):
+			if interface['name'] not in running:
+				added_interfaces.append(self._create_interface(interface))
+			elif interface != configured.get(interface['name']):
+				self._logger.warning("Changed interface %s requires a restart and was not applied" % interface['name'])
+		for name in running:
+			if name not in reloaded_names:
+				self._logger.warning("Removed interface %s is kept until restart" % name)
+		if len(added_interfaces) > 0 and self._runtime is not None:
+			raise ValueError('Interfaces can not be added to the asyncio runtime, restart required')
+
+		interfaces = store.InterfaceStore()
+		interfaces.replace(list(running.values()) + added_interfaces)
+		self._validate_interfaces(interfaces)
+		prefixes = store.PrefixStore()
+		self._initialize_prefixes(reloaded, prefixes)
+		if not reloaded.cached:
+			self._validate_prefixes(reloaded, interfaces, prefixes)
+			self._save_config_cache(reloaded, prefixes)
+
+		# Compare the running virtual interfaces against the reloaded prefix groups
+		current = collections.OrderedDict([(self._virtual_interface_key(viface.client_duid, viface.physical.name,
+			viface.prefixes), viface) for viface in self._virtual_interfaces])
+		wanted = collections.OrderedDict([(self._virtual_interface_key(group[0].duid, group[0].interface, group), group)
+			for group in self._group_prefixes(reloaded, prefixes)])
+		kept = [viface for (key, viface) in current.items() if key in wanted]
+		removed = [viface for (key, viface) in current.items() if key not in wanted]
+
+		# Prefixes keep the IAID of their removed virtual interface, all others get a new one
+		released = dict([(prefix.network, viface.iaid) for viface in removed for prefix in viface.prefixes])
+		used = set([viface.iaid for viface in kept])
+		next_iaid = max(used | set(released.values()) | set([self.FIRST_IAID - 1])) + 1
+		added = []
+		for (key, group) in wanted.items():
+			if key in current:
+				continue
+
+			candidates = [released[prefix.network] for prefix in group
+				if prefix.network in released and released[prefix.network] not in used]
+			if len(candidates) > 0:
+				iaid = candidates[0]
+			else:
+				(iaid, next_iaid) = next_iaid, next_iaid + 1
+			used.add(iaid)
+			added.append(self._create_virtual_interface(iaid, group, interfaces))
+
+		# Apply the new configuration, listeners are started first to not miss any reply
+		descriptions = [(str(viface), viface.format_prefixes()) for viface in removed]
+		if len(added_interfaces) > 0:
+			self._start_listeners(self._handler.handle, added_interfaces)
+		self._physical_interfaces.replace(interfaces.raw())
+		self._prefixes.replace(prefixes.raw())
+		self._manager.remove_virtual_interfaces(removed)
+		self._manager.add_virtual_interfaces(added)
+		self._virtual_interfaces = kept + added
+		self._config.apply(reloaded)
+
+		for (viface, prefixes) in descriptions:
+			self._logger.info("Removed virtual interface %s with prefixes %s" % (viface, prefixes))
+		for viface in added:
+			self._logger.info("Added virtual interface %s with prefixes %s" % (viface, viface.format_prefixes()))
+		self._logger.info("Reloaded configuration: %d virtual interface(s) added, %d removed, %d unchanged" %
+			(len(added), len(removed), len(kept)))
+
 	def _signal_handler(self, signal=None, frame=None):
 		print()
 		self._logger.warning('Application aborted. Stopping all threads...')
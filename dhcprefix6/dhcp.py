@@ -1,25 +1,21 @@
+import ipaddress
+import collections
 import random
+import struct
 import threading
 import time
-import sys
-from datetime import datetime, timedelta
-from scapy.arch import get_if_hwaddr, get_if_list
-from scapy.layers.dhcp6 import DHCP6OptIAPrefix, DHCP6_Solicit, DHCP6OptClientId, DHCP6OptIA_PD, DHCP6OptElapsedTime, \
-	DUID_LL, DHCP6_Advertise, DHCP6OptServerId, DUID_LLT, DHCP6_Request, DHCP6_Reply, DHCP6_Renew, DHCP6_Rebind, \
-	DHCP6OptStatusCode, DHCP6OptOptReq
-from scapy.layers.inet import UDP
-from scapy.layers.inet6 import IPv6
-from scapy.layers.l2 import Ether
-from scapy.sendrecv import sendp
+import dhcprefix6.clock as clocks
+import dhcprefix6.journal as journals
+import dhcprefix6.leasetable as leasetable
+import dhcprefix6.metrics as metrics
+import dhcprefix6.netlink as netlink
+import dhcprefix6.network as network
+import dhcprefix6.profiling as profiling
+import dhcprefix6.retransmission as retransmission
+import dhcprefix6.scheduler as schedulers
+import dhcprefix6.store as store
 import dhcprefix6.types as types
-
-# Try to import the function 'in6_getifaddr', which is
-# only supported by UNIX systems. To keep compatiblity
-# to windows systems, this nifty little hack was added.
-try:
-	from scapy.arch import in6_getifaddr
-except ImportError:
-	pass
+import dhcprefix6.wire as wire
 
 
 class PrefixState(object):
@@ -43,365 +39,669 @@ class PrefixState(object):
 		WITHDRAWN: 'Withdrawn'
 	}
 
+	# States in which a virtual interface waits for an answer of a server
+	WAITING = [SOLICITED, REQUESTED, RENEWING, REBINDING]
+
+
+class StateIndex(object):
+	# Membership sets of virtual interfaces per state, kept up to date by VirtualInterface.state
+	def __init__(self):
+		self._members = dict([(state, set()) for state in PrefixState.STRINGS])
+
+	def add(self, viface):
+		self._members[viface.state].add(viface)
+
+	def move(self, viface, old_state, new_state):
+		self._members[old_state].discard(viface)
+		self._members[new_state].add(viface)
+
+	def remove(self, viface):
+		self._members[viface.state].discard(viface)
+
+	def get(self, state):
+		return self._members[state]
+
+
+class TransactionTable(object):
+	# Outstanding transactions keyed by (transaction id, binary client DUID). Closed transactions
+	# are remembered for a while to tell duplicated replies apart from stale or bogus ones.
+	RECENT_SIZE = 4096
+
+	def __init__(self):
+		self._outstanding = dict()
+		self._by_viface = dict()
+		self._recent = collections.OrderedDict()
+		self._lock = threading.Lock()
+
+		# Replies which matched an outstanding transaction, a recently closed one or none at all
+		self.matched = 0
+		self.stale = 0
+		self.duplicate = 0
+
+	def open(self, viface, transaction_id, client_duid):
+		with self._lock:
+			self._close(viface)
+			key = (transaction_id, client_duid)
+			self._outstanding[key] = viface
+			self._by_viface[viface] = key
+
+	def close(self, viface):
+		with self._lock:
+			self._close(viface)
+
+	def match(self, transaction_id, client_duid):
+		key = (transaction_id, client_duid)
+		with self._lock:
+			viface = self._outstanding.get(key)
+			if viface is not None:
+				self.matched += 1
+			elif key in self._recent:
+				self.duplicate += 1
+			else:
+				self.stale += 1
+			return viface
+
+	def stats(self):
+		return {
+			'outstanding': len(self._outstanding),
+			'matched': self.matched,
+			'stale': self.stale,
+			'duplicate': self.duplicate
+		}
+
+	def _close(self, viface):
+		key = self._by_viface.pop(viface, None)
+		if key is None:
+			return
+
+		del self._outstanding[key]
+		self._recent[key] = True
+		if len(self._recent) > self.RECENT_SIZE:
+			self._recent.popitem(last=False)
+
 
 class Manager(threading.Thread):
-	def __init__(self, virtual_interfaces, retry_time, expire_time_multi, logger):
-		threading.Thread.__init__(self)
-		self.kill_received = False
+	MIN_SOLICIT_INTERVAL = 1
+	DROP_REASONS = ['unknown_viface', 'unexpected_state', 'no_server_id', 'unknown_server', 'bad_status']
+
+	def __init__(self, virtual_interfaces, retry_time, expire_time_multi, logger, scheduler=None, journal=None,
+			clock=None):
+		threading.Thread.__init__(self, name='manager')
+		self._kill_received = False
 
 		self._virtual_interfaces = virtual_interfaces
+		self._physical_interfaces = list(set([viface.physical for viface in virtual_interfaces]))
 		(self._retry_time, self._expire_time_multi) = (retry_time, expire_time_multi)
 		self._logger = logger
 
+		# Index virtual interfaces by binary client DUID and by state
+		self._vifaces_by_duid = dict()
+		self._states = StateIndex()
+		for viface in virtual_interfaces:
+			self._vifaces_by_duid[viface.client_duid.packed] = viface
+			viface.state_index = self._states
+
+		# Replies are only accepted for outstanding transactions
+		self._transactions = TransactionTable()
+
+		# Every virtual interface is scheduled at the time of its next retry, T1, T2 or expire deadline
+		self._lock = threading.RLock()
+		self._clock = clock if clock is not None else clocks.Clock()
+		self._scheduler = scheduler if scheduler is not None else schedulers.Scheduler(self._clock)
+
+		# Confirmed leases are written to the journal, so that a restart can resume with RENEW
+		self._journal = journal
+
+		# Messages which get dropped after parsing are counted by reason
+		self._dropped = dict([(reason, metrics.DROPPED_PACKETS.child(reason)) for reason in self.DROP_REASONS])
+
+	@property
+	def kill_received(self):
+		return self._kill_received
+
+	@kill_received.setter
+	def kill_received(self, value):
+		self._kill_received = value
+		self._scheduler.wake()
+
 	def run(self):
 		# Wait one second to ensure that all threads are up and running
 		time.sleep(1)
+		self.start_scheduling()
 
 		while self.kill_received is not True:
-			try:
-				# Solicit all virtual interfaces with a state of INITIAL or WITHDRAWN
-				vifaces = self._get_viface_by_states([PrefixState.INITIAL, PrefixState.WITHDRAWN])
-				for viface in vifaces:
-					self._solicit(viface)
-
-				# Request all advertised prefixes on every virtual interface
-				vifaces = self._get_viface_by_states([PrefixState.ADVERTISED])
-				for viface in vifaces:
-					self._request(viface)
-
-				# Search for confirmed prefixes where T1 or T2 has expired
-				vifaces = self._get_viface_by_states([PrefixState.CONFIRMED])
-				for viface in vifaces:
-					if viface.expire.has_occured(viface.last_confirm):
-						self._logger.warning(
-							"Unable to renew or rebind prefix %s - resetting state to initial" % viface.prefix)
-						viface.state = PrefixState.INITIAL
-					elif viface.t2.has_occured(viface.last_confirm):
-						self._rebind(viface)
-					elif viface.t1.has_occured(viface.last_confirm):
-						self._renew(viface)
-
-				# Search for timeouted messages
-				vifaces = self._get_viface_by_states(
-					[PrefixState.SOLICITED, PrefixState.REQUESTED, PrefixState.RENEWING, PrefixState.REBINDING])
-				trigger_value = datetime.now() - timedelta(seconds=self._retry_time)
-				for viface in vifaces:
-					if viface.last_action < trigger_value:
-						self._logger.info(
-							"State %s of prefix %s timeouted." % (PrefixState.STRINGS[viface.state], viface.prefix))
-						if viface.state in [PrefixState.SOLICITED, PrefixState.REQUESTED]:
-							viface.state = PrefixState.INITIAL
-						elif viface.state in [PrefixState.RENEWING, PrefixState.REBINDING]:
-							viface.state = PrefixState.CONFIRMED
-			except:
-				self._logging.exception('Unexpected error occurred in manager thread')
-
-			# Sleep for one second to avoid CPU load
-			time.sleep(1)
-
-	def handle_packet(self, client_duid, packet):
+			# Process all virtual interfaces whose deadline has been reached
+			self.process_due(self._scheduler.pop_due(self._clock.monotonic()))
+
+			# Sleep until the next deadline or until an incoming packet changed the schedule
+			self._scheduler.wait()
+
+		self.close()
+
+	def close(self):
+		# Flush and close the lease journal once the manager stopped
+		with self._lock:
+			if self._journal is not None:
+				self._journal.close()
+				self._journal = None
+
+	def start_scheduling(self):
+		with self._lock:
+			if self._journal is not None:
+				self._restore_leases()
+			for viface in self._virtual_interfaces:
+				self._reschedule(viface)
+
+	def _restore_leases(self):
+		# Resume all leases which have not expired yet and still belong to the configured prefix
+		try:
+			leases = self._journal.load()
+		except EnvironmentError as e:
+			self._logger.error("Could not load lease journal, leases will not be persisted: %s" % e)
+			self._journal = None
+			return
+
+		now = self._clock.time()
+		restored = 0
+		for viface in self._virtual_interfaces:
+			lease = leases.get((viface.client_duid.packed, viface.iaid))
+			if lease is None or lease.has_expired(now) or lease.prefix_hash != journals.prefix_hash(viface.prefixes):
+				continue
+
+			viface.server_duid = types.Duid(lease.server_duid)
+			viface.confirm(self._clock.from_wall(lease.confirmed_at), lease.t1, lease.t2, lease.expire)
+			viface.last_action = viface.last_confirm
+			viface.state = PrefixState.CONFIRMED
+			restored += 1
+
+		self._logger.info("Restored %d of %d lease(s) from journal" % (restored, len(leases)))
+
+	@profiling.stage('timers')
+	def process_due(self, vifaces):
+		with self._lock:
+			for viface in vifaces:
+				retry_at = None
+				try:
+					retry_at = self._process(viface)
+				except:
+					self._logger.exception('Unexpected error occurred in manager thread')
+
+				# Virtual interfaces which were held back by the rate limiter keep their state
+				if retry_at is not None:
+					self._scheduler.schedule(viface, retry_at)
+				else:
+					self._settle(viface)
+
+			# Send all messages of this run with one batch per physical interface
+			self._flush_physical_interfaces()
+
+	def _process(self, viface):
+		# Returns the time to retry at, if sending a message was deferred by the rate limiter
+		now = self._clock.monotonic()
+
+		# Handle message exchanges which ran out of retransmissions
+		if viface.state in PrefixState.WAITING and viface.exchange.is_exhausted(now):
+			self._logger.info("State %s of prefixes %s timeouted." % (PrefixState.STRINGS[viface.state], viface.format_prefixes()))
+			if viface.state in [PrefixState.SOLICITED, PrefixState.REQUESTED]:
+				viface.state = PrefixState.INITIAL
+			elif viface.state in [PrefixState.RENEWING, PrefixState.REBINDING]:
+				viface.state = PrefixState.CONFIRMED
+			return None
+
+		# Solicit virtual interfaces with a state of INITIAL or WITHDRAWN
+		if viface.state in [PrefixState.INITIAL, PrefixState.WITHDRAWN]:
+			action = self._solicit
+
+		# Request advertised prefixes
+		elif viface.state is PrefixState.ADVERTISED:
+			action = self._request
+
+		# Renew or rebind confirmed prefixes where T1 or T2 has expired
+		elif viface.state is PrefixState.CONFIRMED:
+			if now >= viface.expire_at:
+				self._logger.warning("Unable to renew or rebind prefixes %s - resetting state to initial" %
+					viface.format_prefixes())
+				viface.state = PrefixState.INITIAL
+				return None
+			elif now >= viface.rebind_at:
+				action = self._rebind
+			elif now >= viface.renew_at:
+				action = self._renew
+			else:
+				return None
+
+		# Retransmit messages which were not answered in time
+		elif now >= viface.exchange.next_at:
+			action = self._retransmit
+		else:
+			return None
+
+		# Hold the message back if the physical interface exceeds its transmission rate
+		retry_at = self._pace(viface, now)
+		if retry_at is None:
+			action(viface, now)
+		return retry_at
+
+	def _pace(self, viface, now):
+		# A virtual interface which had to wait already holds a reserved token
+		pacer = viface.physical.pacer
+		if pacer is None or viface.tx_reserved:
+			viface.tx_reserved = False
+			return None
+
+		delay = pacer.reserve()
+		if delay <= 0:
+			return None
+
+		viface.tx_reserved = True
+		return now + delay
+
+	def match_transaction(self, transaction_id, client_duid):
+		return self._transactions.match(transaction_id, client_duid) is not None
+
+	def add_virtual_interfaces(self, vifaces):
+		# Start managing virtual interfaces which were added by a configuration reload
+		with self._lock:
+			for viface in vifaces:
+				self._virtual_interfaces.append(viface)
+				self._vifaces_by_duid[viface.client_duid.packed] = viface
+				viface.state_index = self._states
+				if viface.physical not in self._physical_interfaces:
+					self._physical_interfaces.append(viface.physical)
+				self._reschedule(viface)
+
+	def remove_virtual_interfaces(self, vifaces):
+		# Stop managing virtual interfaces which were removed by a configuration reload, their
+		# leases are forgotten and replies to outstanding transactions get dropped from now on
+		with self._lock:
+			removed = set(vifaces)
+			for viface in vifaces:
+				self._scheduler.cancel(viface)
+				self._transactions.close(viface)
+				if self._journal is not None:
+					self._release_lease(viface)
+				if self._vifaces_by_duid.get(viface.client_duid.packed) is viface:
+					del self._vifaces_by_duid[viface.client_duid.packed]
+				self._states.remove(viface)
+				viface.detach()
+			self._virtual_interfaces = [viface for viface in self._virtual_interfaces if viface not in removed]
+
+	def _settle(self, viface):
+		# Close the transaction once no more replies are expected and schedule the next deadline
+		if viface.state not in PrefixState.WAITING:
+			self._transactions.close(viface)
+		if self._journal is not None and viface.state in [PrefixState.INITIAL, PrefixState.WITHDRAWN]:
+			self._release_lease(viface)
+		self._reschedule(viface)
+
+	def _record_lease(self, viface):
+		try:
+			self._journal.record_lease(journals.Lease(
+				client_duid=viface.client_duid.packed,
+				iaid=viface.iaid,
+				prefix_hash=journals.prefix_hash(viface.prefixes),
+				server_duid=viface.server_duid.packed,
+				t1=int(viface.t1),
+				t2=int(viface.t2),
+				expire=int(viface.expire),
+				confirmed_at=self._clock.to_wall(viface.last_confirm)
+			))
+		except (EnvironmentError, struct.error) as e:
+			self._logger.error("Could not write lease of prefixes %s to journal: %s" % (viface.format_prefixes(), e))
+
+	def _release_lease(self, viface):
+		try:
+			self._journal.record_release(viface.client_duid.packed, viface.iaid)
+		except (EnvironmentError, struct.error) as e:
+			self._logger.error("Could not remove lease of prefixes %s from journal: %s" % (viface.format_prefixes(), e))
+
+	def open_transaction(self, viface, transaction_id):
+		# Only replies to the transaction opened last are accepted, replays open captured ones
+		viface.transaction_id = transaction_id
+		self._transactions.open(viface, transaction_id, viface.client_duid.packed)
+
+	def _begin_transaction(self, viface):
+		self.open_transaction(viface, PacketBuilder.generate_transaction_id())
+
+	def _reschedule(self, viface):
+		if viface.state is PrefixState.CONFIRMED:
+			deadline = viface.renew_at
+		elif viface.state is PrefixState.ADVERTISED:
+			deadline = self._clock.monotonic()
+		elif viface.state in [PrefixState.INITIAL, PrefixState.WITHDRAWN]:
+			# Delay the first SOLICIT message randomly, so that prefixes do not solicit in lockstep
+			deadline = self._clock.monotonic()
+			if viface.last_action is not None:
+				deadline = max(deadline, viface.last_action + self.MIN_SOLICIT_INTERVAL)
+			deadline += retransmission.solicit_delay()
+		else:
+			deadline = viface.exchange.next_at
+
+		self._scheduler.schedule(viface, deadline)
+
+	@profiling.stage('manager')
+	def handle_packet(self, client_duid, message):
 		try:
 			# Try to find virtual interface by client DUID
 			viface = self._get_viface_by_client_duid(client_duid)
 			if viface is None:
-				self._logger.warning("Could not find virtual interface with client DUID %s" % (client_duid))
+				self._dropped['unknown_viface'].inc()
+				self._logger.warning("Could not find virtual interface with client DUID %s" % wire.format_duid(client_duid))
 				return
 
-			# Process packet based on its type
-			if DHCP6_Advertise in packet:
-				self._handle_advertise(viface, packet)
-			elif DHCP6_Reply in packet:
-				self._handle_reply(viface, packet)
+			# Process packet based on its type and wake up the manager thread if required
+			with self._lock:
+				if message.msg_type == wire.ADVERTISE:
+					self._handle_advertise(viface, message)
+				elif message.msg_type == wire.REPLY:
+					self._handle_reply(viface, message)
+				self._settle(viface)
 		except:
-			self._logging.exception('Unexpected error occurred in packet handler')
+			self._logger.exception('Unexpected error occurred in packet handler')
 
-	def _solicit(self, viface):
+	def _solicit(self, viface, now):
 		# Set the state of the virtual interface
 		viface.state = PrefixState.SOLICITED
-		viface.last_action = datetime.now()
+		viface.last_action = now
 
 		# Build and send SOLICIT message
-		viface.transaction_id = PacketBuilder.generate_transaction_id()
-		packet = PacketBuilder.solicit(viface)
-		viface.send(packet)
+		viface.exchange = retransmission.Exchange(wire.SOLICIT, now, self._retry_time)
+		self._begin_transaction(viface)
+		self._transmit(viface, now)
 
 		# Print some debug information
 		self._logger.info("Sent SOLICIT message on virtual interface %s" % viface)
 		self._logger.debug("> Client DUID: %s" % viface.client_duid)
-		self._logger.debug("> Prefix: %s" % viface.prefix)
+		self._logger.debug("> Prefixes: %s" % viface.format_prefixes())
 
-	def _request(self, viface):
+	def _request(self, viface, now):
 		# Set the state of the virtual interface
 		viface.state = PrefixState.REQUESTED
-		viface.last_action = datetime.now()
+		viface.last_action = now
 
 		# Build and send REQUEST message
-		packet = PacketBuilder.request(viface)
-		viface.send(packet)
+		viface.exchange = retransmission.Exchange(wire.REQUEST, now, self._retry_time)
+		self._begin_transaction(viface)
+		self._transmit(viface, now)
 
 		# Print some debug information
 		self._logger.info("Sent REQUEST message on virtual interface %s" % viface)
 		self._logger.debug("> Client DUID: %s" % viface.client_duid)
 		self._logger.debug("> Server DUID: %s" % viface.server_duid)
-		self._logger.debug("> Prefix: %s" % viface.prefix)
+		self._logger.debug("> Prefixes: %s" % viface.format_prefixes())
 		self._logger.debug("> Timeouts: T1=%d, T2=%d, Expire=%d" % (viface.t1, viface.t2, viface.expire))
 
-	def _renew(self, viface):
+	def _renew(self, viface, now):
 		# Set the state of the virtual interface
 		viface.state = PrefixState.RENEWING
-		viface.last_action = datetime.now()
+		viface.last_action = now
 
 		# Build and send RENEW message
-		packet = PacketBuilder.renew(viface)
-		viface.send(packet)
+		viface.exchange = retransmission.Exchange(wire.RENEW, now, self._retry_time, viface.rebind_at)
+		self._begin_transaction(viface)
+		self._transmit(viface, now)
 
 		# Print some debug information
 		self._logger.info("Sent RENEW message on virtual interface %s" % viface)
 		self._logger.debug("> Client DUID: %s" % viface.client_duid)
 		self._logger.debug("> Server DUID: %s" % viface.server_duid)
-		self._logger.debug("> Prefix: %s" % viface.prefix)
+		self._logger.debug("> Prefixes: %s" % viface.format_prefixes())
 		self._logger.debug("> Timeouts: T1=%d, T2=%d, Expire=%d" % (viface.t1, viface.t2, viface.expire))
 
-	def _rebind(self, viface):
+	def _rebind(self, viface, now):
 		# Set the state of the virtual interface
 		viface.state = PrefixState.REBINDING
-		viface.last_action = datetime.now()
+		viface.last_action = now
 
 		# Build and send REBIND message
-		packet = PacketBuilder.rebind(viface)
-		viface.send(packet)
+		viface.exchange = retransmission.Exchange(wire.REBIND, now, self._retry_time, viface.expire_at)
+		self._begin_transaction(viface)
+		self._transmit(viface, now)
 
 		# Print some debug information
 		self._logger.info("Sent REBIND message on virtual interface %s" % viface)
 		self._logger.debug("> Client DUID: %s" % viface.client_duid)
-		self._logger.debug("> Prefix: %s" % viface.prefix)
+		self._logger.debug("> Prefixes: %s" % viface.format_prefixes())
 		self._logger.debug("> Timeouts: T1=%d, T2=%d, Expire=%d" % (viface.t1, viface.t2, viface.expire))
 
-	def _handle_advertise(self, viface, packet):
+	def _retransmit(self, viface, now):
+		viface.last_action = now
+		self._transmit(viface, now)
+
+		self._logger.info("Retransmitted %s message on virtual interface %s (attempt %d)" %
+			(wire.MESSAGE_TYPES[viface.exchange.msg_type], viface, viface.exchange.count))
+
+	def _transmit(self, viface, now):
+		# Retransmissions reuse the transaction id and carry the time elapsed since the first one
+		exchange = viface.exchange
+		viface.send(PacketBuilder.build(viface, exchange.msg_type, exchange.elapsed_time(now)))
+		viface.physical.tx_counter(exchange.msg_type).inc()
+		exchange.transmitted(now)
+
+	def _handle_advertise(self, viface, message):
 		# Drop packet if interface state is incorrect
 		if viface.state is not PrefixState.SOLICITED:
+			self._dropped['unexpected_state'].inc()
 			return
 
 		# Check if packet is valid and contains a prefix
-		if DHCP6OptServerId not in packet:
+		if message.server_duid is None:
+			self._dropped['no_server_id'].inc()
 			self._logger.warning("Dropped ADVERTISE message with invalid options on virtual interface %s" % viface)
-		if DHCP6OptIA_PD not in packet or DHCP6OptIAPrefix not in packet:
+			return
+		if not message.has_ia_pd() or len(message.prefixes) == 0:
 			self._logger.warning("ADVERTISE message on virtual interface %s does not contain any prefixes" % viface)
 			viface.state = PrefixState.INITIAL
 			return
 
 		# Check status code if available
-		if DHCP6OptStatusCode in packet and packet[DHCP6OptStatusCode].statuscode != 0:
-			self._logger.warning("Dropped REPLY message with status: %s" % packet[DHCP6OptStatusCode].statusmsg)
+		if message.status_code not in [None, wire.STATUS_SUCCESS]:
+			self._dropped['bad_status'].inc()
+			self._logger.warning("Dropped ADVERTISE message with status: %s" % message.status_message)
 			return
 
-		# Compare advertised prefix against configured one
-		configured_prefix = str(viface.prefix)
-		announced_prefix = "%s/%d" % (packet[DHCP6OptIAPrefix].prefix, packet[DHCP6OptIAPrefix].plen)
-		if configured_prefix != announced_prefix:
+		# Compare advertised prefixes against configured ones
+		advertised = self._match_prefixes(viface, message)
+		if advertised is None:
 			viface.state = PrefixState.INITIAL
 
-			self._logger.warning("Announced prefix does not match configured prefix!")
+			self._logger.warning("Announced prefixes do not match configured prefixes!")
 			self._logger.info("> Virtual interface: %s" % viface)
-			self._logger.info("> Announced prefix: %s" % announced_prefix)
-			self._logger.info("> Configure prefix: %s" % configured_prefix)
+			self._logger.info("> Announced prefixes: %s" % ', '.join([str(prefix) for prefix in message.prefixes]))
+			self._logger.info("> Configured prefixes: %s" % viface.format_prefixes())
+			return
 
 		# Reset the interface, if T1 is bigger than T2
-		if packet[DHCP6OptIA_PD].T1 > packet[DHCP6OptIA_PD].T2:
+		if message.t1 > message.t2:
 			self._logger.warning("Dropped ADVERTISE message with invalid timeouts: T1=%d, T2=%d" %
-				(packet[DHCP6OptIA_PD].T1, packet[DHCP6OptIA_PD].T2))
+				(message.t1, message.t2))
 			viface.state = PrefixState.INITIAL
+			return
 
-		# If preferred or valid lifetime of prefix is zero, reset the interface state to INITIAL
-		if packet[DHCP6OptIAPrefix].preflft == 0 or packet[DHCP6OptIAPrefix].validlft == 0:
-			self._logger.warning("Dropped ADVERTISE message with invalid lifetime: preflft=%d, validlft=%d" %
-				(packet[DHCP6OptIAPrefix].preflft, packet[DHCP6OptIAPrefix].validlft))
-			viface.state = PrefixState.INITIAL
+		# If preferred or valid lifetime of any prefix is zero, reset the interface state to INITIAL
+		for prefix in advertised:
+			if prefix.preferred_lifetime == 0 or prefix.valid_lifetime == 0:
+				self._logger.warning("Dropped ADVERTISE message with invalid lifetime of prefix %s: preflft=%d, validlft=%d" %
+					(prefix, prefix.preferred_lifetime, prefix.valid_lifetime))
+				viface.state = PrefixState.INITIAL
+				return
 
 		# Change interface state to ADVERTISED
 		viface.state = PrefixState.ADVERTISED
-		viface.server_duid = PacketBuilder.scapy_to_duid(packet[DHCP6OptServerId])
-		viface.t1 = types.DhcpTimeout(packet[DHCP6OptIA_PD].T1)
-		viface.t2 = types.DhcpTimeout(packet[DHCP6OptIA_PD].T2)
-		viface.expire = types.DhcpTimeout(packet[DHCP6OptIA_PD].T2 * self._expire_time_multi)
+		viface.server_duid = types.Duid(message.server_duid)
+		viface.t1 = message.t1
+		viface.t2 = message.t2
+		viface.expire = message.t2 * self._expire_time_multi
 
 		self._logger.info("Received ADVERTISE message on virtual interface %s" % viface)
 		self._logger.debug("> Client DUID: %s" % viface.client_duid)
 		self._logger.debug("> Server DUID: %s" % viface.server_duid)
-		self._logger.debug("> Prefix: %s" % viface.prefix)
+		self._logger.debug("> Prefixes: %s" % viface.format_prefixes())
 
-	def _handle_reply(self, viface, packet):
+	def _handle_reply(self, viface, message):
 		# Drop packet if interface state is incorrect
 		if viface.state not in [PrefixState.REQUESTED, PrefixState.RENEWING, PrefixState.REBINDING]:
+			self._dropped['unexpected_state'].inc()
 			return
 
 		# Check if packet is valid
-		if DHCP6OptServerId not in packet:
+		if message.server_duid is None:
+			self._dropped['no_server_id'].inc()
 			self._logger.warning("Dropped REPLY message with invalid options on virtual interface %s" % viface)
+			return
 
 		# Drop message if server DUID does not match stored one
 		# Exception: When interface is in state REBINDING, accept any server DUID
-		server_duid = PacketBuilder.scapy_to_duid(packet[DHCP6OptServerId])
 		if viface.state is PrefixState.REBINDING:
-			viface.server_duid = PacketBuilder.scapy_to_duid(packet[DHCP6OptServerId])
-		else:
-			if str(server_duid) != str(viface.server_duid):
-				self._logger.debug("Dropped REPLY message from unknown server DUID: %s" % server_duid)
-				return
+			viface.server_duid = types.Duid(message.server_duid)
+		elif viface.server_duid != message.server_duid:
+			self._dropped['unknown_server'].inc()
+			self._logger.debug("Dropped REPLY message from unknown server DUID: %s" % wire.format_duid(message.server_duid))
+			return
 
 		# Check status code if available
-		if DHCP6OptStatusCode in packet and packet[DHCP6OptStatusCode].statuscode != 0:
-			self._logger.warning("Dropped REPLY message with status: %s" % packet[DHCP6OptStatusCode].statusmsg)
+		if message.status_code not in [None, wire.STATUS_SUCCESS]:
+			self._dropped['bad_status'].inc()
+			self._logger.warning("Dropped REPLY message with status: %s" % message.status_message)
 			return
 
 		# Drop message and reset interface state to INITIAL if no prefix was confirmed
 		# Exception: When interface is in state REBINDING, reset the state to WITHDRAWN
-		if DHCP6OptIA_PD not in packet or DHCP6OptIAPrefix not in packet:
+		if not message.has_ia_pd() or len(message.prefixes) == 0:
 			self._logger.warning("REPLY message on virtual interface %s did not confirm any prefixes" % viface)
 			if viface.state is not PrefixState.REBINDING:
 				viface.state = PrefixState.INITIAL
 			else:
 				viface.state = PrefixState.WITHDRAWN
-				self._logger.warning("Prefix %s was marked as withdrawn by server" % viface.prefix)
+				self._logger.warning("Prefixes %s were marked as withdrawn by server" % viface.format_prefixes())
 			return
 
-		# Compare confirmed prefix against configured one
-		configured_prefix = str(viface.prefix)
-		confirmed_prefix = "%s/%d" % (packet[DHCP6OptIAPrefix].prefix, packet[DHCP6OptIAPrefix].plen)
-		if configured_prefix != confirmed_prefix:
+		# Compare confirmed prefixes against configured ones
+		confirmed = self._match_prefixes(viface, message)
+		if confirmed is None:
 			viface.state = PrefixState.INITIAL
 
-			self._logger.warning("Confirmed prefix does not match configured prefix!")
+			self._logger.warning("Confirmed prefixes do not match configured prefixes!")
 			self._logger.info("> Virtual interface: %s" % viface)
-			self._logger.info("> Confirmed prefix: %s" % confirmed_prefix)
-			self._logger.info("> Configure prefix: %s" % configured_prefix)
+			self._logger.info("> Confirmed prefixes: %s" % ', '.join([str(prefix) for prefix in message.prefixes]))
+			self._logger.info("> Configured prefixes: %s" % viface.format_prefixes())
+			return
 
 		# Reset the interface, if T1 is bigger than T2
-		if packet[DHCP6OptIA_PD].T1 > packet[DHCP6OptIA_PD].T2:
-			self._logger.warning("Dropped REPLY message with invalid timeouts: T1=%d, T2=%d" %
-				(packet[DHCP6OptIA_PD].T1, packet[DHCP6OptIA_PD].T2))
+		if message.t1 > message.t2:
+			self._logger.warning("Dropped REPLY message with invalid timeouts: T1=%d, T2=%d" % (message.t1, message.t2))
 			viface.state = PrefixState.INITIAL
+			return
 
-		# If preferred or valid lifetime of prefix is zero, set the interface state to WITHDRAWN
-		if packet[DHCP6OptIAPrefix].preflft == 0 or packet[DHCP6OptIAPrefix].validlft == 0:
-			self._logger.warning("Prefix %s was marked as withdrawn by server" % viface.prefix)
-			viface.state = PrefixState.WITHDRAWN
+		# If preferred or valid lifetime of any prefix is zero, set the interface state to WITHDRAWN
+		for prefix in confirmed:
+			if prefix.preferred_lifetime == 0 or prefix.valid_lifetime == 0:
+				self._logger.warning("Prefix %s was marked as withdrawn by server" % prefix)
+				viface.state = PrefixState.WITHDRAWN
+				return
 
 		# If T1 and/or T2 were not set, calculate timeout values base on RFC3633
-		if packet[DHCP6OptIA_PD].T1 == 0 or packet[DHCP6OptIA_PD].T2 == 0:
-			packet[DHCP6OptIA_PD].T1 = packet[DHCP6OptIAPrefix].preflft * 0.5
-			packet[DHCP6OptIA_PD].T2 = packet[DHCP6OptIAPrefix].preflft * 0.8
+		(t1, t2) = message.t1, message.t2
+		if t1 == 0 or t2 == 0:
+			preferred_lifetime = min([prefix.preferred_lifetime for prefix in confirmed])
+			t1 = preferred_lifetime * 0.5
+			t2 = preferred_lifetime * 0.8
 
 		# Change interface state to CONFIRMED
 		viface.state = PrefixState.CONFIRMED
-		viface.last_confirm = datetime.now()
-		viface.t1 = types.DhcpTimeout(packet[DHCP6OptIA_PD].T1)
-		viface.t2 = types.DhcpTimeout(packet[DHCP6OptIA_PD].T2)
-		viface.expire = types.DhcpTimeout(packet[DHCP6OptIA_PD].T2 * self._expire_time_multi)
+		viface.confirm(self._clock.monotonic(), t1, t2, t2 * self._expire_time_multi)
+		if self._journal is not None:
+			self._record_lease(viface)
 
 		self._logger.info("Received REPLY message on virtual interface %s" % viface)
 		self._logger.debug("> Client DUID: %s" % viface.client_duid)
 		self._logger.debug("> Server DUID: %s" % viface.server_duid)
-		self._logger.debug("> Prefix: %s" % viface.prefix)
+		self._logger.debug("> Prefixes: %s" % viface.format_prefixes())
 		self._logger.debug("> Timeouts: T1=%d, T2=%d, Expire=%d" % (viface.t1, viface.t2, viface.expire))
+		self._logger.debug("> Renew at: %s, Rebind at: %s, Expire at: %s" % (self._clock.format(viface.renew_at),
+			self._clock.format(viface.rebind_at), self._clock.format(viface.expire_at)))
+
+	def _match_prefixes(self, viface, message):
+		# Returns the IA prefixes of a message in the order of the configured prefixes or None,
+		# if the server did not include or rejected any of the configured prefixes
+		received = dict([((prefix.address, prefix.length), prefix) for prefix in message.prefixes
+			if prefix.status_code in [None, wire.STATUS_SUCCESS]])
+		matched = [received.get(prefix.key) for prefix in viface.prefixes]
+		return None if None in matched else matched
+
+	def _flush_physical_interfaces(self):
+		for physical in self._physical_interfaces:
+			try:
+				physical.flush()
+			except EnvironmentError as e:
+				self._logger.error("Could not send messages on interface %s: %s" % (physical, e))
 
-	def _get_viface_by_client_duid(self, client_duid):
-		for viface in self._virtual_interfaces:
-			if str(viface.client_duid) == str(client_duid):
-				return viface
-		return None
+	def get_viface_by_states(self, states):
+		with self._lock:
+			return [viface for state in states for viface in self._states.get(state)]
 
-	def _get_viface_by_states(self, states):
-		return [viface for viface in self._virtual_interfaces if viface.state in states]
+	def stats(self):
+		return dict([(state, len(self._states.get(state))) for state in PrefixState.STRINGS])
 
+	def transaction_stats(self):
+		return self._transactions.stats()
 
-class PacketBuilder(object):
-	@staticmethod
-	def solicit(viface):
-		ether_head = PacketBuilder.build_ether_head(viface.physical)
-		iapdopt = [DHCP6OptIAPrefix(prefix=str(viface.prefix.address), plen=int(viface.prefix.length))]
-
-		packet = ether_head / DHCP6_Solicit(trid=int(viface.transaction_id))
-		packet = packet / DHCP6OptClientId(duid=PacketBuilder.duid_to_scapy(viface.client_duid))
-		packet = packet / DHCP6OptIA_PD(iaid=int(viface.iaid), iapdopt=iapdopt)
-		packet = packet / DHCP6OptElapsedTime()
+	def _get_viface_by_client_duid(self, client_duid):
+		return self._vifaces_by_duid.get(client_duid)
 
-		return packet
 
+class PacketBuilder(object):
 	@staticmethod
-	def request(viface):
-		ether_head = PacketBuilder.build_ether_head(viface.physical)
-		iapdopt = [DHCP6OptIAPrefix(prefix=str(viface.prefix.address), plen=int(viface.prefix.length))]
-
-		packet = ether_head / DHCP6_Request(trid=int(viface.transaction_id))
-		packet = packet / DHCP6OptClientId(duid=PacketBuilder.duid_to_scapy(viface.client_duid))
-		packet = packet / DHCP6OptServerId(duid=PacketBuilder.duid_to_scapy(viface.server_duid))
-		packet = packet / DHCP6OptIA_PD(iaid=int(viface.iaid), T1=int(viface.t1), T2=int(viface.t2), iapdopt=iapdopt)
-		packet = packet / DHCP6OptElapsedTime()
-
-		return packet
+	@profiling.stage('build')
+	def build(viface, msg_type, elapsed_time=0):
+		if msg_type in [wire.REQUEST, wire.RENEW]:
+			return viface.get_template(msg_type).render(int(viface.transaction_id), elapsed_time,
+				int(viface.t1), int(viface.t2))
+		return viface.get_template(msg_type).render(int(viface.transaction_id), elapsed_time)
 
 	@staticmethod
-	def renew(viface):
-		ether_head = PacketBuilder.build_ether_head(viface.physical)
-		iapdopt = [DHCP6OptIAPrefix(prefix=str(viface.prefix.address), plen=int(viface.prefix.length))]
-
-		packet = ether_head / DHCP6_Renew(trid=int(viface.transaction_id))
-		packet = packet / DHCP6OptClientId(duid=PacketBuilder.duid_to_scapy(viface.client_duid))
-		packet = packet / DHCP6OptServerId(duid=PacketBuilder.duid_to_scapy(viface.server_duid))
-		packet = packet / DHCP6OptIA_PD(iaid=int(viface.iaid), T1=int(viface.t1), T2=int(viface.t2), iapdopt=iapdopt)
-		packet = packet / DHCP6OptElapsedTime()
-
-		return packet
+	def solicit(viface, elapsed_time=0):
+		return PacketBuilder.build(viface, wire.SOLICIT, elapsed_time)
 
 	@staticmethod
-	def rebind(viface):
-		ether_head = PacketBuilder.build_ether_head(viface.physical)
-		iapdopt = [DHCP6OptIAPrefix(prefix=str(viface.prefix.address), plen=int(viface.prefix.length))]
-
-		packet = ether_head / DHCP6_Rebind(trid=int(viface.transaction_id))
-		packet = packet / DHCP6OptClientId(duid=PacketBuilder.duid_to_scapy(viface.client_duid))
-		packet = packet / DHCP6OptIA_PD(iaid=int(viface.iaid), iapdopt=iapdopt)
-		packet = packet / DHCP6OptElapsedTime()
-
-		return packet
+	def request(viface, elapsed_time=0):
+		return PacketBuilder.build(viface, wire.REQUEST, elapsed_time)
 
 	@staticmethod
-	def build_ether_head(interface):
-		ether_head = Ether(src=str(interface.mac), dst='33:33:00:01:00:02')
-		ether_head = ether_head / IPv6(src=str(interface.ip), dst='ff02::1:2')
-		ether_head = ether_head / UDP(sport=546, dport=547)
-
-		return ether_head
+	def renew(viface, elapsed_time=0):
+		return PacketBuilder.build(viface, wire.RENEW, elapsed_time)
 
 	@staticmethod
-	def duid_to_scapy(duid):
-		duid = str(duid)
-		duid_type = int(duid[0:5].replace(':', ''), 16)
-		hw_type = int(duid[6:11].replace(':', ''), 16)
-
-		if duid_type is 1:
-			timeval = int(duid[12:23].replace(':', ''), 16)
-			lladdr = duid[24:]
-			return DUID_LLT(hwtype=hw_type, timeval=timeval, lladdr=lladdr)
-		elif duid_type is 3:
-			lladdr = duid[12:]
-			return DUID_LL(hwtype=hw_type, lladdr=lladdr)
+	def rebind(viface, elapsed_time=0):
+		return PacketBuilder.build(viface, wire.REBIND, elapsed_time)
 
 	@staticmethod
-	def scapy_to_duid(serverid_opt):
-		return types.DeviceID(':'.join([hex(x)[2:].zfill(2) for x in map(ord, str(serverid_opt.duid))]))
+	def build_template(viface, msg_type):
+		# Only REQUEST and RENEW messages are directed to a specific server
+		server_duid = None
+		if msg_type in [wire.REQUEST, wire.RENEW]:
+			server_duid = viface.server_duid.packed
+
+		return wire.build_template(
+			msg_type=msg_type,
+			src_mac=viface.physical.mac.packed,
+			src_ip=viface.physical.ip.packed,
+			client_duid=viface.client_duid.packed,
+			server_duid=server_duid,
+			iaid=viface.iaid,
+			prefixes=[prefix.key for prefix in viface.prefixes]
+		)
 
 	@staticmethod
 	def generate_transaction_id():
-		return types.TransactionID(random.randint(0x000000, 0xffffff))
+		return random.randint(0x000000, 0xffffff)
 
 
 class Interface(object):
 	last_action = None
 	transaction_id = None
 
-	def __init__(self, name, mac, ip):
+	def __init__(self, name, mac, ip, tx_rate=0, tx_burst=1):
 		# Validate and amend interface options
 		self.validate_iface_name(name)
 		mac = self.get_iface_mac(name) if mac is None else mac
@@ -415,40 +715,152 @@ class Interface(object):
 
 		# Assign interface options
 		self.name = types.InterfaceName(name)
-		self.mac = types.MacAdress(mac)
-		self.ip = types.Ipv6Address(ip)
+		self.mac = types.MacAddress(mac)
+		self.ip = ipaddress.IPv6Address(ip)
+
+		# Long-lived send socket which gets opened on first use, frames queued with
+		# enqueue() are sent as one batch when calling flush()
+		self._socket = None
+		self._pending = []
+		self.pacer = network.TokenBucket(tx_rate, tx_burst) if tx_rate > 0 else None
+		self.tx_packets = 0
+		self.tx_bytes = 0
+		self.tx_batches = 0
+		self.tx_syscalls = 0
+		self.tx_errors = 0
+		self.tx_max_batch_size = 0
+
+		# Metric children per message type, so that counting messages skips the label lookup
+		self._rx_counters = dict()
+		self._tx_counters = dict()
 
 	def __str__(self):
 		return str(self.name)
 
+	def rx_counter(self, msg_type):
+		counter = self._rx_counters.get(msg_type)
+		if counter is None:
+			counter = self._rx_counters[msg_type] = metrics.RX_PACKETS.child(str(self.name),
+				wire.MESSAGE_TYPES.get(msg_type, 'unknown'))
+		return counter
+
+	def tx_counter(self, msg_type):
+		counter = self._tx_counters.get(msg_type)
+		if counter is None:
+			counter = self._tx_counters[msg_type] = metrics.TX_PACKETS.child(str(self.name),
+				wire.MESSAGE_TYPES[msg_type])
+		return counter
+
 	def send(self, packet):
-		sendp(packet, iface=str(self.name), verbose=False)
+		self.enqueue(packet)
+		self.flush()
+
+	def enqueue(self, packet):
+		self._pending.append(packet)
+		if len(self._pending) >= network.SendSocket.MAX_BATCH_SIZE:
+			self.flush()
+
+	@profiling.stage('send')
+	def flush(self):
+		if len(self._pending) == 0:
+			return
+
+		(frames, self._pending) = self._pending, []
+		try:
+			syscalls = self._send_frames(frames)
+		except EnvironmentError:
+			self.tx_errors += len(frames)
+			raise
+
+		self.tx_packets += len(frames)
+		self.tx_bytes += sum([len(frame) for frame in frames])
+		self.tx_batches += 1
+		self.tx_syscalls += syscalls
+		self.tx_max_batch_size = max(self.tx_max_batch_size, len(frames))
+
+	def stats(self):
+		return {
+			'packets': self.tx_packets,
+			'bytes': self.tx_bytes,
+			'batches': self.tx_batches,
+			'syscalls': self.tx_syscalls,
+			'errors': self.tx_errors,
+			'max_batch_size': self.tx_max_batch_size,
+			'deferred': self.pacer.deferred if self.pacer is not None else 0
+		}
+
+	def _send_frames(self, frames):
+		if self._socket is None:
+			try:
+				self._socket = network.SendSocket(self)
+			except (AttributeError, EnvironmentError):
+				self._socket = False
+
+		# Send every frame through scapy if raw AF_PACKET sockets are not available
+		if self._socket is False:
+			from scapy.packet import Raw
+			from scapy.sendrecv import sendp
+			for frame in frames:
+				sendp(Raw(load=frame), iface=str(self.name), verbose=False)
+			return len(frames)
 
+		return self._socket.send_batch(frames)
+
+	# Interfaces are looked up in a single rtnetlink dump shared by all interfaces
 	@staticmethod
 	def validate_iface_name(name):
-		if name not in get_if_list():
+		links = netlink.get_links()
+		if links is None:
+			from scapy.arch import get_if_list
+			links = get_if_list()
+		if name not in links:
 			raise EnvironmentError("Could not find interface %s" % name)
 
 	@staticmethod
 	def get_iface_mac(name):
-		return get_if_hwaddr(name)
+		links = netlink.get_links()
+		if links is None:
+			from scapy.arch import get_if_hwaddr
+			return get_if_hwaddr(name)
+		return links[name].mac if name in links else None
 
 	@staticmethod
 	def get_iface_lladdr(name):
+		links = netlink.get_links()
+		if links is not None:
+			return links[name].lladdr if name in links else None
+
+		# Only supported by scapy on UNIX systems
+		try:
+			from scapy.arch import in6_getifaddr
+		except ImportError:
+			return None
 		for addr, _, iface in in6_getifaddr():
 			if iface == name and addr.startswith('fe80::'):
 				return addr
 
 
 class Prefix(object):
+	__slots__ = ('interface', 'duid', 'network', 'key')
+
 	def __init__(self, interface, duid, address, length):
 		self.interface = types.InterfaceName(interface)
-		self.duid = types.DeviceID(duid)
-		self.address = types.Ipv6Address(address)
-		self.length = types.Ipv6PrefixLength(length)
+		self.duid = types.Duid(duid)
+		self.network = ipaddress.IPv6Network((address, int(types.Ipv6PrefixLength(length))))
+
+		# Packed address and length, as found in the IA prefix options of received messages
+		self.key = (self.network.network_address.packed, self.network.prefixlen)
 
 	def __str__(self):
-		return "%s/%d" % (self.address, int(self.length))
+		return str(self.network)
+
+	@property
+	def address(self):
+		return self.network.network_address
+
+	@property
+	def length(self):
+		return self.network.prefixlen
 
 	def get_address(self):
 		return self.address
@@ -458,39 +870,184 @@ class Prefix(object):
 
 
 class VirtualInterface(object):
-	def __init__(self, iaid, client_duid, prefix, physical, logger=None):
-		# Assign default properties
-		self._state = PrefixState.INITIAL
-		self.last_action = None
-		self.last_confirm = None
-		self.transaction_id = None
-		self.server_duid = None
-		self.t1 = None
-		self.t2 = None
-		self.expire = None
-		self._logger = logger
+	# Thin view onto one row of a LeaseTable, which keeps the state of all virtual interfaces
+	# in typed arrays instead of one attribute dict per virtual interface
+	__slots__ = ('_table', '_row')
+
+	def __init__(self, iaid, client_duid, prefixes, physical, logger=None, table=None):
+		self._table = table if table is not None else leasetable.LeaseTable()
+		if logger is not None:
+			self._table.logger = logger
 
-		# Assign user-defined properties
-		self.iaid = types.InterfaceID(iaid)
-		self.client_duid = client_duid
-		self.prefix = prefix
-		self.physical = physical
+		# Assign user-defined properties, all other properties start unset
+		iaid = types.InterfaceID(iaid)
+		if not isinstance(client_duid, types.Duid):
+			client_duid = types.Duid(store.normalize_duid(client_duid))
+		self._row = self._table.add(self, int(iaid), client_duid, prefixes, physical)
 
 	def __str__(self):
-		return "%s[%d]" % (self.physical.name, int(self.iaid))
+		return "%s[%d]" % (self.physical.name, self.iaid)
 
 	def send(self, packet):
-		return self.physical.send(packet)
+		return self.physical.enqueue(packet)
+
+	def detach(self):
+		# Release the row of a virtual interface which is no longer managed, the view must not be used afterwards
+		self._table.remove(self._row)
+
+	def format_prefixes(self):
+		return ', '.join([str(prefix) for prefix in self.prefixes])
+
+	def get_template(self, msg_type):
+		templates = self._table.templates[self._row]
+		if templates is None:
+			templates = self._table.templates[self._row] = {}
+
+		template = templates.get(msg_type)
+		if template is None:
+			template = templates[msg_type] = PacketBuilder.build_template(self, msg_type)
+		return template
+
+	@property
+	def iaid(self):
+		return self._table.iaids[self._row]
+
+	@property
+	def client_duid(self):
+		return self._table.client_duids[self._row]
+
+	@property
+	def prefixes(self):
+		return self._table.prefixes[self._row]
+
+	@property
+	def physical(self):
+		return self._table.physical(self._row)
+
+	@property
+	def transaction_id(self):
+		value = self._table.transaction_ids[self._row]
+		return value if value >= 0 else None
+
+	@transaction_id.setter
+	def transaction_id(self, value):
+		self._table.transaction_ids[self._row] = int(value) if value is not None else -1
+
+	@property
+	def exchange(self):
+		return self._table.exchanges[self._row]
+
+	@exchange.setter
+	def exchange(self, value):
+		self._table.exchanges[self._row] = value
+
+	@property
+	def tx_reserved(self):
+		return bool(self._table.flags[self._row])
+
+	@tx_reserved.setter
+	def tx_reserved(self, value):
+		self._table.flags[self._row] = 1 if value else 0
+
+	@property
+	def last_action(self):
+		return self._get(self._table.action_at)
+
+	@last_action.setter
+	def last_action(self, value):
+		self._set(self._table.action_at, value)
+
+	@property
+	def last_confirm(self):
+		return self._get(self._table.confirmed_at)
+
+	@property
+	def t1(self):
+		return self._get(self._table.t1)
+
+	@t1.setter
+	def t1(self, value):
+		self._set(self._table.t1, value)
+
+	@property
+	def t2(self):
+		return self._get(self._table.t2)
+
+	@t2.setter
+	def t2(self, value):
+		self._set(self._table.t2, value)
+
+	@property
+	def expire(self):
+		return self._get(self._table.expire)
+
+	@expire.setter
+	def expire(self, value):
+		self._set(self._table.expire, value)
+
+	@property
+	def renew_at(self):
+		return self._get(self._table.renew_at)
+
+	@property
+	def rebind_at(self):
+		return self._get(self._table.rebind_at)
+
+	@property
+	def expire_at(self):
+		return self._get(self._table.expire_at)
+
+	def confirm(self, now, t1, t2, expire):
+		# Store the timeouts of a confirmed lease together with their absolute deadlines
+		(self.t1, self.t2, self.expire) = t1, t2, expire
+		self._set(self._table.confirmed_at, now)
+		self._set(self._table.renew_at, now + t1)
+		self._set(self._table.rebind_at, now + t2)
+		self._set(self._table.expire_at, now + expire)
+
+	@property
+	def server_duid(self):
+		return self._table.server_duid(self._row)
+
+	@server_duid.setter
+	def server_duid(self, value):
+		# Cached templates of directed messages contain the server DUID
+		templates = self._table.templates[self._row]
+		if templates is not None and value != self.server_duid:
+			templates.pop(wire.REQUEST, None)
+			templates.pop(wire.RENEW, None)
+		self._table.set_server_duid(self._row, value)
+
+	@property
+	def state_index(self):
+		return self._table.state_index
+
+	@state_index.setter
+	def state_index(self, index):
+		self._table.state_index = index
+		index.add(self)
 
 	@property
 	def state(self):
-		return self._state
+		return self._table.states[self._row]
 
 	@state.setter
 	def state(self, value):
-		if self._logger is not None:
+		logger = self._table.logger
+		if logger is not None:
 			if value in [PrefixState.CONFIRMED, PrefixState.RENEWING, PrefixState.REBINDING, PrefixState.WITHDRAWN]:
-				self._logger.info("State of prefix %s has changed to: %s" % (self.prefix, PrefixState.STRINGS[value]))
+				logger.info("State of prefixes %s has changed to: %s" %
+					(self.format_prefixes(), PrefixState.STRINGS[value]))
 			else:
-				self._logger.debug("State of prefix %s has changed to: %s" % (self.prefix, PrefixState.STRINGS[value]))
-		self._state = value
\ No newline at end of file
+				logger.debug("State of prefixes %s has changed to: %s" %
+					(self.format_prefixes(), PrefixState.STRINGS[value]))
+		if self._table.state_index is not None:
+			self._table.state_index.move(self, self.state, value)
+		self._table.states[self._row] = value
+
+	def _get(self, column):
+		value = column[self._row]
+		return value if value == value else None
+
+	def _set(self, column, value):
+		column[self._row] = value if value is not None else leasetable.UNSET
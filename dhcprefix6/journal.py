@@ -0,0 +1,177 @@
+import mmap
+import os
+import struct
+import time
+import zlib
+
+# Record kinds
+LEASE = 1
+RELEASE = 2
+
+# RFC 8415 infinity for timeouts and lifetimes, larger timeouts (like an expire time derived from an
+# infinite T2) are stored as infinity as well
+INFINITY = 0xffffffff
+
+
+class Lease(object):
+	__slots__ = ('client_duid', 'iaid', 'prefix_hash', 'server_duid', 't1', 't2', 'expire', 'confirmed_at')
+
+	def __init__(self, client_duid, iaid, prefix_hash, server_duid, t1, t2, expire, confirmed_at):
+		(self.client_duid, self.iaid, self.prefix_hash) = client_duid, iaid, prefix_hash
+		(self.server_duid, self.t1, self.t2, self.expire) = server_duid, t1, t2, expire
+		self.confirmed_at = confirmed_at
+
+	def key(self):
+		return self.client_duid, self.iaid
+
+	def has_expired(self, now):
+		return now >= self.confirmed_at + self.expire
+
+
+class LeaseJournal(object):
+	# Append-only journal of fixed-size records. Every record carries a CRC32, so records which
+	# were torn by a crash are ignored when loading. Once the journal contains far more records
+	# than live leases, it gets compacted into a new file which atomically replaces the old one.
+	MAGIC = b'DP6J'
+	HEADER_FORMAT = '<4sI'
+	BODY_FORMAT = '<QBIIIIIdB130sB130s'
+	RECORD_SIZE = 320
+	COMPACT_RATIO = 4
+	COMPACT_MIN = 1024
+	SYNC_INTERVAL = 1
+
+	def __init__(self, path, logger):
+		(self._path, self._logger) = path, logger
+		self._fd = None
+		self._sequence = 0
+		self._records = 0
+		self._leases = dict()
+		self._synced_at = 0
+
+	def load(self):
+		# Replay all valid records, the record with the highest sequence number wins
+		self._leases = dict()
+		self._records = 0
+		if os.path.exists(self._path) and os.path.getsize(self._path) >= self.RECORD_SIZE:
+			with open(self._path, 'rb') as journal_file:
+				data = mmap.mmap(journal_file.fileno(), 0, access=mmap.ACCESS_READ)
+				try:
+					sequences = dict()
+					for offset in range(0, len(data) - self.RECORD_SIZE + 1, self.RECORD_SIZE):
+						record = self._unpack(data, offset)
+						if record is None:
+							continue
+
+						(sequence, kind, lease) = record
+						self._records += 1
+						self._sequence = max(self._sequence, sequence)
+						if sequences.get(lease.key(), -1) > sequence:
+							continue
+
+						sequences[lease.key()] = sequence
+						if kind == LEASE:
+							self._leases[lease.key()] = lease
+						else:
+							self._leases.pop(lease.key(), None)
+				finally:
+					data.close()
+
+		self._open()
+		return self._leases
+
+	def get(self, client_duid, iaid):
+		return self._leases.get((client_duid, iaid))
+
+	def record_lease(self, lease):
+		# Pack the record first, so that a lease which can not be written does not break compaction
+		record = self._pack(self._sequence + 1, LEASE, lease)
+		self._leases[lease.key()] = lease
+		self._append(record)
+
+	def record_release(self, client_duid, iaid):
+		lease = self._leases.pop((client_duid, iaid), None)
+		if lease is not None:
+			self._append(self._pack(self._sequence + 1, RELEASE, lease))
+
+	def compact(self):
+		# Write all live leases into a temporary file, which then replaces the journal
+		temp_path = self._path + '.tmp'
+		fd = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+		try:
+			for lease in self._leases.values():
+				self._sequence += 1
+				os.write(fd, self._pack(self._sequence, LEASE, lease))
+			os.fsync(fd)
+		finally:
+			os.close(fd)
+
+		os.rename(temp_path, self._path)
+		self._sync_directory()
+		self._records = len(self._leases)
+		self._open()
+		self._logger.debug("Compacted lease journal %s to %d record(s)" % (self._path, self._records))
+
+	def sync(self):
+		if self._fd is not None:
+			os.fsync(self._fd)
+			self._synced_at = time.time()
+
+	def close(self):
+		if self._fd is not None:
+			self.sync()
+			os.close(self._fd)
+			self._fd = None
+
+	def _open(self):
+		self.close()
+		self._fd = os.open(self._path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o600)
+
+		# Cut off a torn record at the end, so that new records stay aligned
+		size = os.fstat(self._fd).st_size
+		if size % self.RECORD_SIZE != 0:
+			os.ftruncate(self._fd, size - size % self.RECORD_SIZE)
+
+	def _append(self, record):
+		self._sequence += 1
+		self._records += 1
+		os.write(self._fd, record)
+
+		# Written records survive a crash of the process, flushing them to disk is rate-limited
+		if time.time() - self._synced_at >= self.SYNC_INTERVAL:
+			self.sync()
+		if self._records > self.COMPACT_RATIO * len(self._leases) + self.COMPACT_MIN:
+			self.compact()
+
+	def _pack(self, sequence, kind, lease):
+		(t1, t2, expire) = [min(int(value), INFINITY) for value in (lease.t1, lease.t2, lease.expire)]
+		body = struct.pack(self.BODY_FORMAT, sequence, kind, lease.iaid, lease.prefix_hash,
+			t1, t2, expire, lease.confirmed_at, len(lease.client_duid), lease.client_duid,
+			len(lease.server_duid), lease.server_duid)
+		body = body.ljust(self.RECORD_SIZE - 8, b'\0')
+		return struct.pack(self.HEADER_FORMAT, self.MAGIC, zlib.crc32(body) & 0xffffffff) + body
+
+	def _unpack(self, data, offset):
+		(magic, checksum) = struct.unpack_from(self.HEADER_FORMAT, data, offset)
+		body = data[offset + 8:offset + self.RECORD_SIZE]
+		if magic != self.MAGIC or checksum != zlib.crc32(body) & 0xffffffff:
+			return None
+
+		(sequence, kind, iaid, prefix_hash, t1, t2, expire, confirmed_at, client_duid_length, client_duid,
+			server_duid_length, server_duid) = struct.unpack_from(self.BODY_FORMAT, body)
+		lease = Lease(client_duid[:client_duid_length], iaid, prefix_hash, server_duid[:server_duid_length],
+			t1, t2, expire, confirmed_at)
+		return sequence, kind, lease
+
+	def _sync_directory(self):
+		try:
+			fd = os.open(os.path.dirname(os.path.abspath(self._path)), os.O_RDONLY)
+		except OSError:
+			return
+		try:
+			os.fsync(fd)
+		finally:
+			os.close(fd)
+
+
+def prefix_hash(prefixes):
+	return zlib.crc32(','.join([str(prefix) for prefix in prefixes]).encode('ascii')) & 0xffffffff
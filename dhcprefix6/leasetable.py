@@ -0,0 +1,113 @@
+import array
+
+# Marker for unset float columns, NaN never compares true against any deadline
+UNSET = float('nan')
+
+# State of rows whose virtual interface was removed, which never matches any queried state
+REMOVED = 0xff
+
+
+class LeaseTable(object):
+	# State of all virtual interfaces as a struct of arrays: every virtual interface is one row,
+	# scalar fields are stored in typed arrays. Client DUIDs are kept as the Duid objects of the
+	# configured prefixes, values which are shared by many rows (server DUIDs, physical interfaces)
+	# are interned.
+	def __init__(self, logger=None):
+		self.logger = logger
+		self.state_index = None
+		self.views = []
+
+		# Scalar columns
+		self.states = array.array('B')
+		self.flags = array.array('B')
+		self.iaids = array.array('I')
+		self.transaction_ids = array.array('i')
+		self.t1 = array.array('d')
+		self.t2 = array.array('d')
+		self.expire = array.array('d')
+
+		# Absolute monotonic times, deadlines are calculated once when a lease gets confirmed
+		self.confirmed_at = array.array('d')
+		self.action_at = array.array('d')
+		self.renew_at = array.array('d')
+		self.rebind_at = array.array('d')
+		self.expire_at = array.array('d')
+
+		# Client DUIDs, which are shared with the prefixes instead of being built on every access
+		self.client_duids = []
+
+		# Interned values referenced by index, -1 means unset
+		self.server_ids = array.array('i')
+		self.server_duids = []
+		self._server_index = dict()
+		self.physical_ids = array.array('H')
+		self.interfaces = []
+		self._interface_index = dict()
+
+		# Columns holding Python objects which are only set for some rows
+		self.prefixes = []
+		self.exchanges = []
+		self.templates = []
+
+	def __len__(self):
+		return len(self.views)
+
+	def add(self, view, iaid, client_duid, prefixes, physical):
+		row = len(self.views)
+		self.views.append(view)
+
+		self.states.append(0)
+		self.flags.append(0)
+		self.iaids.append(iaid)
+		self.transaction_ids.append(-1)
+		for column in [self.t1, self.t2, self.expire, self.confirmed_at, self.action_at, self.renew_at,
+				self.rebind_at, self.expire_at]:
+			column.append(UNSET)
+
+		self.client_duids.append(client_duid)
+
+		self.server_ids.append(-1)
+		self.physical_ids.append(self._intern_interface(physical))
+		self.prefixes.append(list(prefixes))
+		self.exchanges.append(None)
+		self.templates.append(None)
+		return row
+
+	def remove(self, row):
+		# Rows are not reused, so that views and indexes of other rows stay valid. Only the
+		# Python objects of the row are released, its scalar columns stay allocated.
+		self.views[row] = None
+		self.states[row] = REMOVED
+		self.transaction_ids[row] = -1
+		self.server_ids[row] = -1
+		self.prefixes[row] = []
+		self.exchanges[row] = None
+		self.templates[row] = None
+
+	def client_duid(self, row):
+		return self.client_duids[row]
+
+	def server_duid(self, row):
+		index = self.server_ids[row]
+		return self.server_duids[index] if index >= 0 else None
+
+	def set_server_duid(self, row, server_duid):
+		if server_duid is None:
+			self.server_ids[row] = -1
+			return
+
+		index = self._server_index.get(server_duid)
+		if index is None:
+			index = self._server_index[server_duid] = len(self.server_duids)
+			self.server_duids.append(server_duid)
+		self.server_ids[row] = index
+
+	def physical(self, row):
+		return self.interfaces[self.physical_ids[row]]
+
+	def _intern_interface(self, physical):
+		index = self._interface_index.get(id(physical))
+		if index is None:
+			index = self._interface_index[id(physical)] = len(self.interfaces)
+			self.interfaces.append(physical)
+		return index
@@ -0,0 +1,241 @@
+import bisect
+import collections
+import http.server
+import socket
+import threading
+
+INF = float('inf')
+
+# Upper bounds in seconds of the processing latency buckets
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+
+class Counter(object):
+	# Children like dropped packets per reason are incremented by listener, handler and manager
+	# threads alike, so increments are serialized to not lose any of them
+	__slots__ = ('value', '_lock')
+
+	def __init__(self):
+		self.value = 0
+		self._lock = threading.Lock()
+
+	def inc(self, amount=1):
+		with self._lock:
+			self.value += amount
+
+	def collect(self):
+		return self.value
+
+
+class Histogram(object):
+	# Only observed by the packet handler, which processes one message at a time, so not locked
+	__slots__ = ('_bounds', '_counts', '_sum')
+
+	def __init__(self, bounds):
+		self._bounds = bounds
+		self._counts = [0] * (len(bounds) + 1)
+		self._sum = 0.0
+
+	def observe(self, value):
+		self._counts[bisect.bisect_left(self._bounds, value)] += 1
+		self._sum += value
+
+	def collect(self):
+		return {'sum': self._sum, 'buckets': dict(zip(self._bounds + (INF,), self._counts))}
+
+
+class Family(object):
+	# Metric with a fixed set of label names and one child per combination of label values.
+	# Children should be looked up once and kept by the caller on hot paths.
+	def __init__(self, kind, name, description, labels=(), buckets=None):
+		(self.kind, self.name, self.description, self.labels) = kind, name, description, tuple(labels)
+		self._buckets = buckets
+		self._children = dict()
+		self._lock = threading.Lock()
+
+	def child(self, *values):
+		child = self._children.get(values)
+		if child is None:
+			with self._lock:
+				child = self._children.get(values)
+				if child is None:
+					child = self._children[values] = Histogram(self._buckets) if self.kind == 'histogram' else Counter()
+		return child
+
+	def collect(self):
+		return dict([(values, child.collect()) for (values, child) in list(self._children.items())])
+
+
+class Registry(object):
+	def __init__(self):
+		self._families = collections.OrderedDict()
+
+	def counter(self, name, description, labels=()):
+		return self._register(Family('counter', name, description, labels))
+
+	def histogram(self, name, description, labels=(), buckets=LATENCY_BUCKETS):
+		return self._register(Family('histogram', name, description, labels, buckets))
+
+	def families(self):
+		return list(self._families.values())
+
+	def collect(self):
+		# Snapshot of all values, which can be sent to another process and merged with shard.merge_status
+		return dict([(family.name, family.collect()) for family in self._families.values()])
+
+	def _register(self, family):
+		if family.name in self._families:
+			raise ValueError("Duplicate metric: %s" % family.name)
+		self._families[family.name] = family
+		return family
+
+
+REGISTRY = Registry()
+
+# Metrics updated on the packet pipeline
+RX_PACKETS = REGISTRY.counter('dhcprefix6_rx_packets_total',
+	'DHCPv6 messages received per interface and message type', ['interface', 'type'])
+TX_PACKETS = REGISTRY.counter('dhcprefix6_tx_packets_total',
+	'DHCPv6 messages sent per interface and message type', ['interface', 'type'])
+DROPPED_PACKETS = REGISTRY.counter('dhcprefix6_dropped_packets_total',
+	'Received DHCPv6 messages dropped per reason', ['reason'])
+PROCESSING_LATENCY = REGISTRY.histogram('dhcprefix6_processing_latency_seconds',
+	'Time from receiving a message until the manager has processed it')
+
+# Metrics derived from the status dicts which are already collected for the statistics dump:
+# section, key, metric type, metric name and description
+STATUS_METRICS = [
+	('transactions', 'outstanding', 'gauge', 'dhcprefix6_transactions_outstanding', 'Outstanding transactions'),
+	('transactions', 'matched', 'counter', 'dhcprefix6_replies_matched_total', 'Replies matching an outstanding transaction'),
+	('transactions', 'duplicate', 'counter', 'dhcprefix6_replies_duplicate_total', 'Replies to recently closed transactions'),
+	('transactions', 'stale', 'counter', 'dhcprefix6_replies_stale_total', 'Replies to unknown transactions'),
+	('queue', 'depth', 'gauge', 'dhcprefix6_queue_depth', 'Packets waiting for the packet handler'),
+	('queue', 'max_depth', 'gauge', 'dhcprefix6_queue_max_depth', 'Highest observed packet handler queue depth'),
+	('queue', 'high_water_mark', 'gauge', 'dhcprefix6_queue_high_water_mark', 'Capacity of the packet handler queue'),
+	('queue', 'enqueued', 'counter', 'dhcprefix6_queue_enqueued_total', 'Packets passed to the packet handler'),
+	('queue', 'dropped', 'counter', 'dhcprefix6_queue_dropped_total', 'Packets dropped by the packet handler queue'),
+	('dispatcher', 'alive', 'gauge', 'dhcprefix6_workers_alive', 'Worker processes which are alive'),
+	('dispatcher', 'restarts', 'counter', 'dhcprefix6_worker_restarts_total', 'Restarted worker processes'),
+	('dispatcher', 'dispatched', 'counter', 'dhcprefix6_dispatched_packets_total', 'Packets dispatched to worker processes'),
+	('dispatcher', 'unknown', 'counter', 'dhcprefix6_dispatch_unknown_total', 'Packets without a known client DUID'),
+	('dispatcher', 'congested', 'counter', 'dhcprefix6_dispatch_congested_total', 'Packets dropped because a worker pipe was full'),
+	('dispatcher', 'undeliverable', 'counter', 'dhcprefix6_dispatch_undeliverable_total', 'Packets which could not be dispatched')
+]
+
+# Per interface transmit statistics: key, metric type, metric name and description
+TX_METRICS = [
+	('bytes', 'counter', 'dhcprefix6_tx_bytes_total', 'Bytes sent'),
+	('batches', 'counter', 'dhcprefix6_tx_batches_total', 'Transmit batches'),
+	('syscalls', 'counter', 'dhcprefix6_tx_syscalls_total', 'Send syscalls'),
+	('errors', 'counter', 'dhcprefix6_tx_errors_total', 'Messages which could not be sent'),
+	('deferred', 'counter', 'dhcprefix6_tx_deferred_total', 'Messages deferred by the rate limiter')
+]
+
+
+def render(status, state_names):
+	# Render a status dict in the Prometheus text exposition format
+	lines = []
+	snapshot = status.get('metrics', {})
+	for family in REGISTRY.families():
+		values = snapshot.get(family.name, {})
+		if family.kind == 'histogram':
+			_render_histogram(lines, family, values)
+		else:
+			_render(lines, family.kind, family.name, family.description, family.labels, values)
+
+	states = status.get('states', {})
+	_render(lines, 'gauge', 'dhcprefix6_virtual_interfaces', 'Virtual interfaces per state', ['state'],
+		dict([((state_names[state].lower(),), count) for (state, count) in states.items()]))
+
+	for (section, key, kind, name, description) in STATUS_METRICS:
+		if key in status.get(section, {}):
+			_render(lines, kind, name, description, [], {(): status[section][key]})
+
+	tx = status.get('tx', {})
+	for (key, kind, name, description) in TX_METRICS:
+		_render(lines, kind, name, description, ['interface'],
+			dict([((interface,), stats[key]) for (interface, stats) in tx.items()]))
+
+	return '\n'.join(lines) + '\n'
+
+
+def _render(lines, kind, name, description, labels, values):
+	lines.append("# HELP %s %s" % (name, description))
+	lines.append("# TYPE %s %s" % (name, kind))
+	for (label_values, value) in sorted(values.items()):
+		lines.append("%s%s %s" % (name, _format_labels(labels, label_values), _format_value(value)))
+
+
+def _render_histogram(lines, family, values):
+	lines.append("# HELP %s %s" % (family.name, family.description))
+	lines.append("# TYPE %s histogram" % family.name)
+	for (label_values, value) in sorted(values.items()):
+		count = 0
+		for (bound, bucket_count) in sorted(value['buckets'].items()):
+			count += bucket_count
+			lines.append("%s_bucket%s %d" % (family.name,
+				_format_labels(family.labels + ('le',), label_values + (_format_value(bound),)), count))
+		lines.append("%s_sum%s %s" % (family.name, _format_labels(family.labels, label_values), _format_value(value['sum'])))
+		lines.append("%s_count%s %d" % (family.name, _format_labels(family.labels, label_values), count))
+
+
+def _format_labels(labels, values):
+	if len(labels) == 0:
+		return ''
+	return '{%s}' % ','.join(['%s="%s"' % (label, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+		for (label, value) in zip(labels, values)])
+
+
+def _format_value(value):
+	if value == INF:
+		return '+Inf'
+	return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _RequestHandler(http.server.BaseHTTPRequestHandler):
+	def do_GET(self):
+		if self.path.split('?')[0] != '/metrics':
+			self.send_error(404)
+			return
+
+		body = self.server.render().encode('utf-8')
+		self.send_response(200)
+		self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+		self.send_header('Content-Length', str(len(body)))
+		self.end_headers()
+		self.wfile.write(body)
+
+	def log_message(self, format, *args):
+		self.server.logger.debug("Metrics request from %s: %s" % (self.address_string(), format % args))
+
+
+class _HTTPServer6(http.server.HTTPServer):
+	address_family = socket.AF_INET6
+
+
+class MetricsServer(threading.Thread):
+	# Serves /metrics over HTTP, one request at a time
+	POLL_TIMEOUT = 1
+
+	def __init__(self, address, port, collect, state_names, logger):
+		threading.Thread.__init__(self, name='metrics')
+		self.kill_received = False
+		(self._collect, self._state_names, self._logger) = collect, state_names, logger
+
+		server_class = _HTTPServer6 if ':' in address else http.server.HTTPServer
+		self._server = server_class((address, port), _RequestHandler)
+		self._server.timeout = self.POLL_TIMEOUT
+		self._server.render = self._render
+		self._server.logger = logger
+
+	def run(self):
+		while self.kill_received is not True:
+			try:
+				self._server.handle_request()
+			except:
+				self._logger.exception('Unexpected error occurred in metrics server thread')
+
+		self._server.server_close()
+
+	def _render(self):
+		return render(self._collect() or {}, self._state_names)
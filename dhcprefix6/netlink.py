@@ -0,0 +1,134 @@
+import ipaddress
+import socket
+import struct
+import threading
+
+# Netlink and rtnetlink constants which are not exported by the socket module
+NETLINK_ROUTE = 0
+NLMSG_ERROR = 2
+NLMSG_DONE = 3
+NLM_F_REQUEST = 0x1
+NLM_F_DUMP = 0x300
+RTM_NEWLINK = 16
+RTM_GETLINK = 18
+RTM_NEWADDR = 20
+RTM_GETADDR = 22
+IFLA_ADDRESS = 1
+IFLA_IFNAME = 3
+IFA_ADDRESS = 1
+
+NLMSG_HEADER = struct.Struct('=IHHII')
+IFINFOMSG = struct.Struct('=BxHiII')
+IFADDRMSG = struct.Struct('=BBBBI')
+RTATTR = struct.Struct('=HH')
+
+RECEIVE_BUFFER_SIZE = 1 << 16
+LINK_LOCAL_NETWORK = ipaddress.IPv6Network('fe80::/10')
+
+
+class Link(object):
+	__slots__ = ('index', 'name', 'mac', 'lladdrs')
+
+	def __init__(self, index, name, mac):
+		(self.index, self.name, self.mac) = index, name, mac
+		self.lladdrs = []
+
+	@property
+	def lladdr(self):
+		return self.lladdrs[0] if len(self.lladdrs) > 0 else None
+
+
+# Links of the last dump, which is shared by all interfaces initialized until it gets invalidated
+_links = None
+_lock = threading.Lock()
+
+
+def get_links():
+	# All links by name with their mac address and IPv6 link-local addresses, dumped once with
+	# rtnetlink instead of querying the kernel per interface. None if rtnetlink is not available.
+	# Scapy takes seconds to import, so it is only imported where it is actually used, like as
+	# fallback for these lookups on systems without rtnetlink.
+	global _links
+	with _lock:
+		if _links is None:
+			try:
+				_links = dump()
+			except (AttributeError, EnvironmentError, struct.error):
+				_links = False
+		return _links if _links is not False else None
+
+
+def invalidate():
+	# Dump again on the next lookup, for example when interfaces get added by a configuration reload
+	global _links
+	with _lock:
+		_links = None
+
+
+def dump():
+	links = dict()
+	with socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, NETLINK_ROUTE) as sock:
+		sock.bind((0, 0))
+
+		by_index = dict()
+		for (msg_type, payload) in _request(sock, RTM_GETLINK, IFINFOMSG.pack(socket.AF_UNSPEC, 0, 0, 0, 0), 1):
+			if msg_type != RTM_NEWLINK:
+				continue
+			(_, _, index, _, _) = IFINFOMSG.unpack_from(payload)
+			attributes = _attributes(payload, IFINFOMSG.size)
+			if IFLA_IFNAME not in attributes:
+				continue
+
+			name = attributes[IFLA_IFNAME].split(b'\0', 1)[0].decode('utf-8', 'replace')
+			mac = attributes.get(IFLA_ADDRESS)
+			link = Link(index, name, mac if mac is not None and len(mac) == 6 else None)
+			links[name] = by_index[index] = link
+
+		for (msg_type, payload) in _request(sock, RTM_GETADDR, IFADDRMSG.pack(socket.AF_INET6, 0, 0, 0, 0), 2):
+			if msg_type != RTM_NEWADDR:
+				continue
+			(_, _, _, _, index) = IFADDRMSG.unpack_from(payload)
+			address = _attributes(payload, IFADDRMSG.size).get(IFA_ADDRESS)
+			if address is None or len(address) != 16 or index not in by_index:
+				continue
+
+			address = ipaddress.IPv6Address(address)
+			if address in LINK_LOCAL_NETWORK:
+				by_index[index].lladdrs.append(str(address))
+	return links
+
+
+def _request(sock, msg_type, body, sequence):
+	# Send a dump request and yield type and payload of every message until the dump is done
+	sock.send(NLMSG_HEADER.pack(NLMSG_HEADER.size + len(body), msg_type, NLM_F_REQUEST | NLM_F_DUMP, sequence, 0) + body)
+	while True:
+		data = sock.recv(RECEIVE_BUFFER_SIZE)
+		offset = 0
+		while offset + NLMSG_HEADER.size <= len(data):
+			(length, reply_type, _, reply_sequence, _) = NLMSG_HEADER.unpack_from(data, offset)
+			if length < NLMSG_HEADER.size:
+				raise EnvironmentError('Received malformed netlink message')
+			payload = data[offset + NLMSG_HEADER.size:offset + length]
+			offset += (length + 3) & ~3
+
+			if reply_sequence != sequence:
+				continue
+			if reply_type == NLMSG_DONE:
+				return
+			if reply_type == NLMSG_ERROR:
+				(error,) = struct.unpack_from('=i', payload)
+				if error != 0:
+					raise EnvironmentError(-error, 'Netlink dump failed')
+				continue
+			yield reply_type, payload
+
+
+def _attributes(payload, offset):
+	attributes = dict()
+	while offset + RTATTR.size <= len(payload):
+		(length, attribute_type) = RTATTR.unpack_from(payload, offset)
+		if length < RTATTR.size:
+			break
+		attributes.setdefault(attribute_type, payload[offset + RTATTR.size:offset + length])
+		offset += (length + 3) & ~3
+	return attributes
@@ -1,20 +1,260 @@
+import collections
+import ctypes
+import logging
+import mmap
+import os
+import select
+import selectors
+import socket
+import struct
 import threading
 import time
 import sys
-from scapy.layers.dhcp6 import DHCP6OptClientId
-from scapy.layers.l2 import Ether
-from scapy.sendrecv import sniff
+import dhcprefix6.metrics as metrics
+import dhcprefix6.profiling as profiling
+import dhcprefix6.wire as wire
+
+
+class RingSocket(object):
+	# Linux constants which are not exported by the socket module
+	ETH_P_ALL = 0x0003
+	SOL_PACKET = 263
+	SO_ATTACH_FILTER = 26
+	PACKET_ADD_MEMBERSHIP = 1
+	PACKET_MR_PROMISC = 1
+	PACKET_RX_RING = 5
+	PACKET_VERSION = 10
+	TPACKET_V3 = 2
+	TP_STATUS_KERNEL = 0
+	TP_STATUS_USER = 1
+
+	# Geometry of the receive ring, blocks get retired after BLOCK_TIMEOUT milliseconds
+	BLOCK_SIZE = 1 << 18
+	BLOCK_COUNT = 16
+	FRAME_SIZE = 1 << 11
+	BLOCK_TIMEOUT = 10
+
+	# Classic BPF program for 'ip6 and udp src port 547 and dst port 546'
+	FILTER = [
+		(0x28, 0, 0, 12),
+		(0x15, 0, 7, 0x86dd),
+		(0x30, 0, 0, 20),
+		(0x15, 0, 5, 17),
+		(0x28, 0, 0, 54),
+		(0x15, 0, 3, 547),
+		(0x28, 0, 0, 56),
+		(0x15, 0, 1, 546),
+		(0x06, 0, 0, 0x40000),
+		(0x06, 0, 0, 0)
+	]
+
+	def __init__(self, interface):
+		self._interface = interface
+		self._block_index = 0
+		self._socket = socket.socket(socket.AF_PACKET, socket.SOCK_RAW, socket.htons(self.ETH_P_ALL))
+
+		try:
+			self._attach_filter()
+			self._socket.setsockopt(self.SOL_PACKET, self.PACKET_VERSION, self.TPACKET_V3)
+			self._socket.setsockopt(self.SOL_PACKET, self.PACKET_RX_RING, struct.pack(
+				'IIIIIII', self.BLOCK_SIZE, self.BLOCK_COUNT, self.FRAME_SIZE,
+				(self.BLOCK_SIZE // self.FRAME_SIZE) * self.BLOCK_COUNT, self.BLOCK_TIMEOUT, 0, 0))
+			self._ring = mmap.mmap(self._socket.fileno(), self.BLOCK_SIZE * self.BLOCK_COUNT,
+				mmap.MAP_SHARED, mmap.PROT_READ | mmap.PROT_WRITE)
+			self._view = memoryview(self._ring)
+
+			# Bind to the interface and receive frames for all configured mac addresses
+			self._socket.bind((str(interface.name), self.ETH_P_ALL))
+			ifindex = socket.if_nametoindex(str(interface.name))
+			self._socket.setsockopt(self.SOL_PACKET, self.PACKET_ADD_MEMBERSHIP,
+				struct.pack('iHH8s', ifindex, self.PACKET_MR_PROMISC, 0, b''))
+		except:
+			self._socket.close()
+			raise
+
+	def fileno(self):
+		return self._socket.fileno()
+
+	@profiling.stage('capture')
+	def read(self, callback):
+		# Walk all blocks which were handed over by the kernel and pass every frame as a
+		# memoryview into the ring to the callback. Views are only valid until the callback
+		# returns, because the block gets handed back to the kernel afterwards.
+		count = 0
+		while True:
+			block = self._block_index * self.BLOCK_SIZE
+			(status, num_pkts, offset) = struct.unpack_from('III', self._ring, block + 8)
+			if not status & self.TP_STATUS_USER:
+				return count
+
+			offset += block
+			for _ in range(num_pkts):
+				(next_offset, snaplen, mac) = struct.unpack_from('I8xI8xH', self._ring, offset)
+				callback(self._interface, self._view[offset + mac:offset + mac + snaplen])
+				offset += next_offset
+
+			struct.pack_into('I', self._ring, block + 8, self.TP_STATUS_KERNEL)
+			self._block_index = (self._block_index + 1) % self.BLOCK_COUNT
+			count += num_pkts
+
+	def close(self):
+		self._view.release()
+		self._ring.close()
+		self._socket.close()
+
+	def _attach_filter(self):
+		program = b''.join([struct.pack('HBBI', *instruction) for instruction in self.FILTER])
+		buffer = ctypes.create_string_buffer(program)
+		fprog = struct.pack('HL', len(self.FILTER), ctypes.addressof(buffer))
+		self._socket.setsockopt(socket.SOL_SOCKET, self.SO_ATTACH_FILTER, fprog)
+
+
+class _IoVec(ctypes.Structure):
+	_fields_ = [('iov_base', ctypes.c_void_p), ('iov_len', ctypes.c_size_t)]
+
+
+class _MsgHdr(ctypes.Structure):
+	_fields_ = [
+		('msg_name', ctypes.c_void_p),
+		('msg_namelen', ctypes.c_uint32),
+		('msg_iov', ctypes.POINTER(_IoVec)),
+		('msg_iovlen', ctypes.c_size_t),
+		('msg_control', ctypes.c_void_p),
+		('msg_controllen', ctypes.c_size_t),
+		('msg_flags', ctypes.c_int)
+	]
+
+
+class _MMsgHdr(ctypes.Structure):
+	_fields_ = [('msg_hdr', _MsgHdr), ('msg_len', ctypes.c_uint)]
+
+
+class SendSocket(object):
+	# Upper limit of messages per sendmmsg call (UIO_MAXIOV)
+	MAX_BATCH_SIZE = 1024
+
+	def __init__(self, interface):
+		# Protocol zero creates a send-only socket which never receives any frames
+		self._socket = socket.socket(socket.AF_PACKET, socket.SOCK_RAW, 0)
+		try:
+			self._socket.bind((str(interface.name), 0))
+		except:
+			self._socket.close()
+			raise
+
+		# sendmmsg is not exposed by the socket module and gets called through libc if available
+		try:
+			self._sendmmsg = ctypes.CDLL(None, use_errno=True).sendmmsg
+			self._sendmmsg.argtypes = [ctypes.c_int, ctypes.c_void_p, ctypes.c_uint, ctypes.c_int]
+			self._sendmmsg.restype = ctypes.c_int
+		except (AttributeError, OSError):
+			self._sendmmsg = None
+
+	def send(self, frame):
+		self._socket.send(frame)
+		return 1
+
+	def send_batch(self, frames):
+		# Send all frames with as few syscalls as possible and return the amount of syscalls
+		if self._sendmmsg is None:
+			for frame in frames:
+				self._socket.send(frame)
+			return len(frames)
+
+		syscalls = 0
+		for start in range(0, len(frames), self.MAX_BATCH_SIZE):
+			batch = frames[start:start + self.MAX_BATCH_SIZE]
+			iovecs = (_IoVec * len(batch))()
+			messages = (_MMsgHdr * len(batch))()
+			for index, frame in enumerate(batch):
+				iovecs[index].iov_base = ctypes.cast(ctypes.c_char_p(frame), ctypes.c_void_p)
+				iovecs[index].iov_len = len(frame)
+				messages[index].msg_hdr.msg_iov = ctypes.pointer(iovecs[index])
+				messages[index].msg_hdr.msg_iovlen = 1
+
+			sent = 0
+			while sent < len(batch):
+				result = self._sendmmsg(self._socket.fileno(),
+					ctypes.addressof(messages) + sent * ctypes.sizeof(_MMsgHdr), len(batch) - sent, 0)
+				syscalls += 1
+				if result < 0:
+					errno = ctypes.get_errno()
+					raise OSError(errno, os.strerror(errno))
+				sent += result
+
+		return syscalls
+
+	def close(self):
+		self._socket.close()
+
+
+class RingListener(threading.Thread):
+	POLL_TIMEOUT = 1000
+
+	def __init__(self, interface, handler, logger):
+		threading.Thread.__init__(self, name="listener-%s" % interface)
+		self.kill_received = False
+		(self._interface, self._handler, self._logger) = interface, handler, logger
+		self._ring = RingSocket(interface)
+
+	def run(self):
+		poller = select.poll()
+		poller.register(self._ring.fileno(), select.POLLIN | select.POLLERR)
+
+		while self.kill_received is not True:
+			try:
+				if poller.poll(self.POLL_TIMEOUT):
+					self._ring.read(self._handler)
+			except:
+				self._logger.exception('Unexpected error occurred in listener thread')
+
+		self._ring.close()
+
+
+class MultiplexedListener(threading.Thread):
+	SELECT_TIMEOUT = 1
+
+	def __init__(self, interfaces, handler, logger):
+		threading.Thread.__init__(self, name="listener-%s" % '+'.join([str(interface) for interface in interfaces]))
+		self.kill_received = False
+		(self._interfaces, self._handler, self._logger) = interfaces, handler, logger
+
+		# Open a receive ring for every interface and watch all of them with one selector
+		self._selector = selectors.DefaultSelector()
+		try:
+			for interface in interfaces:
+				self._selector.register(RingSocket(interface), selectors.EVENT_READ)
+		except:
+			self._close()
+			raise
+
+	def run(self):
+		while self.kill_received is not True:
+			try:
+				for key, _ in self._selector.select(self.SELECT_TIMEOUT):
+					key.fileobj.read(self._handler)
+			except:
+				self._logger.exception('Unexpected error occurred in multiplexed listener thread')
+
+		self._close()
+
+	def _close(self):
+		for key in list(self._selector.get_map().values()):
+			self._selector.unregister(key.fileobj)
+			key.fileobj.close()
+		self._selector.close()
 
 
 class Listener(threading.Thread):
 	FILTER = 'icmp6 or (udp and src port 547 and dst port 546)'
 
-	def __init__(self, interface, handler):
-		threading.Thread.__init__(self)
+	def __init__(self, interface, handler, logger):
+		threading.Thread.__init__(self, name="listener-%s" % interface)
 		self.kill_received = False
-		(self._interface, self._handler) = interface, handler
+		(self._interface, self._handler, self._logger) = interface, handler, logger
 
 	def run(self):
+		from scapy.sendrecv import sniff
 		while self.kill_received is not True:
 			try:
 				sniff(
@@ -27,47 +267,189 @@ class Listener(threading.Thread):
 			except:
 				self._logger.exception('Unexpected error occurred in listener thread')
 
+	@profiling.stage('capture')
 	def _dispatch_to_handler(self, packet):
 		self._handler(self._interface, packet)
 
 
+class TokenBucket(object):
+	# Limits transmissions to [rate] messages per second with bursts of up to [burst] messages.
+	# Callers reserve a token up front and get told how long to wait until it becomes valid,
+	# so that deferred messages are spread evenly instead of retrying all at once.
+	def __init__(self, rate, burst):
+		if rate <= 0:
+			raise ValueError("Invalid transmission rate: %s" % rate)
+
+		(self._rate, self._burst) = float(rate), float(max(burst, 1))
+		self._tokens = self._burst
+		self._updated = time.monotonic()
+
+		# Messages which had to wait for a token instead of being sent right away
+		self.deferred = 0
+
+	def reserve(self):
+		now = time.monotonic()
+		self._tokens = min(self._burst, self._tokens + (now - self._updated) * self._rate)
+		self._updated = now
+
+		self._tokens -= 1
+		if self._tokens >= 0:
+			return 0
+
+		self.deferred += 1
+		return -self._tokens / self._rate
+
+
+class WorkQueue(object):
+	DROP_OLDEST = 'oldest'
+	DROP_NEWEST = 'newest'
+
+	def __init__(self, high_water_mark, drop_policy):
+		if drop_policy not in [self.DROP_OLDEST, self.DROP_NEWEST]:
+			raise ValueError("Invalid drop policy: %s" % drop_policy)
+
+		self._queue = collections.deque()
+		self._condition = threading.Condition()
+		(self._high_water_mark, self._drop_policy) = int(high_water_mark), drop_policy
+
+		# Packets which passed through the queue, were dropped by the drop policy and the deepest backlog seen
+		self.enqueued = 0
+		self.dequeued = 0
+		self.dropped = 0
+		self.max_depth = 0
+
+	def put(self, item):
+		with self._condition:
+			# Apply drop policy if the high-water mark has been reached
+			if len(self._queue) >= self._high_water_mark:
+				self.dropped += 1
+				if self._drop_policy == self.DROP_NEWEST:
+					return False
+				self._queue.popleft()
+
+			self._queue.append(item)
+			self.enqueued += 1
+			self.max_depth = max(self.max_depth, len(self._queue))
+			self._condition.notify()
+			return True
+
+	def get(self, timeout=None):
+		with self._condition:
+			if len(self._queue) == 0:
+				self._condition.wait(timeout)
+			if len(self._queue) == 0:
+				return None
+
+			self.dequeued += 1
+			return self._queue.popleft()
+
+	def depth(self):
+		return len(self._queue)
+
+	def stats(self):
+		return {
+			'depth': len(self._queue),
+			'max_depth': self.max_depth,
+			'high_water_mark': self._high_water_mark,
+			'enqueued': self.enqueued,
+			'dequeued': self.dequeued,
+			'dropped': self.dropped
+		}
+
+
 class Handler(threading.Thread):
-	def __init__(self, interfaces, prefixes, manager, logger):
-		threading.Thread.__init__(self)
+	QUEUE_TIMEOUT = 1
+	DROP_REASONS = ['malformed', 'wrong_mac', 'no_client_id', 'unknown_duid', 'no_transaction', 'invalid']
+
+	def __init__(self, interfaces, prefixes, manager, logger, queue_size=1024, drop_policy=WorkQueue.DROP_OLDEST):
+		threading.Thread.__init__(self, name='handler')
 		self.kill_received = False
 
-		self._queue = []
+		self._queue = WorkQueue(queue_size, drop_policy)
 		(self._interfaces, self._prefixes, self._manager, self._logger) = (interfaces, prefixes, manager, logger)
+		self._dropped = dict([(reason, metrics.DROPPED_PACKETS.child(reason)) for reason in self.DROP_REASONS])
+		self._latency = metrics.PROCESSING_LATENCY.child()
 
 	def run(self):
 		while self.kill_received is not True:
 			try:
-				# Grab packet from queue or wait if no tasks are available
-				if len(self._queue) == 0:
-					time.sleep(0)
-				else:
-					packet = self._queue.pop()
-					self._process_packet(packet[0], packet[1])
+				# Grab packet from queue or block until new tasks are available
+				packet = self._queue.get(self.QUEUE_TIMEOUT)
+				if packet is not None:
+					self._process_packet(*packet)
 			except:
 				self._logger.exception('Unexpected error occurred in packet handler thread')
 
+	def process(self, interface, packet):
+		# Process a packet synchronously within the calling thread, frames from a receive
+		# ring are parsed in place without copying them
+		try:
+			if not isinstance(packet, (bytes, memoryview)):
+				packet = bytes(packet)
+			self._process_packet(interface, packet, time.monotonic())
+		except:
+			self._logger.exception('Unexpected error occurred in packet handler')
+
+	def process_queued(self):
+		# Process all packets queued with handle() within the calling thread, without waiting for more
+		while self._queue.depth() > 0:
+			packet = self._queue.get(0)
+			if packet is None:
+				break
+			try:
+				self._process_packet(*packet)
+			except:
+				self._logger.exception('Unexpected error occurred in packet handler')
+
 	def handle(self, interface, packet):
-		self._queue.append([interface, packet])
+		# Frames from a receive ring point into shared memory and have to be copied once,
+		# packets captured by scapy are serialized back into their raw representation
+		if isinstance(packet, memoryview):
+			packet = packet.tobytes()
+		elif not isinstance(packet, bytes):
+			packet = bytes(packet)
+		self._queue.put((interface, packet, time.monotonic()))
+
+	def stats(self):
+		return self._queue.stats()
 
-	def _process_packet(self, interface, packet):
+	@profiling.stage('handler')
+	def _process_packet(self, interface, packet, received_at):
 		# Drop some various types of bogus packets
-		if Ether not in packet:
+		header = wire.peek(packet)
+		if header is None:
+			self._dropped['malformed'].inc()
 			return
-		if str(interface.mac) != (packet[Ether].dst):
+		(dst_mac, msg_type, transaction_id, client_duid) = header
+		interface.rx_counter(msg_type).inc()
+		if interface.mac.packed != dst_mac:
+			self._dropped['wrong_mac'].inc()
 			return
-		if DHCP6OptClientId not in packet:
+		if client_duid is None:
+			self._dropped['no_client_id'].inc()
 			return
 
 		# Determine client ID and try to find a matching prefix
-		client_duid = "00:03:00:01:%s" % str(packet[DHCP6OptClientId].duid.lladdr)
 		prefix = self._prefixes.get_by_duid(client_duid)
 		if prefix is None:
-			self._logger.debug("Dropped packet with invalid DUID: %s" % client_duid)
+			self._dropped['unknown_duid'].inc()
+			self._logger.debug("Dropped packet with invalid DUID: %s" % wire.format_duid(client_duid))
+			return
+
+		# Drop stale and duplicated replies before parsing any options
+		if not self._manager.match_transaction(transaction_id, client_duid):
+			self._dropped['no_transaction'].inc()
+			self._logger.debug("Dropped packet without outstanding transaction: %06x" % transaction_id)
+			return
+
+		# Dump the full dissection only if somebody is going to read it
+		if self._logger.isEnabledFor(logging.DEBUG):
+			self._logger.debug("Received DHCPv6 message on interface %s:\n%s" % (interface, wire.dump(packet)))
+
+		message = wire.parse(packet)
+		if message is None:
+			self._dropped['invalid'].inc()
 			return
 
-		self._manager.handle_packet(client_duid, packet)
\ No newline at end of file
+		self._manager.handle_packet(client_duid, message)
+		self._latency.observe(time.monotonic() - received_at)
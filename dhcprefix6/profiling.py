@@ -0,0 +1,236 @@
+import cProfile
+import functools
+import json
+import marshal
+import os
+import random
+import threading
+import time
+
+
+class _CProfileSession(object):
+	__slots__ = ('profile', 'path', 'logger', 'timer', 'finished')
+
+	def __init__(self, path, logger):
+		(self.profile, self.path, self.logger) = cProfile.Profile(), path, logger
+		self.timer = None
+		self.finished = False
+
+
+class Profiler(object):
+	# Sampled timings of the pipeline stages. Functions are marked as stage with the stage()
+	# decorator, which only checks a flag while profiling is off. Whether a call gets sampled is
+	# decided at the outermost stage of a thread, so that nested stages form complete stacks.
+	def __init__(self):
+		self.active = False
+		self.enabled = False
+		self.sample_rate = 1.0
+		self.started_at = None
+		self.output_path = None
+		self._local = threading.local()
+		self._lock = threading.Lock()
+		self._stacks = dict()
+
+		# cProfile session of a single thread, which is enabled and disabled within that thread.
+		# Its statistics are written by a timer or when profiling stops, even if the thread is idle.
+		self._cprofile_thread = None
+		self._cprofile_seconds = 0
+		self._cprofile_path = None
+		self._cprofile_logger = None
+		self._cprofile_session = None
+		self._cprofile_sessions = 0
+
+	def stage(self, name):
+		def decorator(function):
+			@functools.wraps(function)
+			def wrapper(*args, **kwargs):
+				if not self.active:
+					return function(*args, **kwargs)
+				return self._measure(name, function, args, kwargs)
+			return wrapper
+		return decorator
+
+	def start(self, sample_rate=1.0):
+		with self._lock:
+			self._stacks = dict()
+			(self.sample_rate, self.started_at) = sample_rate, time.time()
+			self.enabled = True
+			self._update_active()
+
+	def stop(self):
+		with self._lock:
+			self.enabled = False
+			self._cprofile_thread = None
+			session = self._cprofile_session
+			self._update_active()
+
+		if session is not None:
+			self._finish_cprofile(session)
+
+	def profile_thread(self, thread_name, seconds, path, logger):
+		# Run cProfile on the named thread for the given amount of seconds, starting with the next
+		# stage it enters. The statistics are written to [path] with pstats once the time is up or
+		# profiling gets stopped, whatever happens first.
+		with self._lock:
+			(self._cprofile_thread, self._cprofile_seconds, self._cprofile_path) = thread_name, seconds, path
+			self._cprofile_logger = logger
+			self._update_active()
+
+	def report(self):
+		# Timings per stack of stages in microseconds. Counts only include sampled calls.
+		with self._lock:
+			stacks = dict(self._stacks)
+
+		return {
+			'started_at': self.started_at,
+			'duration': time.time() - self.started_at if self.started_at is not None else 0,
+			'sample_rate': self.sample_rate,
+			'stages': dict([(';'.join(stack), {
+				'count': count,
+				'total_us': int(total * 1e6),
+				'self_us': int(exclusive * 1e6),
+				'mean_us': total * 1e6 / count,
+				'max_us': int(maximum * 1e6)
+			}) for (stack, (count, total, exclusive, maximum)) in stacks.items()])
+		}
+
+	def collapsed(self):
+		# Self time per stack in microseconds, in the folded format read by flamegraph.pl
+		with self._lock:
+			stacks = dict(self._stacks)
+		return ''.join(["%s %d\n" % (';'.join(stack), int(exclusive * 1e6))
+			for (stack, (_, _, exclusive, _)) in sorted(stacks.items())])
+
+	def write(self, path):
+		with os.fdopen(create_output(path + '.json'), 'w') as report_file:
+			json.dump(self.report(), report_file, indent=2, sort_keys=True)
+		with os.fdopen(create_output(path + '.folded'), 'w') as folded_file:
+			folded_file.write(self.collapsed())
+
+	def _update_active(self):
+		self.active = self.enabled or self._cprofile_thread is not None or self._cprofile_sessions > 0
+
+	def _measure(self, name, function, args, kwargs):
+		local = self._local
+		stack = getattr(local, 'stack', None)
+		if stack is None:
+			stack = local.stack = []
+			local.cprofile = None
+
+		if len(stack) == 0:
+			self._check_cprofile(local)
+			sampled = self.enabled and random.random() < self.sample_rate
+		else:
+			sampled = stack[0] is not None
+
+		# Frames of calls which are not sampled are kept as None, so that nested stages skip them too
+		if not sampled:
+			stack.append(None)
+			try:
+				return function(*args, **kwargs)
+			finally:
+				stack.pop()
+
+		frame = [name, 0.0]
+		stack.append(frame)
+		started = time.perf_counter()
+		try:
+			return function(*args, **kwargs)
+		finally:
+			elapsed = time.perf_counter() - started
+			key = tuple([entry[0] for entry in stack])
+			stack.pop()
+			if len(stack) > 0:
+				stack[-1][1] += elapsed
+			self._record(key, elapsed, elapsed - frame[1])
+
+	def _record(self, key, elapsed, exclusive):
+		with self._lock:
+			entry = self._stacks.get(key)
+			if entry is None:
+				self._stacks[key] = [1, elapsed, exclusive, elapsed]
+			else:
+				entry[0] += 1
+				entry[1] += elapsed
+				entry[2] += exclusive
+				entry[3] = max(entry[3], elapsed)
+
+	def _check_cprofile(self, local):
+		session = local.cprofile
+		if session is not None:
+			# The profile can only be disabled by its own thread, which happens after it was written
+			if session.finished:
+				session.profile.disable()
+				local.cprofile = None
+				with self._lock:
+					self._cprofile_sessions -= 1
+					self._update_active()
+			return
+
+		if self._cprofile_thread is None or threading.current_thread().name != self._cprofile_thread:
+			return
+
+		with self._lock:
+			seconds = self._cprofile_seconds
+			session = _CProfileSession("%s.%s.pstats" % (self._cprofile_path, self._cprofile_thread),
+				self._cprofile_logger)
+			self._cprofile_thread = None
+			self._cprofile_session = session
+			self._cprofile_sessions += 1
+			self._update_active()
+
+		session.timer = threading.Timer(seconds, self._finish_cprofile, (session,))
+		session.timer.daemon = True
+		session.timer.start()
+		local.cprofile = session
+		session.profile.enable()
+
+	def _finish_cprofile(self, session):
+		with self._lock:
+			if session.finished:
+				return
+			session.finished = True
+			if self._cprofile_session is session:
+				self._cprofile_session = None
+
+		if session.timer is not None:
+			session.timer.cancel()
+		try:
+			session.profile.snapshot_stats()
+			with os.fdopen(create_output(session.path), 'wb') as stats_file:
+				marshal.dump(session.profile.stats, stats_file)
+			session.logger.info("Wrote cProfile statistics to %s" % session.path)
+		except EnvironmentError as e:
+			session.logger.error("Could not write cProfile statistics: %s" % e)
+
+
+def create_output(path):
+	# Never follow symlinks or overwrite existing files, as the daemon usually runs as root
+	return os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL | getattr(os, 'O_NOFOLLOW', 0), 0o600)
+
+
+PROFILER = Profiler()
+stage = PROFILER.stage
+
+
+def toggle(options, logger, suffix=''):
+	# Start profiling, or stop it and write the report. Every run writes new files named after the
+	# time profiling was started.
+	if not PROFILER.enabled:
+		PROFILER.start(options['profiling_sample_rate'])
+		path = PROFILER.output_path = "%s%s-%s" % (os.path.abspath(options['profiling_output']), suffix,
+			time.strftime('%Y%m%d-%H%M%S', time.localtime(PROFILER.started_at)))
+		logger.info("Started profiling with sample rate %s" % options['profiling_sample_rate'])
+		if options.get('profiling_thread') is not None:
+			PROFILER.profile_thread(options['profiling_thread'], options['profiling_thread_seconds'], path, logger)
+			logger.info("> Running cProfile on thread %s for %d second(s)" %
+				(options['profiling_thread'], options['profiling_thread_seconds']))
+		return
+
+	PROFILER.stop()
+	path = PROFILER.output_path
+	try:
+		PROFILER.write(path)
+		logger.info("Stopped profiling, wrote report to %s.json and %s.folded" % (path, path))
+	except EnvironmentError as e:
+		logger.error("Could not write profiling report: %s" % e)
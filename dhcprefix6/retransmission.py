@@ -0,0 +1,79 @@
+import random
+import dhcprefix6.wire as wire
+
+# Maximum delay of the first SOLICIT message in seconds (SOL_MAX_DELAY)
+SOLICIT_MAX_DELAY = 1
+
+# Randomization factor applied to every retransmission timeout
+JITTER = 0.1
+
+
+class Parameters(object):
+	# Initial and maximum retransmission timeout in seconds and maximum retransmission count,
+	# where zero means no limit. The maximum duration depends on T2 or the expire timeout.
+	def __init__(self, initial_timeout, max_timeout, max_count):
+		(self.initial_timeout, self.max_timeout, self.max_count) = initial_timeout, max_timeout, max_count
+
+
+# Transmission and retransmission parameters as specified in RFC 8415, section 7.6
+PARAMETERS = {
+	wire.SOLICIT: Parameters(1, 3600, 0),
+	wire.REQUEST: Parameters(1, 30, 10),
+	wire.RENEW: Parameters(10, 600, 0),
+	wire.REBIND: Parameters(10, 600, 0)
+}
+
+
+class Exchange(object):
+	# Retransmission state of a single message exchange. All transmissions of an exchange share
+	# the same transaction id, the timeout roughly doubles after every transmission and gets
+	# randomized to keep clients from retransmitting in lockstep (RFC 8415, section 15).
+	__slots__ = ('msg_type', 'started_at', 'count', 'timeout', 'next_at', 'deadline', '_max_timeout', '_max_count')
+
+	def __init__(self, msg_type, now, max_timeout=None, deadline=None):
+		parameters = PARAMETERS[msg_type]
+		self.msg_type = msg_type
+		self.started_at = now
+		self.deadline = deadline
+		self.count = 0
+		self.timeout = None
+		self.next_at = None
+		self._max_count = parameters.max_count
+		self._max_timeout = parameters.max_timeout
+		if max_timeout is not None:
+			self._max_timeout = min(self._max_timeout, max_timeout)
+
+		# The first timeout of a SOLICIT message must be greater than its initial timeout
+		self.timeout = parameters.initial_timeout
+		if msg_type == wire.SOLICIT:
+			self.timeout += random.uniform(0, JITTER) * self.timeout
+		else:
+			self.timeout += random.uniform(-JITTER, JITTER) * self.timeout
+		self.timeout = min(self.timeout, self._max_timeout)
+
+	def transmitted(self, now):
+		# Account for a (re)transmission and calculate when the next one is due
+		if self.count > 0:
+			self.timeout = 2 * self.timeout + random.uniform(-JITTER, JITTER) * self.timeout
+			if self.timeout > self._max_timeout:
+				self.timeout = self._max_timeout + random.uniform(-JITTER, JITTER) * self._max_timeout
+
+		self.count += 1
+		self.next_at = now + self.timeout
+		if self.deadline is not None:
+			self.next_at = min(self.next_at, self.deadline)
+
+	def is_exhausted(self, now):
+		if self._max_count and self.count >= self._max_count:
+			return True
+		return self.deadline is not None and now >= self.deadline
+
+	def elapsed_time(self, now):
+		# Elapsed time since the first transmission in hundredths of a second
+		if self.count == 0:
+			return 0
+		return min(int((now - self.started_at) * 100), 0xffff)
+
+
+def solicit_delay():
+	return random.uniform(0, SOLICIT_MAX_DELAY)
@@ -0,0 +1,116 @@
+import heapq
+import itertools
+import threading
+import dhcprefix6.clock as clocks
+
+
+class Scheduler(object):
+	# Heap of (deadline, sequence, viface) entries with monotonic deadlines. Rescheduling a virtual
+	# interface pushes a new entry and invalidates the old one, which gets skipped when it reaches the top.
+	COMPACT_THRESHOLD = 1024
+
+	def __init__(self, clock=None):
+		self._clock = clock if clock is not None else clocks.Clock()
+		self._heap = []
+		self._deadlines = {}
+		self._sequence = itertools.count()
+		self._condition = threading.Condition()
+
+	def schedule(self, viface, deadline):
+		with self._condition:
+			self._deadlines[viface] = deadline
+			heapq.heappush(self._heap, (deadline, next(self._sequence), viface))
+			self._compact()
+
+			# Wake up the waiting thread if the next deadline has moved forward
+			if self._heap[0][2] is viface:
+				self._condition.notify()
+
+	def cancel(self, viface):
+		with self._condition:
+			self._deadlines.pop(viface, None)
+
+	def pop_due(self, now):
+		due = []
+		with self._condition:
+			while len(self._heap) > 0 and self._heap[0][0] <= now:
+				(deadline, _, viface) = heapq.heappop(self._heap)
+				if self._deadlines.get(viface) == deadline:
+					del self._deadlines[viface]
+					due.append(viface)
+		return due
+
+	def next_deadline(self):
+		with self._condition:
+			self._skip_stale()
+			return self._heap[0][0] if len(self._heap) > 0 else None
+
+	def wait(self):
+		# Sleep until the next deadline is due or until the schedule changes
+		with self._condition:
+			self._skip_stale()
+			if len(self._heap) == 0:
+				self._condition.wait()
+			else:
+				timeout = self._heap[0][0] - self._clock.monotonic()
+				if timeout > 0:
+					self._condition.wait(timeout)
+
+	def wake(self):
+		with self._condition:
+			self._condition.notify_all()
+
+	def __len__(self):
+		return len(self._deadlines)
+
+	def _skip_stale(self):
+		while len(self._heap) > 0:
+			(deadline, _, viface) = self._heap[0]
+			if self._deadlines.get(viface) == deadline:
+				break
+			heapq.heappop(self._heap)
+
+	def _compact(self):
+		# Rebuild the heap once stale entries outnumber the scheduled virtual interfaces
+		if len(self._heap) > 2 * len(self._deadlines) + self.COMPACT_THRESHOLD:
+			self._heap = [entry for entry in self._heap if self._deadlines.get(entry[2]) == entry[0]]
+			heapq.heapify(self._heap)
+
+
+class LoopScheduler(object):
+	# Scheduler for the asyncio runtime, where every virtual interface owns one loop.call_at
+	# timer. Expired timers are collected and handed to the callback in a single batch.
+	def __init__(self, loop, callback=None, clock=None):
+		(self._loop, self.callback) = loop, callback
+		self._clock = clock if clock is not None else clocks.Clock()
+		self._handles = {}
+		self._due = []
+
+	def schedule(self, viface, deadline):
+		self.cancel(viface)
+		delay = max(deadline - self._clock.monotonic(), 0)
+		self._handles[viface] = self._loop.call_at(self._loop.time() + delay, self._expire, viface)
+
+	def cancel(self, viface):
+		handle = self._handles.pop(viface, None)
+		if handle is not None:
+			handle.cancel()
+
+	def pop_due(self, now):
+		(due, self._due) = self._due, []
+		return due
+
+	def wake(self):
+		pass
+
+	def __len__(self):
+		return len(self._handles)
+
+	def _expire(self, viface):
+		del self._handles[viface]
+		self._due.append(viface)
+		if len(self._due) == 1:
+			self._loop.call_soon(self._dispatch)
+
+	def _dispatch(self):
+		self.callback(self.pop_due(None))
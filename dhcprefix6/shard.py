@@ -0,0 +1,272 @@
+import multiprocessing
+import multiprocessing.connection
+import os
+import select
+import signal
+import struct
+import time
+import zlib
+import dhcprefix6.dhcp as dhcp
+import dhcprefix6.journal as journal
+import dhcprefix6.metrics as metrics
+import dhcprefix6.network as network
+import dhcprefix6.profiling as profiling
+import dhcprefix6.store as store
+import dhcprefix6.wire as wire
+
+
+def shard_of(client_duid, shard_count):
+	# Stable shard assignment based on the binary client DUID
+	return zlib.crc32(store.normalize_duid(client_duid)) % shard_count
+
+
+def collect_status(manager, handler, interfaces):
+	return {
+		'states': manager.stats(),
+		'transactions': manager.transaction_stats(),
+		'queue': handler.stats(),
+		'tx': dict([(str(interface), interface.stats()) for interface in interfaces]),
+		'metrics': metrics.REGISTRY.collect()
+	}
+
+
+def merge_status(target, source):
+	# Sum up counters of two status dicts, maximum values are merged by taking the larger one
+	for (key, value) in source.items():
+		if isinstance(value, dict):
+			merge_status(target.setdefault(key, dict()), value)
+		elif str(key).startswith('max') or key == 'high_water_mark':
+			target[key] = max(target.get(key, 0), value)
+		else:
+			target[key] = target.get(key, 0) + value
+	return target
+
+
+class Worker(object):
+	STATUS_INTERVAL = 1
+
+	# Length prefix which multiprocessing writes in front of every message
+	MESSAGE_HEADER_SIZE = 4
+
+	def __init__(self, index, interfaces, virtual_interfaces, options, logger):
+		self.index = index
+		(self._interfaces, self._virtual_interfaces) = interfaces, virtual_interfaces
+		(self._options, self._logger) = options, logger
+		self.process = None
+		self.started_at = None
+		self.status = dict()
+		self._frame_conn = None
+		self._status_conn = None
+
+	def start(self):
+		# Workers are forked, so they inherit interfaces and virtual interfaces of their shard
+		context = multiprocessing.get_context('fork')
+		(frame_reader, self._frame_conn) = context.Pipe(duplex=False)
+		(self._status_conn, status_writer) = context.Pipe(duplex=False)
+
+		self.process = context.Process(target=self._run, args=(frame_reader, status_writer),
+			name="dhcprefix6-worker-%d" % self.index)
+		self.process.daemon = True
+		self.process.start()
+		self.started_at = time.time()
+		frame_reader.close()
+		status_writer.close()
+
+		# A stalled worker must not block the capture of all other shards by filling its pipe
+		os.set_blocking(self._frame_conn.fileno(), False)
+
+	def stop(self):
+		if self.process is not None and self.process.is_alive():
+			self.process.terminate()
+		self._close_pipes()
+
+	def is_alive(self):
+		return self.process is not None and self.process.is_alive()
+
+	def send(self, frame):
+		# Returns False if the pipe is full. Writes of up to PIPE_BUF bytes are atomic, so a full
+		# pipe never receives a partial message which would corrupt all following ones.
+		if len(frame) + self.MESSAGE_HEADER_SIZE > select.PIPE_BUF:
+			raise ValueError("Frame of %d bytes exceeds the pipe buffer" % len(frame))
+		try:
+			self._frame_conn.send_bytes(frame)
+		except BlockingIOError:
+			return False
+		return True
+
+	def poll_status(self):
+		try:
+			while self._status_conn.poll():
+				self.status = self._status_conn.recv()
+		except (EOFError, OSError):
+			pass
+		return self.status
+
+	def _close_pipes(self):
+		for conn in [self._frame_conn, self._status_conn]:
+			if conn is not None:
+				conn.close()
+
+	def _run(self, frame_reader, status_writer):
+		# The supervisor takes care of signals, workers just get terminated
+		signal.signal(signal.SIGINT, signal.SIG_IGN)
+		if hasattr(signal, 'SIGUSR1'):
+			signal.signal(signal.SIGUSR1, signal.SIG_IGN)
+		if hasattr(signal, 'SIGUSR2'):
+			signal.signal(signal.SIGUSR2, lambda signum, frame: profiling.toggle(self._options, self._logger, ".%d" % self.index))
+		self._frame_conn.close()
+		self._status_conn.close()
+
+		prefixes = store.PrefixStore()
+		for viface in self._virtual_interfaces:
+			for prefix in viface.prefixes:
+				prefixes.add(prefix)
+
+		# Every worker keeps the leases of its shard in a separate journal
+		lease_journal = None
+		if self._options.get('journal') is not None:
+			lease_journal = journal.LeaseJournal("%s.%d" % (self._options['journal'], self.index), self._logger)
+
+		manager = dhcp.Manager(
+			virtual_interfaces=self._virtual_interfaces,
+			retry_time=self._options['retry_time'],
+			expire_time_multi=self._options['expire_time_multi'],
+			logger=self._logger,
+			journal=lease_journal
+		)
+		handler = network.Handler(
+			interfaces=self._interfaces,
+			prefixes=prefixes,
+			manager=manager,
+			logger=self._logger,
+			queue_size=self._options['queue_size'],
+			drop_policy=self._options['queue_drop_policy']
+		)
+		manager.start()
+		handler.start()
+		self._logger.info("Worker #%d started with %d virtual interface(s)" %
+			(self.index, len(self._virtual_interfaces)))
+
+		# Pass received frames to the packet handler and report the status periodically
+		try:
+			next_status = 0
+			while True:
+				if multiprocessing.connection.wait([frame_reader], self.STATUS_INTERVAL):
+					data = frame_reader.recv_bytes()
+					(interface_index,) = struct.unpack_from('!H', data)
+					handler.handle(self._interfaces.get(interface_index), data[2:])
+
+				if time.time() >= next_status:
+					status_writer.send(collect_status(manager, handler, self._interfaces.raw()))
+					next_status = time.time() + self.STATUS_INTERVAL
+		except (EOFError, OSError):
+			self._logger.warning("Worker #%d lost connection to supervisor" % self.index)
+		finally:
+			manager.kill_received = True
+			handler.kill_received = True
+
+
+class Supervisor(object):
+	RESTART_DELAY_MIN = 1
+	RESTART_DELAY_MAX = 60
+
+	def __init__(self, interfaces, prefixes, virtual_interfaces, worker_count, options, logger):
+		(self._interfaces, self._prefixes, self._logger) = interfaces, prefixes, logger
+		self._interface_indexes = dict([(interface, index) for (index, interface) in enumerate(interfaces.raw())])
+		self.kill_received = False
+
+		# Partition virtual interfaces by client DUID hash
+		shards = [list() for _ in range(worker_count)]
+		for viface in virtual_interfaces:
+			shards[shard_of(viface.client_duid, worker_count)].append(viface)
+		self._workers = [Worker(index, interfaces, shard, options, logger) for (index, shard) in enumerate(shards)]
+		self._restart_at = dict()
+		self._restart_delay = dict([(worker.index, self.RESTART_DELAY_MIN) for worker in self._workers])
+
+		# Packets passed to a worker, without a configured client DUID, dropped because the pipe of a
+		# stalled worker was full or lost on a broken worker pipe, and the amount of restarted workers
+		self.dispatched = 0
+		self.unknown = 0
+		self.congested = 0
+		self.undeliverable = 0
+		self.restarts = 0
+
+	@property
+	def kill_received(self):
+		return self._kill_received
+
+	@kill_received.setter
+	def kill_received(self, value):
+		self._kill_received = value
+		if value:
+			for worker in self._workers:
+				worker.stop()
+
+	def start(self):
+		for worker in self._workers:
+			worker.start()
+			self._logger.info("Started worker #%d (pid %d)" % (worker.index, worker.process.pid))
+
+	def handle(self, interface, packet):
+		# Route every received frame to the worker owning its client DUID
+		if not isinstance(packet, (bytes, memoryview)):
+			packet = bytes(packet)
+
+		header = wire.peek(packet)
+		if header is None or header[3] is None or self._prefixes.get_by_duid(header[3]) is None:
+			self.unknown += 1
+			return
+
+		worker = self._workers[shard_of(header[3], len(self._workers))]
+		try:
+			if worker.send(struct.pack('!H', self._interface_indexes[interface]) + bytes(packet)):
+				self.dispatched += 1
+			else:
+				self.congested += 1
+		except (EnvironmentError, KeyError, ValueError):
+			self.undeliverable += 1
+
+	def monitor(self):
+		# Restart workers which died, waiting longer after every unsuccessful restart
+		now = time.time()
+		for worker in self._workers:
+			worker.poll_status()
+			if self.kill_received or worker.is_alive():
+				continue
+
+			if worker.index not in self._restart_at:
+				# Workers which were running for a while get restarted quickly again
+				if now - worker.started_at > self.RESTART_DELAY_MAX:
+					self._restart_delay[worker.index] = self.RESTART_DELAY_MIN
+
+				self._logger.error("Worker #%d died with exit code %s, restarting in %d second(s)" %
+					(worker.index, worker.process.exitcode, self._restart_delay[worker.index]))
+				self._restart_at[worker.index] = now + self._restart_delay[worker.index]
+			elif now >= self._restart_at[worker.index]:
+				del self._restart_at[worker.index]
+				worker.stop()
+				worker.start()
+				self.restarts += 1
+				self._restart_delay[worker.index] = min(self._restart_delay[worker.index] * 2, self.RESTART_DELAY_MAX)
+				self._logger.info("Restarted worker #%d (pid %d)" % (worker.index, worker.process.pid))
+
+	def signal_workers(self, signum):
+		for worker in self._workers:
+			if worker.is_alive():
+				os.kill(worker.process.pid, signum)
+
+	def stats(self):
+		status = dict()
+		for worker in self._workers:
+			merge_status(status, worker.status)
+
+		status['dispatcher'] = {
+			'workers': len(self._workers),
+			'alive': len([worker for worker in self._workers if worker.is_alive()]),
+			'restarts': self.restarts,
+			'dispatched': self.dispatched,
+			'unknown': self.unknown,
+			'congested': self.congested,
+			'undeliverable': self.undeliverable
+		}
+		return status
@@ -1,14 +1,20 @@
+import dhcprefix6.types as types
+
+
 class Store(object):
 	_store = None
+	_index = None
 
 	def __init__(self):
 		self.reset()
 
 	def reset(self):
 		self._store = list()
+		self._index = dict()
 
 	def add(self, data):
 		self._store.append(data)
+		self._index.setdefault(self.index_key(data), data)
 		return data
 
 	def get(self, key):
@@ -16,21 +22,48 @@ class Store(object):
 
 	def set(self, key, data):
 		self._store[key] = data
+		self._rebuild_index()
 		return data
 
 	def raw(self):
 		return self._store
 
+	def replace(self, data):
+		# Swap all entries at once, so that concurrent lookups either see the old or the new index
+		index = dict()
+		for entry in data:
+			index.setdefault(self.index_key(entry), entry)
+		(self._store, self._index) = list(data), index
+
+	def index_key(self, data):
+		return None
+
+	def _rebuild_index(self):
+		self._index = dict()
+		for data in self._store:
+			self._index.setdefault(self.index_key(data), data)
+
 
 class InterfaceStore(Store):
+	def index_key(self, interface):
+		return str(interface.name)
+
 	def get_by_name(self, name):
-		for interface in self._store:
-			if interface.name == name: return interface
-		return None
+		return self._index.get(str(name))
 
 
 class PrefixStore(Store):
+	def index_key(self, prefix):
+		return normalize_duid(prefix.duid)
+
 	def get_by_duid(self, duid):
-		for prefix in self._store:
-			if str(prefix.duid) == str(duid): return prefix
-		return None
\ No newline at end of file
+		return self._index.get(normalize_duid(duid))
+
+
+def normalize_duid(duid):
+	# DUIDs are indexed by their binary representation, no matter how they were formatted
+	if isinstance(duid, bytes):
+		return duid
+	if isinstance(duid, types.Duid):
+		return duid.packed
+	return types.Duid(duid).packed
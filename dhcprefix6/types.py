@@ -1,5 +1,4 @@
 import re
-from datetime import datetime, timedelta
 import dhcprefix6.validation as validation
 
 UINT8_MIN = 0
@@ -14,23 +13,13 @@ UINT32_MAX = 2 ** 32 - 1
 IPV6_PREFIX_LENGTH_MIN = 8
 IPV6_PREFIX_LENGTH_MAX = 128
 
+DUID_LENGTH_MIN = 2
+DUID_LENGTH_MAX = 130
 
-class InterfaceName(validation.ValidatedType):
-	@staticmethod
-	def validate(value):
-		if not isinstance(value, str): return False
-		return True
-
-
-class MacAdress(validation.ValidatedType):
-	@staticmethod
-	def validate(value):
-		if not isinstance(value, str): return False
-		if not re.match('[0-9a-f]{2}(:[0-9a-f]{2}){5}$', value.lower()): return False
-		return True
 
+class InterfaceName(validation.ValidatedType):
+	__slots__ = ()
 
-class DeviceID(validation.ValidatedType):
 	@staticmethod
 	def validate(value):
 		if not isinstance(value, str): return False
@@ -38,6 +27,8 @@ class DeviceID(validation.ValidatedType):
 
 
 class InterfaceID(validation.ValidatedType):
+	__slots__ = ()
+
 	@staticmethod
 	def validate(value):
 		if not isinstance(value, int): return False
@@ -45,40 +36,76 @@ class InterfaceID(validation.ValidatedType):
 		return True
 
 
-class TransactionID(validation.ValidatedType):
+class Ipv6PrefixLength(validation.ValidatedType):
+	__slots__ = ()
+
 	@staticmethod
 	def validate(value):
 		if not isinstance(value, int): return False
-		if value < UINT24_MIN or value > UINT24_MAX: return False
+		if value < IPV6_PREFIX_LENGTH_MIN or value > IPV6_PREFIX_LENGTH_MAX: return False
 		return True
 
 
-class Ipv6Address(validation.ValidatedType):
-	@staticmethod
-	def validate(value):
-		if not isinstance(value, str): return False
-		return True
+class Duid(object):
+	# DUID in its binary representation. Textual DUIDs are validated once when parsed, binary ones
+	# taken from received messages are trusted. DUIDs compare equal to their binary representation,
+	# so they can be used to look up dicts which are keyed by bytes.
+	__slots__ = ('packed', '_hash')
 
+	def __init__(self, value):
+		if isinstance(value, Duid):
+			value = value.packed
+		elif isinstance(value, str):
+			if not re.match('[0-9a-f]{2}(:?[0-9a-f]{2})*$', value.lower()):
+				raise ValueError("Invalid value provided for type %s" % self.__class__.__name__)
+			value = bytes.fromhex(value.replace(':', ''))
+			if len(value) < DUID_LENGTH_MIN or len(value) > DUID_LENGTH_MAX:
+				raise ValueError("Invalid value provided for type %s" % self.__class__.__name__)
+		elif not isinstance(value, bytes):
+			raise ValueError("Invalid value provided for type %s" % self.__class__.__name__)
 
-class Ipv6PrefixLength(validation.ValidatedType):
-	@staticmethod
-	def validate(value):
-		if not isinstance(value, int): return False
-		if value < IPV6_PREFIX_LENGTH_MIN or value > IPV6_PREFIX_LENGTH_MAX: return False
-		return True
+		self.packed = value
+		self._hash = hash(value)
+
+	def __str__(self):
+		return ':'.join(['%02x' % byte for byte in self.packed])
+
+	def __repr__(self):
+		return "%s(%r)" % (self.__class__.__name__, str(self))
+
+	def __eq__(self, other):
+		if isinstance(other, Duid):
+			return self.packed == other.packed
+		return self.packed == other
+
+	def __hash__(self):
+		return self._hash
+
+
+class MacAddress(object):
+	# 48-bit mac address, kept as integer for comparisons and packed for building frames
+	__slots__ = ('value', 'packed')
+
+	def __init__(self, value):
+		if isinstance(value, str):
+			if not re.match('[0-9a-f]{2}(:[0-9a-f]{2}){5}$', value.lower()):
+				raise ValueError("Invalid value provided for type %s" % self.__class__.__name__)
+			value = bytes.fromhex(value.replace(':', ''))
+		elif not isinstance(value, bytes) or len(value) != 6:
+			raise ValueError("Invalid value provided for type %s" % self.__class__.__name__)
+
+		self.packed = value
+		self.value = int.from_bytes(value, 'big')
 
+	def __str__(self):
+		return ':'.join(['%02x' % byte for byte in self.packed])
 
-class DhcpTimeout(object):
-	def __init__(self, timeout):
-		self._timeout = int(timeout)
-		self._delta = timedelta(seconds=int(timeout))
+	def __repr__(self):
+		return "%s(%r)" % (self.__class__.__name__, str(self))
 
-	def __int__(self):
-		return self._timeout
+	def __eq__(self, other):
+		return isinstance(other, MacAddress) and self.value == other.value
 
-	def as_delta(self):
-		return self._delta
+	def __hash__(self):
+		return self.value
 
-	def has_occured(self, offset):
-		now = datetime.now()
-		return now > offset + self._delta
\ No newline at end of file
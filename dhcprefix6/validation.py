@@ -77,9 +77,12 @@ def returns(*accepted_return_type_tuple):
 
 
 class ValidatedType(object):
-	_value = None
+	# Values are validated once when constructed and must not be changed afterwards
+	__slots__ = ('value',)
 
 	def __init__(self, value):
+		if not self.validate(value):
+			raise ValueError("Invalid value provided for type %s" % self.__class__.__name__)
 		self.value = value
 
 	def __str__(self):
@@ -92,18 +95,11 @@ class ValidatedType(object):
 		return "%s(%r)" % (self.__class__.__name__, self.value)
 
 	def __eq__(self, other):
-		return self.value == other.value
+		return isinstance(other, ValidatedType) and self.value == other.value
+
+	def __hash__(self):
+		return hash(self.value)
 
 	@staticmethod
 	def validate(value):
 		return True
-
-	@property
-	def value(self):
-		return self._value
-
-	@value.setter
-	def value(self, value):
-		if not self.validate(value):
-			raise ValueError("Invalid value provided for type %s" % self.__class__.__name__)
-		self._value = value
\ No newline at end of file
@@ -0,0 +1,279 @@
+import ipaddress
+import struct
+import dhcprefix6.profiling as profiling
+
+# Ethernet and IPv6 constants
+ETHERTYPE_IPV6 = 0x86dd
+ETHERTYPE_VLAN = 0x8100
+IPPROTO_UDP = 17
+IPV6_EXTENSION_HEADERS = [0, 43, 60]
+DHCP6_PORTS = [546, 547]
+
+# DHCPv6 message types
+SOLICIT = 1
+ADVERTISE = 2
+REQUEST = 3
+RENEW = 5
+REBIND = 6
+REPLY = 7
+
+MESSAGE_TYPES = {
+	SOLICIT: 'SOLICIT',
+	ADVERTISE: 'ADVERTISE',
+	REQUEST: 'REQUEST',
+	RENEW: 'RENEW',
+	REBIND: 'REBIND',
+	REPLY: 'REPLY'
+}
+
+# DHCPv6 option codes
+OPTION_CLIENTID = 1
+OPTION_SERVERID = 2
+OPTION_ELAPSED_TIME = 8
+OPTION_STATUS_CODE = 13
+OPTION_IA_PD = 25
+OPTION_IAPREFIX = 26
+
+STATUS_SUCCESS = 0
+
+# Addresses used for messages sent by clients
+ALL_DHCP_MAC = b'\x33\x33\x00\x01\x00\x02'
+ALL_DHCP_ADDRESS = ipaddress.IPv6Address('ff02::1:2').packed
+CLIENT_PORT = 546
+SERVER_PORT = 547
+HOP_LIMIT = 64
+
+
+class IaPrefix(object):
+	__slots__ = ('address', 'length', 'preferred_lifetime', 'valid_lifetime', 'status_code')
+
+	def __init__(self, address, length, preferred_lifetime, valid_lifetime):
+		(self.address, self.length) = address, length
+		(self.preferred_lifetime, self.valid_lifetime) = preferred_lifetime, valid_lifetime
+		self.status_code = None
+
+	def __str__(self):
+		return "%s/%d" % (ipaddress.IPv6Address(self.address), self.length)
+
+
+class Message(object):
+	__slots__ = ('dst_mac', 'msg_type', 'transaction_id', 'client_duid', 'server_duid', 'iaid', 't1', 't2',
+		'prefixes', 'status_code', 'status_message')
+
+	def __init__(self, dst_mac, msg_type, transaction_id):
+		(self.dst_mac, self.msg_type, self.transaction_id) = dst_mac, msg_type, transaction_id
+		self.client_duid = None
+		self.server_duid = None
+		self.iaid = None
+		self.t1 = None
+		self.t2 = None
+		self.prefixes = []
+		self.status_code = None
+		self.status_message = None
+
+	def has_ia_pd(self):
+		return self.iaid is not None
+
+
+@profiling.stage('parse')
+def parse(frame):
+	# Walk Ethernet, IPv6 and UDP headers and return a parsed DHCPv6 message or None if the
+	# frame does not contain a DHCPv6 client/server message.
+	try:
+		return _parse(frame)
+	except (struct.error, IndexError, ValueError):
+		return None
+
+
+def peek(frame):
+	# Return destination mac, message type, transaction id and client DUID of a DHCPv6 message
+	# without decoding any other option, or None if the frame does not contain a DHCPv6 message
+	try:
+		result = _parse_headers(frame)
+		if result is None:
+			return None
+
+		(dst_mac, header, offset, end) = result
+		client_duid = None
+		for (code, start, length) in _walk_options(frame, offset, end):
+			if code == OPTION_CLIENTID:
+				client_duid = bytes(frame[start:start + length])
+				break
+		return dst_mac, header >> 24, header & 0xffffff, client_duid
+	except (struct.error, IndexError, ValueError):
+		return None
+
+
+def _parse(frame):
+	result = _parse_headers(frame)
+	if result is None:
+		return None
+
+	(dst_mac, header, offset, end) = result
+	message = Message(dst_mac, header >> 24, header & 0xffffff)
+	_parse_options(message, frame, offset, end)
+	return message
+
+
+def _parse_headers(frame):
+	# Ethernet header, optionally with a single 802.1Q tag
+	dst_mac = bytes(frame[0:6])
+	(ethertype,) = struct.unpack_from('!H', frame, 12)
+	offset = 14
+	if ethertype == ETHERTYPE_VLAN:
+		(ethertype,) = struct.unpack_from('!H', frame, 16)
+		offset = 18
+	if ethertype != ETHERTYPE_IPV6:
+		return None
+
+	# IPv6 header and extension headers
+	(payload_length, next_header) = struct.unpack_from('!HB', frame, offset + 4)
+	offset += 40
+	while next_header in IPV6_EXTENSION_HEADERS:
+		(next_header, header_length) = struct.unpack_from('!BB', frame, offset)
+		offset += (header_length + 1) * 8
+	if next_header != IPPROTO_UDP:
+		return None
+
+	# UDP header
+	(sport, dport, udp_length) = struct.unpack_from('!HHH', frame, offset)
+	if sport not in DHCP6_PORTS or dport not in DHCP6_PORTS:
+		return None
+	end = min(offset + udp_length, len(frame))
+	offset += 8
+
+	# DHCPv6 header
+	(header,) = struct.unpack_from('!I', frame, offset)
+	if header >> 24 < SOLICIT or header >> 24 > REPLY:
+		return None
+
+	return dst_mac, header, offset + 4, end
+
+
+def _parse_options(message, frame, offset, end):
+	for (code, start, length) in _walk_options(frame, offset, end):
+		if code == OPTION_CLIENTID:
+			message.client_duid = bytes(frame[start:start + length])
+		elif code == OPTION_SERVERID:
+			message.server_duid = bytes(frame[start:start + length])
+		elif code == OPTION_STATUS_CODE:
+			(message.status_code, message.status_message) = _parse_status(frame, start, length)
+		elif code == OPTION_IA_PD and message.iaid is None:
+			(message.iaid, message.t1, message.t2) = struct.unpack_from('!III', frame, start)
+			_parse_ia_pd(message, frame, start + 12, start + length)
+
+
+def _parse_ia_pd(message, frame, offset, end):
+	for (code, start, length) in _walk_options(frame, offset, end):
+		if code == OPTION_IAPREFIX:
+			(preferred, valid, plen) = struct.unpack_from('!IIB', frame, start)
+			prefix = IaPrefix(bytes(frame[start + 9:start + 25]), plen, preferred, valid)
+			for (sub_code, sub_start, sub_length) in _walk_options(frame, start + 25, start + length):
+				if sub_code == OPTION_STATUS_CODE:
+					prefix.status_code = _parse_status(frame, sub_start, sub_length)[0]
+			message.prefixes.append(prefix)
+		elif code == OPTION_STATUS_CODE and message.status_code is None:
+			(message.status_code, message.status_message) = _parse_status(frame, start, length)
+
+
+def _parse_status(frame, start, length):
+	(code,) = struct.unpack_from('!H', frame, start)
+	return code, bytes(frame[start + 2:start + length]).decode('utf-8', 'replace')
+
+
+def _walk_options(frame, offset, end):
+	while offset + 4 <= end:
+		(code, length) = struct.unpack_from('!HH', frame, offset)
+		if offset + 4 + length > end:
+			raise ValueError('Truncated DHCPv6 option')
+		yield code, offset + 4, length
+		offset += 4 + length
+
+
+class PacketTemplate(object):
+	# Pre-serialized client message where only the transaction id, elapsed time, T1/T2 and
+	# the UDP checksum are patched in when rendering. The checksum is derived from the
+	# one's complement sum over everything except these fields, which is computed once.
+	ETHER_LENGTH = 14
+	IPV6_LENGTH = 40
+	UDP_LENGTH = 8
+	CHECKSUM_OFFSET = ETHER_LENGTH + IPV6_LENGTH + 6
+	HEADER_OFFSET = ETHER_LENGTH + IPV6_LENGTH + UDP_LENGTH
+
+	__slots__ = ('_frame', '_msg_type', '_base_sum', '_elapsed_offset', '_timers_offset')
+
+	def __init__(self, msg_type, src_mac, src_ip, options, elapsed_offset, timers_offset):
+		udp_length = self.UDP_LENGTH + 4 + len(options)
+		frame = ALL_DHCP_MAC + src_mac + struct.pack('!H', ETHERTYPE_IPV6)
+		frame += struct.pack('!IHBB', 6 << 28, udp_length, IPPROTO_UDP, HOP_LIMIT) + src_ip + ALL_DHCP_ADDRESS
+		frame += struct.pack('!HHHH', CLIENT_PORT, SERVER_PORT, udp_length, 0)
+		frame += struct.pack('!I', 0) + options
+
+		self._frame = frame
+		self._msg_type = msg_type
+		self._elapsed_offset = self.HEADER_OFFSET + 4 + elapsed_offset
+		self._timers_offset = None if timers_offset is None else self.HEADER_OFFSET + 4 + timers_offset
+
+		# The patched fields are zero within the template and do not contribute to the base sum
+		pseudo_header = src_ip + ALL_DHCP_ADDRESS + struct.pack('!IxxxB', udp_length, IPPROTO_UDP)
+		self._base_sum = _sum_words(pseudo_header, False) + _sum_words(frame[self.HEADER_OFFSET - 8:], False)
+
+	def render(self, transaction_id, elapsed_time=0, t1=0, t2=0):
+		frame = bytearray(self._frame)
+		header = struct.pack('!I', (self._msg_type << 24) | (transaction_id & 0xffffff))
+		elapsed = struct.pack('!H', min(int(elapsed_time), 0xffff))
+		frame[self.HEADER_OFFSET:self.HEADER_OFFSET + 4] = header
+		frame[self._elapsed_offset:self._elapsed_offset + 2] = elapsed
+
+		total = self._base_sum + _sum_words(header, False) + _sum_words(elapsed, self._elapsed_offset % 2)
+		if self._timers_offset is not None:
+			timers = struct.pack('!II', int(t1), int(t2))
+			frame[self._timers_offset:self._timers_offset + 8] = timers
+			total += _sum_words(timers, self._timers_offset % 2)
+
+		while total >> 16:
+			total = (total & 0xffff) + (total >> 16)
+		struct.pack_into('!H', frame, self.CHECKSUM_OFFSET, (~total & 0xffff) or 0xffff)
+		return bytes(frame)
+
+
+def build_template(msg_type, src_mac, src_ip, client_duid, server_duid, iaid, prefixes):
+	# Options are serialized in the same order as they were built with scapy before:
+	# client id, server id (if any), IA_PD with IA prefixes and elapsed time
+	options = _option(OPTION_CLIENTID, client_duid)
+	if server_duid is not None:
+		options += _option(OPTION_SERVERID, server_duid)
+
+	timers_offset = len(options) + 8
+	ia_prefixes = b''.join([_option(OPTION_IAPREFIX, struct.pack('!IIB', 0, 0, length) + address)
+		for (address, length) in prefixes])
+	options += _option(OPTION_IA_PD, struct.pack('!III', iaid, 0, 0) + ia_prefixes)
+
+	elapsed_offset = len(options) + 4
+	options += _option(OPTION_ELAPSED_TIME, struct.pack('!H', 0))
+
+	return PacketTemplate(msg_type, src_mac, src_ip, options, elapsed_offset, timers_offset)
+
+
+def _option(code, data):
+	return struct.pack('!HH', code, len(data)) + data
+
+
+def _sum_words(data, odd):
+	# One's complement sum of 16-bit words, data starting at an odd offset is shifted by one byte
+	data = bytes(data)
+	if odd:
+		data = b'\x00' + data
+	if len(data) % 2:
+		data += b'\x00'
+	return sum(struct.unpack('!%dH' % (len(data) // 2), data))
+
+
+def format_duid(duid):
+	return ':'.join(['%02x' % byte for byte in bytearray(duid)])
+
+
+def dump(frame):
+	# Scapy is only required for human-readable debug dumps
+	from scapy.layers.l2 import Ether
+	return Ether(bytes(frame)).show2(dump=True)
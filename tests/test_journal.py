@@ -0,0 +1,79 @@
+import logging
+import os
+import shutil
+import tempfile
+import unittest
+import dhcprefix6.journal as journal
+
+
+class LeaseJournalTest(unittest.TestCase):
+	def setUp(self):
+		self._directory = tempfile.mkdtemp()
+		self._path = os.path.join(self._directory, 'leases.journal')
+		self._logger = logging.getLogger('test')
+
+	def tearDown(self):
+		shutil.rmtree(self._directory)
+
+	def _lease(self, index, t1=1800, t2=2880, expire=4320):
+		return journal.Lease(
+			client_duid=b'\x00\x03\x00\x01\x02\x00\x00\x00' + index.to_bytes(2, 'big'),
+			iaid=25000 + index,
+			prefix_hash=index,
+			server_duid=b'\x00\x03\x00\x01\x00\x01\x02\x03\x04\x05',
+			t1=t1,
+			t2=t2,
+			expire=expire,
+			confirmed_at=1700000000.5
+		)
+
+	def _reload(self, lease_journal):
+		lease_journal.close()
+		reloaded = journal.LeaseJournal(self._path, self._logger)
+		reloaded.load()
+		return reloaded
+
+	def test_round_trip(self):
+		lease_journal = journal.LeaseJournal(self._path, self._logger)
+		lease_journal.load()
+		lease_journal.record_lease(self._lease(1))
+		lease_journal.record_lease(self._lease(2))
+		lease_journal.record_release(self._lease(2).client_duid, self._lease(2).iaid)
+
+		reloaded = self._reload(lease_journal)
+		lease = reloaded.get(self._lease(1).client_duid, self._lease(1).iaid)
+		self.assertEqual((lease.t1, lease.t2, lease.expire, lease.confirmed_at), (1800, 2880, 4320, 1700000000.5))
+		self.assertEqual(lease.server_duid, self._lease(1).server_duid)
+		self.assertIsNone(reloaded.get(self._lease(2).client_duid, self._lease(2).iaid))
+		reloaded.close()
+
+	def test_infinite_lease(self):
+		# Infinite T2 multiplied by the expire time multiplier exceeds 32 bit and is stored as infinity
+		lease_journal = journal.LeaseJournal(self._path, self._logger)
+		lease_journal.load()
+		lease_journal.record_lease(self._lease(1, journal.INFINITY, journal.INFINITY, journal.INFINITY * 1.5))
+
+		reloaded = self._reload(lease_journal)
+		lease = reloaded.get(self._lease(1).client_duid, self._lease(1).iaid)
+		self.assertEqual((lease.t1, lease.t2, lease.expire), (journal.INFINITY,) * 3)
+		reloaded.close()
+
+	def test_compaction(self):
+		lease_journal = journal.LeaseJournal(self._path, self._logger)
+		lease_journal.COMPACT_MIN = 4
+		lease_journal.load()
+		lease_journal.record_lease(self._lease(0, journal.INFINITY, journal.INFINITY, journal.INFINITY * 1.5))
+		for index in range(1, 40):
+			lease_journal.record_lease(self._lease(index % 3 + 1))
+
+		# Compaction keeps the journal small and writes the infinite lease again
+		self.assertLess(os.path.getsize(self._path), 40 * journal.LeaseJournal.RECORD_SIZE)
+		reloaded = self._reload(lease_journal)
+		self.assertEqual(reloaded.get(self._lease(0).client_duid, self._lease(0).iaid).expire, journal.INFINITY)
+		for index in range(1, 4):
+			self.assertIsNotNone(reloaded.get(self._lease(index).client_duid, self._lease(index).iaid))
+		reloaded.close()
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,132 @@
+import random
+import unittest
+from unittest import mock
+import dhcprefix6.clock as clocks
+import dhcprefix6.network as network
+import dhcprefix6.retransmission as retransmission
+import dhcprefix6.wire as wire
+
+JITTER = retransmission.JITTER
+
+
+class ExchangeTest(unittest.TestCase):
+	def setUp(self):
+		random.seed(8415)
+		self._clock = clocks.ManualClock(monotonic=1000.0)
+
+	def _transmit(self, exchange):
+		# Transmit and advance the clock to the next retransmission
+		now = self._clock.monotonic()
+		exchange.transmitted(now)
+		self._clock.advance(exchange.next_at - now)
+		return exchange.timeout
+
+	def test_solicit_initial_timeout(self):
+		# The first SOLICIT timeout is only randomized upwards (RFC 8415, section 18.2.1)
+		parameters = retransmission.PARAMETERS[wire.SOLICIT]
+		for _ in range(100):
+			exchange = retransmission.Exchange(wire.SOLICIT, self._clock.monotonic())
+			self.assertGreater(exchange.timeout, parameters.initial_timeout)
+			self.assertLessEqual(exchange.timeout, parameters.initial_timeout * (1 + JITTER))
+
+	def test_backoff(self):
+		parameters = retransmission.PARAMETERS[wire.RENEW]
+		exchange = retransmission.Exchange(wire.RENEW, self._clock.monotonic())
+		self.assertGreaterEqual(exchange.timeout, parameters.initial_timeout * (1 - JITTER))
+		self.assertLessEqual(exchange.timeout, parameters.initial_timeout * (1 + JITTER))
+
+		previous = self._transmit(exchange)
+		for _ in range(20):
+			timeout = self._transmit(exchange)
+			if timeout < parameters.max_timeout * (1 - JITTER):
+				# RT = 2 * RTprev + RAND * RTprev
+				self.assertGreaterEqual(timeout, previous * (2 - JITTER))
+				self.assertLessEqual(timeout, previous * (2 + JITTER))
+			else:
+				# RT = MRT + RAND * MRT
+				self.assertLessEqual(timeout, parameters.max_timeout * (1 + JITTER))
+			previous = timeout
+
+		self.assertGreaterEqual(previous, parameters.max_timeout * (1 - JITTER))
+		self.assertEqual(exchange.count, 21)
+		self.assertFalse(exchange.is_exhausted(self._clock.monotonic()))
+
+	def test_max_timeout(self):
+		# The configured retry time caps the maximum retransmission timeout of RFC 8415
+		exchange = retransmission.Exchange(wire.SOLICIT, self._clock.monotonic(), max_timeout=60)
+		timeouts = [self._transmit(exchange) for _ in range(20)]
+		self.assertLessEqual(max(timeouts), 60 * (1 + JITTER))
+		self.assertGreaterEqual(timeouts[-1], 60 * (1 - JITTER))
+
+	def test_max_count(self):
+		parameters = retransmission.PARAMETERS[wire.REQUEST]
+		exchange = retransmission.Exchange(wire.REQUEST, self._clock.monotonic())
+		for _ in range(parameters.max_count - 1):
+			self._transmit(exchange)
+			self.assertFalse(exchange.is_exhausted(self._clock.monotonic()))
+		self._transmit(exchange)
+		self.assertTrue(exchange.is_exhausted(self._clock.monotonic()))
+
+	def test_max_duration(self):
+		# Retransmissions are scheduled no later than the deadline, where the exchange is exhausted
+		deadline = self._clock.monotonic() + 45
+		exchange = retransmission.Exchange(wire.REBIND, self._clock.monotonic(), deadline=deadline)
+		while not exchange.is_exhausted(self._clock.monotonic()):
+			self._transmit(exchange)
+			self.assertLessEqual(exchange.next_at, deadline)
+		self.assertEqual(self._clock.monotonic(), deadline)
+		self.assertEqual(exchange.count, 3)
+
+	def test_elapsed_time(self):
+		exchange = retransmission.Exchange(wire.SOLICIT, self._clock.monotonic())
+		self.assertEqual(exchange.elapsed_time(self._clock.monotonic()), 0)
+
+		self._clock.advance(1.5)
+		exchange.transmitted(self._clock.monotonic())
+		self.assertEqual(exchange.elapsed_time(self._clock.monotonic()), 150)
+
+		self._clock.advance(1000)
+		self.assertEqual(exchange.elapsed_time(self._clock.monotonic()), 0xffff)
+
+
+class TokenBucketTest(unittest.TestCase):
+	def setUp(self):
+		self._clock = clocks.ManualClock()
+		self._patch = mock.patch.object(network.time, 'monotonic', self._clock.monotonic)
+		self._patch.start()
+
+	def tearDown(self):
+		self._patch.stop()
+
+	def test_burst(self):
+		bucket = network.TokenBucket(10, 5)
+		self.assertEqual([bucket.reserve() for _ in range(5)], [0] * 5)
+		self.assertEqual(bucket.deferred, 0)
+
+		# Further messages are spread out evenly at the configured rate
+		delays = [bucket.reserve() for _ in range(3)]
+		for (delay, expected) in zip(delays, [0.1, 0.2, 0.3]):
+			self.assertAlmostEqual(delay, expected)
+		self.assertEqual(bucket.deferred, 3)
+
+	def test_refill(self):
+		bucket = network.TokenBucket(10, 5)
+		for _ in range(5):
+			bucket.reserve()
+
+		self._clock.advance(0.25)
+		self.assertEqual(bucket.reserve(), 0)
+		self.assertEqual(bucket.reserve(), 0)
+		self.assertAlmostEqual(bucket.reserve(), 0.05)
+
+		# Idle time does not fill the bucket beyond its burst size
+		self._clock.advance(60)
+		self.assertEqual([bucket.reserve() for _ in range(5)], [0] * 5)
+		self.assertAlmostEqual(bucket.reserve(), 0.1)
+
+	def test_invalid_rate(self):
+		self.assertRaises(ValueError, network.TokenBucket, 0, 5)
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,73 @@
+import ipaddress
+import struct
+import unittest
+import dhcprefix6.wire as wire
+
+CLIENT_MAC = b'\x02\x00\x00\x00\x00\x01'
+CLIENT_IP = ipaddress.IPv6Address('fe80::1').packed
+CLIENT_DUID = b'\x00\x03\x00\x01' + CLIENT_MAC
+SERVER_DUID = b'\x00\x01\x00\x01\x00\x00\x00\x00\x02\x00\x00\x00\x00\xfe'
+PREFIXES = [
+	(ipaddress.IPv6Address('2001:db8:1::').packed, 56),
+	(ipaddress.IPv6Address('2001:db8:2::').packed, 48)
+]
+
+
+def udp_checksum(frame):
+	# Full recomputation over the pseudo header and the UDP datagram with a zero checksum field
+	datagram = bytearray(frame[54:])
+	datagram[6:8] = b'\x00\x00'
+	pseudo_header = bytes(frame[22:54]) + struct.pack('!IxxxB', len(datagram), wire.IPPROTO_UDP)
+	data = pseudo_header + bytes(datagram)
+	if len(data) % 2:
+		data += b'\x00'
+
+	total = sum(struct.unpack('!%dH' % (len(data) // 2), data))
+	while total >> 16:
+		total = (total & 0xffff) + (total >> 16)
+	return (~total & 0xffff) or 0xffff
+
+
+class PacketTemplateTest(unittest.TestCase):
+	def _assert_checksum(self, frame):
+		(checksum,) = struct.unpack_from('!H', frame, wire.PacketTemplate.CHECKSUM_OFFSET)
+		self.assertEqual(checksum, udp_checksum(frame))
+
+	def test_render(self):
+		template = wire.build_template(wire.REQUEST, CLIENT_MAC, CLIENT_IP, CLIENT_DUID, SERVER_DUID, 25000, PREFIXES)
+		frame = template.render(0xabcdef, elapsed_time=150, t1=1800, t2=2880)
+		message = wire.parse(frame)
+
+		self.assertEqual(message.msg_type, wire.REQUEST)
+		self.assertEqual(message.transaction_id, 0xabcdef)
+		self.assertEqual(message.client_duid, CLIENT_DUID)
+		self.assertEqual(message.server_duid, SERVER_DUID)
+		self.assertEqual((message.iaid, message.t1, message.t2), (25000, 1800, 2880))
+		self.assertEqual([str(prefix) for prefix in message.prefixes], ['2001:db8:1::/56', '2001:db8:2::/48'])
+		self._assert_checksum(frame)
+
+	def test_checksum(self):
+		# Odd-length DUIDs move the patched fields to odd offsets within the datagram
+		for client_duid in [CLIENT_DUID, CLIENT_DUID + b'\x00']:
+			for server_duid in [None, SERVER_DUID, SERVER_DUID + b'\x00']:
+				template = wire.build_template(wire.RENEW, CLIENT_MAC, CLIENT_IP, client_duid, server_duid, 25000,
+					PREFIXES[:1])
+				for (transaction_id, elapsed_time, t1, t2) in [
+						(0, 0, 0, 0), (0xffffff, 0xffff, 0xffffffff, 0xffffffff), (0x123456, 1234, 1800, 2880)]:
+					self._assert_checksum(template.render(transaction_id, elapsed_time, t1, t2))
+
+	def test_elapsed_time_clamped(self):
+		template = wire.build_template(wire.SOLICIT, CLIENT_MAC, CLIENT_IP, CLIENT_DUID, None, 25000, PREFIXES)
+		frame = template.render(1, elapsed_time=100000)
+		self._assert_checksum(frame)
+		self.assertEqual(frame[-2:], b'\xff\xff')
+
+	def test_render_keeps_template(self):
+		template = wire.build_template(wire.SOLICIT, CLIENT_MAC, CLIENT_IP, CLIENT_DUID, None, 25000, PREFIXES)
+		first = template.render(1, elapsed_time=10, t1=1, t2=2)
+		template.render(2, elapsed_time=20, t1=3, t2=4)
+		self.assertEqual(template.render(1, elapsed_time=10, t1=1, t2=2), first)
+
+
+if __name__ == '__main__':
+	unittest.main()
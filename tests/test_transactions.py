@@ -0,0 +1,55 @@
+import unittest
+import dhcprefix6.dhcp as dhcp
+
+CLIENT_DUID = b'\x00\x03\x00\x01\x02\x00\x00\x00\x00\x01'
+OTHER_DUID = b'\x00\x03\x00\x01\x02\x00\x00\x00\x00\x02'
+
+
+class TransactionTableTest(unittest.TestCase):
+	def setUp(self):
+		self._table = dhcp.TransactionTable()
+		self._viface = object()
+
+	def test_matched(self):
+		self._table.open(self._viface, 0x123456, CLIENT_DUID)
+
+		self.assertIs(self._table.match(0x123456, CLIENT_DUID), self._viface)
+		self.assertIs(self._table.match(0x123456, CLIENT_DUID), self._viface)
+		self.assertEqual(self._table.stats(), {'outstanding': 1, 'matched': 2, 'stale': 0, 'duplicate': 0})
+
+	def test_stale(self):
+		self._table.open(self._viface, 0x123456, CLIENT_DUID)
+
+		# Both the transaction id and the client DUID have to match
+		self.assertIsNone(self._table.match(0x123457, CLIENT_DUID))
+		self.assertIsNone(self._table.match(0x123456, OTHER_DUID))
+		self.assertEqual(self._table.stats(), {'outstanding': 1, 'matched': 0, 'stale': 2, 'duplicate': 0})
+
+	def test_duplicate(self):
+		self._table.open(self._viface, 0x123456, CLIENT_DUID)
+		self._table.close(self._viface)
+
+		self.assertIsNone(self._table.match(0x123456, CLIENT_DUID))
+		self.assertEqual(self._table.stats(), {'outstanding': 0, 'matched': 0, 'stale': 0, 'duplicate': 1})
+
+	def test_open_replaces_transaction(self):
+		self._table.open(self._viface, 0x123456, CLIENT_DUID)
+		self._table.open(self._viface, 0x654321, CLIENT_DUID)
+
+		self.assertIsNone(self._table.match(0x123456, CLIENT_DUID))
+		self.assertIs(self._table.match(0x654321, CLIENT_DUID), self._viface)
+		self.assertEqual(self._table.stats(), {'outstanding': 1, 'matched': 1, 'stale': 0, 'duplicate': 1})
+
+	def test_recent_bounded(self):
+		for transaction_id in range(dhcp.TransactionTable.RECENT_SIZE + 1):
+			self._table.open(self._viface, transaction_id, CLIENT_DUID)
+		self._table.close(self._viface)
+
+		# The oldest closed transaction has been forgotten
+		self.assertIsNone(self._table.match(0, CLIENT_DUID))
+		self.assertIsNone(self._table.match(1, CLIENT_DUID))
+		self.assertEqual(self._table.stats(), {'outstanding': 0, 'matched': 0, 'stale': 1, 'duplicate': 1})
+
+
+if __name__ == '__main__':
+	unittest.main()
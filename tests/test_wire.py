@@ -0,0 +1,114 @@
+import ipaddress
+import struct
+import unittest
+import dhcprefix6.wire as wire
+
+CLIENT_MAC = b'\x02\x00\x00\x00\x00\x01'
+SERVER_MAC = b'\x02\x00\x00\x00\x00\xfe'
+CLIENT_IP = ipaddress.IPv6Address('fe80::1').packed
+SERVER_IP = ipaddress.IPv6Address('fe80::fe').packed
+CLIENT_DUID = b'\x00\x03\x00\x01' + CLIENT_MAC
+SERVER_DUID = b'\x00\x03\x00\x01' + SERVER_MAC
+PREFIX = ipaddress.IPv6Address('2001:db8:1::').packed
+
+
+def option(code, data):
+	return struct.pack('!HH', code, len(data)) + data
+
+
+def status(code, message):
+	return option(wire.OPTION_STATUS_CODE, struct.pack('!H', code) + message.encode('utf-8'))
+
+
+def reply_frame(options, msg_type=wire.REPLY, transaction_id=0x123456, vlan=None):
+	payload = struct.pack('!I', (msg_type << 24) | transaction_id) + options
+	udp_length = 8 + len(payload)
+	frame = CLIENT_MAC + SERVER_MAC
+	if vlan is not None:
+		frame += struct.pack('!HH', wire.ETHERTYPE_VLAN, vlan)
+	frame += struct.pack('!H', wire.ETHERTYPE_IPV6)
+	frame += struct.pack('!IHBB', 6 << 28, udp_length, wire.IPPROTO_UDP, wire.HOP_LIMIT) + SERVER_IP + CLIENT_IP
+	frame += struct.pack('!HHHH', wire.SERVER_PORT, wire.CLIENT_PORT, udp_length, 0)
+	return frame + payload
+
+
+def ia_pd(iaid, t1, t2, *sub_options):
+	return option(wire.OPTION_IA_PD, struct.pack('!III', iaid, t1, t2) + b''.join(sub_options))
+
+
+def ia_prefix(address, length, preferred, valid, *sub_options):
+	data = struct.pack('!IIB', preferred, valid, length) + address + b''.join(sub_options)
+	return option(wire.OPTION_IAPREFIX, data)
+
+
+class ParseTest(unittest.TestCase):
+	def _options(self, *extra):
+		options = option(wire.OPTION_CLIENTID, CLIENT_DUID) + option(wire.OPTION_SERVERID, SERVER_DUID)
+		return options + b''.join(extra)
+
+	def test_reply(self):
+		frame = reply_frame(self._options(ia_pd(25000, 1800, 2880, ia_prefix(PREFIX, 56, 3600, 7200))))
+		message = wire.parse(frame)
+
+		self.assertEqual(message.dst_mac, CLIENT_MAC)
+		self.assertEqual(message.msg_type, wire.REPLY)
+		self.assertEqual(message.transaction_id, 0x123456)
+		self.assertEqual(message.client_duid, CLIENT_DUID)
+		self.assertEqual(message.server_duid, SERVER_DUID)
+		self.assertEqual((message.iaid, message.t1, message.t2), (25000, 1800, 2880))
+		self.assertEqual(len(message.prefixes), 1)
+		self.assertEqual(str(message.prefixes[0]), '2001:db8:1::/56')
+		self.assertEqual((message.prefixes[0].preferred_lifetime, message.prefixes[0].valid_lifetime), (3600, 7200))
+		self.assertIsNone(message.status_code)
+
+	def test_vlan_tagged(self):
+		frame = reply_frame(self._options(ia_pd(25000, 1800, 2880, ia_prefix(PREFIX, 56, 3600, 7200))), vlan=42)
+		message = wire.parse(frame)
+
+		self.assertEqual(message.transaction_id, 0x123456)
+		self.assertEqual(message.client_duid, CLIENT_DUID)
+		self.assertEqual(str(message.prefixes[0]), '2001:db8:1::/56')
+		self.assertEqual(wire.peek(frame), (CLIENT_MAC, wire.REPLY, 0x123456, CLIENT_DUID))
+
+	def test_status_codes(self):
+		frame = reply_frame(self._options(
+			status(wire.STATUS_SUCCESS, 'ok'),
+			ia_pd(25000, 0, 0, status(6, 'no prefix available'), ia_prefix(PREFIX, 56, 0, 0, status(3, 'not on link')))
+		))
+		message = wire.parse(frame)
+
+		# The top-level status code takes precedence over the one within the IA_PD
+		self.assertEqual((message.status_code, message.status_message), (wire.STATUS_SUCCESS, 'ok'))
+		self.assertEqual(message.prefixes[0].status_code, 3)
+
+		frame = reply_frame(self._options(ia_pd(25000, 0, 0, status(6, 'no prefix available'))))
+		message = wire.parse(frame)
+		self.assertEqual((message.status_code, message.status_message), (6, 'no prefix available'))
+		self.assertEqual(message.prefixes, [])
+
+	def test_truncated_option(self):
+		options = self._options(ia_pd(25000, 1800, 2880, ia_prefix(PREFIX, 56, 3600, 7200)))
+		self.assertIsNone(wire.parse(reply_frame(options[:-4])))
+
+		# Options which run past the end of the UDP datagram are truncated as well
+		frame = reply_frame(option(wire.OPTION_CLIENTID, CLIENT_DUID))
+		self.assertIsNone(wire.peek(frame[:-2]))
+		self.assertIsNone(wire.parse(frame[:-2]))
+
+	def test_truncated_headers(self):
+		frame = reply_frame(self._options())
+		for length in [0, 13, 20, 60, 64]:
+			self.assertIsNone(wire.peek(frame[:length]))
+			self.assertIsNone(wire.parse(frame[:length]))
+
+	def test_ignores_other_traffic(self):
+		frame = bytearray(reply_frame(self._options()))
+		frame[56:58] = struct.pack('!H', 53)
+		self.assertIsNone(wire.parse(frame))
+
+		# Relay messages are not handled
+		self.assertIsNone(wire.parse(reply_frame(self._options(), msg_type=12)))
+
+
+if __name__ == '__main__':
+	unittest.main()